@@ -1,9 +1,12 @@
 import subprocess
-import time
 import threading
-import subprocess
 import logging
 
+import bulk_load
+import pgbench_progress
+import scheduler
+import workload
+
 # ログの設定
 logging.basicConfig(
     level=logging.INFO,
@@ -16,7 +19,8 @@ user = "seinoyu"
 database = "postgres"
 
 pgbench_command = "/home/seinoyu/pgsql/master/bin/pgbench"
-psql_command = "/home/seinoyu/pgsql/master/bin/psql"
+# 区間毎のレイテンシのログ（--log --aggregate-interval）を出力する間隔（秒）。None なら出力しない
+pgbench_aggregate_interval = None
 
 custom_function = """
 CREATE OR REPLACE FUNCTION random_string(n integer) RETURNS text AS $$
@@ -26,112 +30,41 @@ CREATE OR REPLACE FUNCTION random_string(n integer) RETURNS text AS $$
     FROM generate_series(1, n);
 $$ LANGUAGE SQL IMMUTABLE;
 """
-custom_drop1 = "DROP TABLE IF EXISTS large_table1"
-custom_table1 = "CREATE TABLE large_table1 (id BIGSERIAL PRIMARY KEY, data TEXT)"
-custom_initial_data1 = "INSERT INTO large_table1 (data) SELECT random_string(200) FROM generate_series(1, 50000000);"
-custom_drop2 = "DROP TABLE IF EXISTS large_table2"
-custom_table2 = "CREATE TABLE large_table2 (id BIGSERIAL PRIMARY KEY, data TEXT)"
-custom_initial_data2 = "INSERT INTO large_table2 (data) SELECT random_string(200) FROM generate_series(1, 50000000);"
+# large_table1 / large_table2 の行数（bulk_load.py で COPY により投入する）
+custom_rows = 50000000
+
+# 定期実行するクエリ（scheduler.py のジョブ）
+custom_jobs = scheduler.DEFAULT_JOBS
+
+_driver = None
+
+def get_driver():
+    """
+    SQL を実行する接続プール（初回に作成する）
+    """
+    global _driver
+    if _driver is None:
+        _driver = workload.Driver(maxconn=scheduler.connections_needed(custom_jobs) + 1, user=user, dbname=database)
+    return _driver
 
 def init_pgbench():
     result = subprocess.run([pgbench_command, "-U", user, "-d", database, "-i", "-s", "1000"], capture_output=True, text=True)
     logout(result)
 
 def run_pgbench():
-    result = subprocess.run([pgbench_command, "-U", user, "-d", database, "-T", "90000", "-c", "100", "-P", "60", "-R", "1000","--progress-timestamp"], capture_output=True, text=True)
-    logout(result)
+    # 進捗行は 1 行ずつ ../data/pgbench_progress.csv に書き出す
+    command = [pgbench_command, "-U", user, "-d", database, "-T", "90000", "-c", "100", "-P", "60", "-R", "1000","--progress-timestamp"]
+    if pgbench_aggregate_interval:
+        command += pgbench_progress.aggregate_args(pgbench_aggregate_interval, "../data/pgbench_log")
+    pgbench_progress.run(command, "../data/pgbench_progress.csv")
 
 def init_custom_sql_per15min():
-    result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", custom_drop1], capture_output=True, text=True)
-    logout(result)
-    result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", custom_table1], capture_output=True, text=True)
-    logout(result)
-    result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", custom_function], capture_output=True, text=True)
-    logout(result)
-    result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", custom_initial_data1], capture_output=True, text=True)
-    logout(result)
+    get_driver().execute(custom_function)
+    bulk_load.load_table("large_table1", custom_rows, seed=0, user=user, dbname=database)
 
 def init_custom_sql_per1hour():
-    result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", custom_drop2], capture_output=True, text=True)
-    logout(result)
-    result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", custom_table2], capture_output=True, text=True)
-    logout(result)
-    result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", custom_function], capture_output=True, text=True)
-    logout(result)
-    result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", custom_initial_data2], capture_output=True, text=True)
-    logout(result)
-
-def wait_until_next_quarter():
-    """
-    次の15分区切り（00,15,30,45分）までの待ち時間を計算してsleepする。
-    """
-    now = datetime.datetime.now()
-    # 現在の分・秒から次の15分の境界を計算
-    minute = now.minute
-    # 次の15分区切りの分（例：現在12:07なら15、12:17なら30）
-    next_quarter_minute = ((minute // 15) + 1) * 15
-    if next_quarter_minute >= 60:
-        # 60分になったら次の時刻（00分）へ
-        next_time = now.replace(hour=now.hour, minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
-    else:
-        next_time = now.replace(minute=next_quarter_minute, second=0, microsecond=0)
-    wait_seconds = (next_time - now).total_seconds()
-    logging.info("Waiting %.2f seconds until next quarter (%s)", wait_seconds, next_time)
-    time.sleep(wait_seconds)
-
-def wait_until_next_hour():
-    """
-    次の時間（毎時0分）までの待ち時間を計算してsleepする。
-    """
-    now = datetime.datetime.now()
-    next_time = now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
-    wait_seconds = (next_time - now).total_seconds()
-    logging.info("Waiting %.2f seconds until next hour (%s)", wait_seconds, next_time)
-    time.sleep(wait_seconds)
-
-def run_custom_sql_per15min():
-    """
-    large_table1 に対してのクエリを、毎15分（00,15,30,45分）に合わせて実行する。
-    """
-    while True:
-        wait_until_next_quarter()
-        result = subprocess.run([psql_command, "-U", user, "-d", database, "-c",
-                                 "EXPLAIN ANALYZE SELECT * from large_table1"],
-                                capture_output=True, text=True)
-        logout(result)
-
-def run_custom_sql_per1hour():
-    """
-    large_table2 に対してのクエリを、毎時0分に合わせて実行する。
-    """
-    while True:
-        wait_until_next_hour()
-        result = subprocess.run([psql_command, "-U", user, "-d", database, "-c",
-                                 "EXPLAIN ANALYZE SELECT * from large_table2"],
-                                capture_output=True, text=True)
-        logout(result)
-
-def logout(result):
-    # 標準出力の内容をログに記録
-    if result.stdout:
-        logging.info("標準出力:\n%s", result.stdout)
-    # 標準エラーの内容があればログに記録
-    if result.stderr:
-        logging.error("標準エラー:\n%s", result.stderr)
-
-def run_custom_sql_per15min():
-    while True:
-        result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", "EXPLAIN ANALYZE SELECT * from large_table1"], capture_output=True, text=True)
-        logout(result)
-        time.sleep(15 * 60)  # Sleep for 15 minutes
-        # time.sleep(60)
-
-def run_custom_sql_per1hour():
-    while True:
-        result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", "EXPLAIN ANALYZE SELECT * from large_table2"], capture_output=True, text=True)
-        logout(result)
-        time.sleep(60 * 60)  # Sleep for 60 minutes
-        # time.sleep(3 * 60)
+    get_driver().execute(custom_function)
+    bulk_load.load_table("large_table2", custom_rows, seed=1, user=user, dbname=database)
 
 def logout(result):
     # 標準出力の内容をログに記録
@@ -149,18 +82,16 @@ def init():
 
 def bench():
     pgbench_thread = threading.Thread(target=run_pgbench)
-    # custom_sql_per15min_thread = threading.Thread(target=run_custom_sql_per15min)
-    # custom_sql_per1hour_thread = threading.Thread(target=run_custom_sql_per1hour)
+    # large_table1 は毎15分、large_table2 は毎時0分に実行する
+    custom_sql = scheduler.Scheduler(get_driver(), custom_jobs)
 
     pgbench_thread.start()
-    # custom_sql_per15min_thread.start()
-    # custom_sql_per1hour_thread.start()
+    custom_sql.start()
 
     pgbench_thread.join()
-    # custom_sql_per15min_thread.join()
-    # custom_sql_per1hour_thread.join()
+    custom_sql.stop()
+
+def _bench():
+    result = get_driver().explain("SELECT * from large_table1")
 
-def _bench()
-    result = subprocess.run([psql_command, "-U", user, "-d", database, "-c", "EXPLAIN ANALYZE SELECT * from large_table1"], capture_output=True, text=True)
-    
-    print(result)
\ No newline at end of file
+    print(result)
@@ -0,0 +1,202 @@
+"""
+解析パイプラインの各ステージの実行時間とピークメモリを合成トレースで計測する
+
+- synthetic_trace.py の生成器（zipf / sequential / periodic / pgbench）で data.txt と pg_class.csv を作り、
+  load（data.txt の読み込み）→ catalog（relname の結合）→ aggregate（1 分毎の集計）→
+  features（ブロック×時間の疎行列）→ simulate（clock-sweep の再生）を順に実行する
+- ステージ毎に新しいプロセス（spawn）で上流の結果を読み込んでから実行し、
+  実行時間・CPU 時間と、読み込み後の RSS, 実行中のピーク RSS を記録する
+  （前のステージのメモリが混ざらないように。ピークは /proc の VmHWM、なければ resource.getrusage）
+- 結果は JSON に保存し、--baseline で以前の結果と比較できる
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import resource
+import tempfile
+import time
+from datetime import datetime
+
+import block_log
+import clock_sweep
+import pipeline
+import synthetic_trace
+
+STAGES = ["load", "catalog", "aggregate", "features", "simulate"]
+
+# 各ステージの入力（上流のステージ）
+UPSTREAM = {
+    "load": None,
+    "catalog": "load",
+    "aggregate": "catalog",
+    "features": "catalog",
+    "simulate": "catalog",
+}
+
+# simulate で使う shared_buffers（128MB）
+SIMULATE_BUFFERS = 16384
+
+def run_stage(stage, workdir, upstream):
+    if stage == "load":
+        return pipeline.stage_parse([os.path.join(workdir, "data.txt")], {})
+    if stage == "catalog":
+        return pipeline.stage_catalog([os.path.join(workdir, "pg_class.csv")], {"parse": upstream})
+    if stage == "aggregate":
+        return pipeline.stage_aggregate([], {"catalog": upstream})
+    if stage == "features":
+        return pipeline.stage_features([], {"catalog": upstream})
+    if stage == "simulate":
+        keys = block_log.encode_block_key(upstream["RelFileNode"].to_numpy(), upstream["BlockNum"].to_numpy())
+        sim = clock_sweep.ClockSweep(SIMULATE_BUFFERS)
+        sim.replay(keys, upstream["RelFileNode"].to_numpy())
+        return {"hits": sim.hits, "misses": sim.misses}
+    raise ValueError(stage)
+
+def _proc_status_mb(field):
+    with open("/proc/self/status", encoding="ascii") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise OSError(field)
+
+def _rss_mb():
+    try:
+        return _proc_status_mb("VmRSS")
+    except OSError:
+        return _max_rss_mb()
+
+def _max_rss_mb():
+    """
+    ピーク RSS（MB）
+    ru_maxrss は exec をまたいで親プロセスの値を引き継ぐため、Linux では VmHWM を使う
+    """
+    try:
+        return _proc_status_mb("VmHWM")
+    except OSError:
+        # ru_maxrss は KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _reset_max_rss():
+    """
+    VmHWM を現在の RSS に戻す（Linux 4.0 以降）
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _stage_worker(stage, workdir, queue):
+    """
+    上流の結果を読み込んでからステージを実行し、計測結果を queue に返す（子プロセスで実行）
+    """
+    upstream = None
+    if UPSTREAM[stage] is not None:
+        with open(os.path.join(workdir, f"{UPSTREAM[stage]}.pkl"), "rb") as f:
+            upstream = pickle.load(f)
+    rss_before = _rss_mb()
+    _reset_max_rss()
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    output = run_stage(stage, workdir, upstream)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    peak = _max_rss_mb()
+
+    # 下流のステージのために保存する（計測には含めない）
+    if stage in UPSTREAM.values():
+        with open(os.path.join(workdir, f"{stage}.pkl"), "wb") as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+    queue.put({"wall_sec": wall, "cpu_sec": cpu, "rss_before_mb": rss_before, "peak_rss_mb": peak})
+
+def measure_stage(stage, workdir):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_stage_worker, args=(stage, workdir, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"{stage} failed ({proc.exitcode})")
+    return queue.get()
+
+def bench(generator, n, workdir, stages=STAGES, seed=0):
+    """
+    1 つの生成器・件数で全ステージを計測する
+    """
+    start = time.perf_counter()
+    synthetic_trace.write_data_txt(os.path.join(workdir, "data.txt"),
+                                   synthetic_trace.GENERATORS[generator](n, seed))
+    synthetic_trace.write_pg_class(os.path.join(workdir, "pg_class.csv"))
+    print(f"{generator} {n:,}: generated in {time.perf_counter() - start:.1f}s")
+
+    results = []
+    for stage in stages:
+        result = {"generator": generator, "events": n, "stage": stage, **measure_stage(stage, workdir)}
+        results.append(result)
+        print(f"  {stage:9} {result['wall_sec']:8.2f}s  cpu {result['cpu_sec']:8.2f}s  "
+              f"rss {result['rss_before_mb']:8.0f} -> {result['peak_rss_mb']:8.0f} MB")
+    return results
+
+def compare(results, baseline):
+    """
+    同じ組み合わせの以前の結果に対する実行時間とピーク RSS の比
+    """
+    key = lambda r: (r["generator"], r["events"], r["stage"])
+    previous = {key(r): r for r in baseline["results"]}
+    for r in results:
+        old = previous.get(key(r))
+        if old is None:
+            continue
+        print(f"{r['generator']:10} {r['events']:>11,} {r['stage']:9}: "
+              f"time {r['wall_sec'] / old['wall_sec']:.2f}x, peak rss {r['peak_rss_mb'] / old['peak_rss_mb']:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="解析パイプラインのステージ毎の実行時間とピークメモリを計測する")
+    parser.add_argument("--events", type=int, action="append", default=[],
+                        help="アクセス件数（複数指定可, 省略時は 1M, 10M, 100M）")
+    parser.add_argument("--generator", action="append", choices=sorted(synthetic_trace.GENERATORS), default=[])
+    parser.add_argument("--stage", action="append", choices=STAGES, default=[],
+                        help="計測するステージ（上流のステージも実行される）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="合成トレースと中間結果の置き場所（省略時は一時ディレクトリ）")
+    parser.add_argument("--baseline", default=None, help="比較する以前の結果の JSON")
+    parser.add_argument("--output", default="../data/bench_analysis.json")
+    args = parser.parse_args()
+
+    stages = STAGES
+    if args.stage:
+        # 指定されたステージとその上流だけを実行する
+        needed = set()
+        for stage in args.stage:
+            while stage is not None:
+                needed.add(stage)
+                stage = UPSTREAM[stage]
+        stages = [stage for stage in STAGES if stage in needed]
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for generator in args.generator or list(synthetic_trace.GENERATORS):
+            for n in args.events or [1_000_000, 10_000_000, 100_000_000]:
+                results += bench(generator, n, workdir, stages, args.seed)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+eBPF で出力したブロックアクセスログ（data.txt）のストリーミング読み込み
+
+  Timestamp: <ns> PID: <pid> RelFileNode: <relfilenode> BlockNum: <block>
+
+の形式の行を、正規表現を使わずに pd.read_csv (C エンジン) でチャンク毎に読み込み、
+型付きの NumPy 構造化配列として返す。メモリ使用量はチャンクサイズで抑えられる。
+read_block.py の出力（bpf_read_block / bpf_query_log の .csv と --format binary の .bin）も同じ DataFrame として読み込む。
+"""
+
+import glob
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 1 チャンクあたりの行数
+CHUNK_LINES = 1_000_000
+
+# 出力する構造化配列の型
+BLOCK_LOG_DTYPE = np.dtype([
+    ("Timestamp", np.int64),
+    ("PID", np.int64),
+    ("RelFileNode", np.int64),
+    ("BlockNum", np.int64),
+])
+
+# bpf_blockread.csv（1 アクセス 1 行）の型
+BLOCKREAD_DTYPE = np.dtype([
+    ("timestamp", np.int64),
+    ("relfilenode", np.int64),
+    ("blocknum", np.int64),
+])
+
+# read_block.py --format binary のレコード（read_block.BLOCK_RECORD / QUERY_RECORD と同じ並び, パディングなし）
+READ_BLOCK_DTYPE = np.dtype([
+    ("timestamp", "<i8"),       # Unix 時刻（マイクロ秒）
+    ("pid", "<u4"),
+    ("queryid", "<i8"),
+    ("rel_index", "<u2"),
+    ("relfilenode", "<u4"),
+    ("max_block", "<u4"),
+    ("min_block", "<u4"),
+])
+# クエリの開始時刻（Unix 時刻, マイクロ秒）, pid, queryid, 続くクエリ文字列のバイト数
+QUERY_HEADER = struct.Struct("<qIqH")
+# bpf_query_log.bin を読み込む単位（バイト）
+READ_BUFFER_SIZE = 1 << 20
+
+# 空白区切りにしたときの列（ラベル列と値列が交互に並ぶ）
+_TOKEN_NAMES = ["ts_label", "Timestamp", "pid_label", "PID",
+                "rel_label", "RelFileNode", "block_label", "BlockNum"]
+_VALUE_NAMES = list(BLOCK_LOG_DTYPE.names)
+
+def encode_block_key(relfilenode, blocknum):
+    """
+    (relfilenode, ブロック番号) を 1 つの int64 キーにまとめる
+    どちらも PostgreSQL 側では 32bit 符号なし整数
+    """
+    relfilenode = np.asarray(relfilenode, dtype=np.int64)
+    blocknum = np.asarray(blocknum, dtype=np.int64)
+    return (relfilenode << 32) | (blocknum & 0xFFFFFFFF)
+
+def decode_block_key(keys):
+    """
+    encode_block_key の逆変換。(relfilenode, ブロック番号) を返す
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    return keys >> 32, keys & 0xFFFFFFFF
+
+def iter_block_log(path, chunk_lines=CHUNK_LINES):
+    """
+    data.txt をチャンク毎に読み込み、BLOCK_LOG_DTYPE の構造化配列を yield する
+    形式に合わない行（BCC のメッセージ等）は読み飛ばす
+    """
+    reader = pd.read_csv(
+        path,
+        sep=r"\s+",
+        header=None,
+        names=_TOKEN_NAMES,
+        dtype={name: "category" for name in _TOKEN_NAMES if name.endswith("_label")},
+        chunksize=chunk_lines,
+        on_bad_lines="skip",
+        na_filter=False,
+        engine="c",
+    )
+    for chunk in reader:
+        chunk = chunk[chunk["ts_label"] == "Timestamp:"]
+        values = chunk[_VALUE_NAMES]
+
+        # 通常は int64 として読み込まれる。欠損や数値以外が混ざったチャンクだけ
+        # 該当行を除いてから変換する（float を経由すると ns のタイムスタンプが丸まるため）
+        if not all(values[name].dtype == np.int64 for name in _VALUE_NAMES):
+            ok = np.logical_and.reduce([values[name].astype(str).str.isdigit().to_numpy()
+                                        for name in _VALUE_NAMES])
+            values = values[ok].astype(np.int64)
+
+        out = np.empty(len(values), dtype=BLOCK_LOG_DTYPE)
+        for name in _VALUE_NAMES:
+            out[name] = values[name].to_numpy(dtype=np.int64)
+        yield out
+
+def read_block_log(path, chunk_lines=CHUNK_LINES):
+    """
+    data.txt 全体を読み込み、int64 列の DataFrame を返す
+    """
+    chunks = list(iter_block_log(path, chunk_lines))
+    if chunks:
+        arr = np.concatenate(chunks)
+    else:
+        arr = np.empty(0, dtype=BLOCK_LOG_DTYPE)
+    return pd.DataFrame(arr)
+
+def blockread_segments(data_dir="../data"):
+    """
+    bpf_blockread.csv のセグメント（ローテートされた .gz と現在のファイル）を
+    古い順に返す
+    """
+    base = os.path.join(data_dir, "bpf_blockread.csv")
+    rotated = glob.glob(base + ".*.gz")
+    # ファイル名のローテート時刻（bpf_blockread.csv.<unix time>.gz）で並べる
+    rotated.sort(key=lambda path: int(path[len(base) + 1:-len(".gz")]))
+    if os.path.exists(base):
+        rotated.append(base)
+    return rotated
+
+def iter_blockread(paths, chunk_lines=CHUNK_LINES):
+    """
+    bpf_blockread.csv のセグメントを順にチャンク毎に読み込み、
+    BLOCKREAD_DTYPE の構造化配列を yield する
+    """
+    for path in paths:
+        reader = pd.read_csv(path, dtype=np.int64, chunksize=chunk_lines)
+        for chunk in reader:
+            out = np.empty(len(chunk), dtype=BLOCKREAD_DTYPE)
+            for name in BLOCKREAD_DTYPE.names:
+                out[name] = chunk[name].to_numpy()
+            yield out
+
+def iter_read_block(path, chunk_lines=CHUNK_LINES):
+    """
+    read_block.py の出力（bpf_read_block.csv: クエリ毎のブロック範囲）を
+    チャンク毎に読み込み、timestamp を日時に変換した DataFrame を yield する
+    """
+    reader = pd.read_csv(
+        path,
+        dtype={"pid": np.int64, "queryid": np.int64, "rel_index": np.int64,
+               "relfilenode": np.int64, "max_block": np.int64, "min_block": np.int64},
+        chunksize=chunk_lines,
+    )
+    for chunk in reader:
+        chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], format="%Y-%m-%d %H:%M:%S")
+        yield chunk
+
+def _local_datetime(micros, unit="s"):
+    """
+    Unix 時刻（マイクロ秒）をローカル時刻のタイムゾーンなしの日時に変換する（CSV の datetime.now() と同じ表記）
+    unit に切り捨てる。UTC との差は 1 時間毎に求める（夏時間の切り替えに合わせるため）
+    """
+    micros = np.asarray(micros, dtype=np.int64)
+    hours, inverse = np.unique(micros // 3_600_000_000, return_inverse=True)
+    offsets = np.array([datetime.fromtimestamp(int(h) * 3600).astimezone().utcoffset().total_seconds()
+                        for h in hours], dtype=np.int64) * 1_000_000
+    local = (micros + offsets[inverse]).astype("datetime64[us]")
+    return pd.Series(local.astype(f"datetime64[{unit}]").astype("datetime64[us]"))
+
+def iter_read_block_binary(path, chunk_lines=CHUNK_LINES):
+    """
+    read_block.py --format binary の出力（bpf_read_block.bin）をチャンク毎に読み込み、
+    iter_read_block と同じ列・型の DataFrame を yield する
+    timestamp は CSV と同じく秒に切り捨てたローカル時刻にする
+    """
+    with open(path, "rb") as f:
+        while True:
+            records = np.fromfile(f, dtype=READ_BLOCK_DTYPE, count=chunk_lines)
+            if len(records) == 0:
+                break
+            chunk = pd.DataFrame({name: records[name].astype(np.int64) for name in READ_BLOCK_DTYPE.names})
+            chunk["timestamp"] = _local_datetime(records["timestamp"])
+            yield chunk
+
+def iter_query_log(path, chunk_lines=CHUNK_LINES):
+    """
+    read_block.py のクエリログ（bpf_query_log.csv: timestamp, pid, queryid, query）を
+    チャンク毎に読み込み、timestamp を日時に変換した DataFrame を yield する
+    """
+    reader = pd.read_csv(path, dtype={"pid": np.int64, "queryid": np.int64, "query": str},
+                         keep_default_na=False, chunksize=chunk_lines)
+    for chunk in reader:
+        chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], format="%Y-%m-%d %H:%M:%S.%f")
+        yield chunk
+
+def iter_query_log_binary(path, chunk_lines=CHUNK_LINES):
+    """
+    read_block.py --format binary のクエリログ（bpf_query_log.bin: QUERY_HEADER の後にクエリ文字列）を
+    チャンク毎に読み込み、iter_query_log と同じ列・型の DataFrame を yield する
+    書き込み途中で終了した最後のレコードは読み飛ばす
+    """
+    size = QUERY_HEADER.size
+    buffer = b""
+    pos = 0
+    eof = False
+    with open(path, "rb") as f:
+        while not eof:
+            rows = []
+            while len(rows) < chunk_lines:
+                length = QUERY_HEADER.unpack_from(buffer, pos)[3] if len(buffer) - pos >= size else None
+                if length is None or len(buffer) - pos < size + length:
+                    # 読み込んだ範囲でレコードが切れていれば、残りを先頭に詰めて読み足す
+                    more = f.read(READ_BUFFER_SIZE)
+                    if not more:
+                        eof = True
+                        break
+                    buffer = buffer[pos:] + more
+                    pos = 0
+                    continue
+                timestamp, pid, queryid, _ = QUERY_HEADER.unpack_from(buffer, pos)
+                rows.append((timestamp, pid, queryid,
+                             buffer[pos + size:pos + size + length].decode("utf-8", errors="replace")))
+                pos += size + length
+            if not rows:
+                break
+            timestamp, pid, queryid, query = zip(*rows)
+            yield pd.DataFrame({
+                "timestamp": _local_datetime(timestamp, unit="us"),
+                "pid": np.array(pid, dtype=np.int64),
+                "queryid": np.array(queryid, dtype=np.int64),
+                "query": list(query),
+            })
+
+def is_binary(path):
+    return path.endswith(".bin")
+
+def iter_read_block_any(path, chunk_lines=CHUNK_LINES):
+    """
+    拡張子（.csv / .bin）で iter_read_block と iter_read_block_binary を選ぶ
+    """
+    reader = iter_read_block_binary if is_binary(path) else iter_read_block
+    return reader(path, chunk_lines)
+
+def iter_query_log_any(path, chunk_lines=CHUNK_LINES):
+    """
+    拡張子（.csv / .bin）で iter_query_log と iter_query_log_binary を選ぶ
+    """
+    reader = iter_query_log_binary if is_binary(path) else iter_query_log
+    return reader(path, chunk_lines)
+
+def trace_path(data_dir, name):
+    """
+    read_block.py の出力 <name>.csv があればそのパスを、なく <name>.bin があればそちらを返す
+    """
+    path = os.path.join(data_dir, name + ".csv")
+    binary = os.path.join(data_dir, name + ".bin")
+    if not os.path.exists(path) and os.path.exists(binary):
+        return binary
+    return path
+
+def expand_block_ranges(min_block, max_block):
+    """
+    ブロック範囲 [min_block, max_block] を 1 ブロック 1 アクセスの列に展開する
+    戻り値は (元の行番号, ブロック番号)。範囲内は昇順にアクセスしたものとみなす
+    """
+    min_block = np.asarray(min_block, dtype=np.int64)
+    max_block = np.asarray(max_block, dtype=np.int64)
+    lengths = np.maximum(max_block - min_block + 1, 0)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    offsets = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+    return rows, np.repeat(min_block, lengths) + offsets
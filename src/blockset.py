@@ -0,0 +1,385 @@
+"""
+relfilenode 毎のブロック番号の集合（Roaring bitmap と同じ構成の圧縮ビットマップを NumPy で実装したもの）
+
+- ブロック番号（uint32）の上位 16 ビット毎にコンテナを持つ
+  - 要素が ARRAY_MAX 個以下: 下位 16 ビットの昇順の uint16 配列（array コンテナ, 2 バイト/要素）
+  - それより多い: 65536 ビットのビットマップ（bitmap コンテナ, uint64 × 1024 = 8KB）
+  演算の結果に応じてコンテナの種類を切り替える。Roaring の run コンテナは実装していない
+- RoaringBitmap: 1 つのリレーションの集合, BlockSet: relfilenode → RoaringBitmap
+  どちらも | & - で和・積・差集合、len で要素数、to_bytes / from_bytes でシリアライズできる
+- DataFrame の行や "16407_0" のような文字列のブロック ID の代わりに、ワーキングセット・
+  バッファの常駐ブロック（pg_buffercache）の差分・期間やクエリ間の重なりの計算に使う
+"""
+
+import struct
+
+import numpy as np
+
+import block_log
+
+ARRAY_MAX = 4096
+CONTAINER_BITS = 1 << 16
+BITMAP_WORDS = CONTAINER_BITS // 64
+
+# シリアライズ形式のヘッダー（マジック, バージョン）
+MAGIC = b"BSET"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")          # マジック, バージョン, リレーション数
+RELATION_HEADER = struct.Struct("<qI")   # relfilenode, コンテナ数
+CONTAINER_HEADER = struct.Struct("<HBI") # 上位 16 ビット, 種類 (0: array, 1: bitmap), 要素数
+ARRAY, BITMAP = 0, 1
+
+_FULL = np.full(BITMAP_WORDS, np.iinfo(np.uint64).max, dtype=np.uint64)
+
+def _is_bitmap(container):
+    return container.dtype == np.uint64
+
+def _to_bitmap(container):
+    if _is_bitmap(container):
+        return container
+    flags = np.zeros(CONTAINER_BITS, dtype=np.bool_)
+    flags[container] = True
+    return np.packbits(flags, bitorder="little").view(np.uint64)
+
+def _to_array(container):
+    if not _is_bitmap(container):
+        return container
+    return np.flatnonzero(np.unpackbits(container.view(np.uint8), bitorder="little")).astype(np.uint16)
+
+def _cardinality(container):
+    if _is_bitmap(container):
+        return int(np.bitwise_count(container).sum())
+    return len(container)
+
+def _normalize(container):
+    """
+    要素数に合ったコンテナの種類に変換する（空なら None）
+    """
+    n = _cardinality(container)
+    if n == 0:
+        return None
+    if _is_bitmap(container):
+        return _to_array(container) if n <= ARRAY_MAX else container
+    return _to_bitmap(container) if n > ARRAY_MAX else container
+
+def _contains(bitmap, values):
+    """
+    array コンテナの各要素が bitmap コンテナに含まれるか
+    """
+    values = values.astype(np.int64)
+    return ((bitmap[values >> 6] >> (values & 63).astype(np.uint64)) & np.uint64(1)).astype(np.bool_)
+
+def _union(a, b):
+    if _is_bitmap(a) or _is_bitmap(b):
+        return _to_bitmap(a) | _to_bitmap(b)
+    return np.union1d(a, b)
+
+def _intersection(a, b):
+    if _is_bitmap(a) and _is_bitmap(b):
+        return a & b
+    if _is_bitmap(a):
+        return b[_contains(a, b)]
+    if _is_bitmap(b):
+        return a[_contains(b, a)]
+    return np.intersect1d(a, b, assume_unique=True)
+
+def _difference(a, b):
+    if _is_bitmap(a):
+        return a & ~_to_bitmap(b)
+    if _is_bitmap(b):
+        return a[~_contains(b, a)]
+    return np.setdiff1d(a, b, assume_unique=True)
+
+class RoaringBitmap:
+    """
+    uint32 の集合。containers は {上位 16 ビット: コンテナ}
+    """
+
+    def __init__(self, values=None):
+        self.containers = {}
+        if values is not None:
+            self.add(values)
+
+    @classmethod
+    def from_range(cls, low, high):
+        result = cls()
+        result.add_range(low, high)
+        return result
+
+    def add(self, values):
+        values = np.unique(np.asarray(values, dtype=np.int64))
+        if len(values) == 0:
+            return
+        high = values >> 16
+        keys, starts = np.unique(high, return_index=True)
+        for key, part in zip(keys.tolist(), np.split(values, starts[1:])):
+            low = (part & 0xFFFF).astype(np.uint16)
+            container = self.containers.get(key)
+            merged = low if container is None else _union(container, low)
+            self.containers[key] = _normalize(merged)
+
+    def add_range(self, low, high):
+        """
+        [low, high] を加える。コンテナ全体を覆う部分は全ビットが立った bitmap コンテナにする
+        """
+        if high < low:
+            return
+        for key in range(low >> 16, (high >> 16) + 1):
+            first = max(low, key << 16) & 0xFFFF
+            last = min(high, (key << 16) | 0xFFFF) & 0xFFFF
+            if first == 0 and last == 0xFFFF:
+                self.containers[key] = _FULL.copy()
+                continue
+            part = np.arange(first, last + 1, dtype=np.uint16)
+            container = self.containers.get(key)
+            self.containers[key] = _normalize(part if container is None else _union(container, part))
+
+    def add_ranges(self, low, high):
+        """
+        複数の範囲 [low[i], high[i]] を加える（短い範囲はまとめて展開する）
+        """
+        low = np.asarray(low, dtype=np.int64)
+        high = np.asarray(high, dtype=np.int64)
+        long_ranges = high - low + 1 > ARRAY_MAX
+        for l, h in zip(low[long_ranges].tolist(), high[long_ranges].tolist()):
+            self.add_range(l, h)
+        _, values = block_log.expand_block_ranges(low[~long_ranges], high[~long_ranges])
+        self.add(values)
+
+    def _combine(self, other, op, keys):
+        result = RoaringBitmap()
+        for key in keys:
+            a = self.containers.get(key)
+            b = other.containers.get(key)
+            # 片方にしかないコンテナは和集合（a, b）・差集合（a）ではそのまま使う
+            if a is None:
+                container = b
+            elif b is None:
+                container = a
+            else:
+                container = _normalize(op(a, b))
+            if container is not None:
+                result.containers[key] = container
+        return result
+
+    def __or__(self, other):
+        return self._combine(other, _union, self.containers.keys() | other.containers.keys())
+
+    def __and__(self, other):
+        return self._combine(other, _intersection, self.containers.keys() & other.containers.keys())
+
+    def __sub__(self, other):
+        return self._combine(other, _difference, self.containers.keys())
+
+    def __len__(self):
+        return sum(_cardinality(c) for c in self.containers.values())
+
+    def __eq__(self, other):
+        if not isinstance(other, RoaringBitmap) or self.containers.keys() != other.containers.keys():
+            return False
+        # 種類は要素数で決まるため、同じ集合なら同じ種類になる
+        return all(np.array_equal(c, other.containers[k]) for k, c in self.containers.items())
+
+    def __contains__(self, value):
+        container = self.containers.get(value >> 16)
+        if container is None:
+            return False
+        low = np.array([value & 0xFFFF], dtype=np.uint16)
+        if _is_bitmap(container):
+            return bool(_contains(container, low)[0])
+        i = np.searchsorted(container, low[0])
+        return i < len(container) and container[i] == low[0]
+
+    @staticmethod
+    def union_all(bitmaps):
+        """
+        複数の集合の和集合
+        コンテナ毎に、array コンテナは連結してまとめて 1 回で、bitmap コンテナは OR でまとめる
+        """
+        grouped = {}
+        for bitmap in bitmaps:
+            for key, container in bitmap.containers.items():
+                grouped.setdefault(key, []).append(container)
+        result = RoaringBitmap()
+        for key, containers in grouped.items():
+            if len(containers) == 1:
+                result.containers[key] = containers[0]
+                continue
+            arrays = [c for c in containers if not _is_bitmap(c)]
+            bitmaps = [c for c in containers if _is_bitmap(c)]
+            if not bitmaps:
+                merged = np.unique(np.concatenate(arrays))
+            else:
+                merged = np.bitwise_or.reduce(bitmaps)
+                if arrays:
+                    merged |= _to_bitmap(np.concatenate(arrays))
+            result.containers[key] = _normalize(merged)
+        return result
+
+    def to_array(self):
+        """
+        要素を昇順の int64 配列で返す
+        """
+        parts = [(np.int64(key) << 16) | _to_array(self.containers[key]).astype(np.int64)
+                 for key in sorted(self.containers)]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in self.containers.values())
+
+    def _write(self, out):
+        for key in sorted(self.containers):
+            container = self.containers[key]
+            kind = BITMAP if _is_bitmap(container) else ARRAY
+            out.append(CONTAINER_HEADER.pack(key, kind, _cardinality(container)))
+            out.append(container.astype("<u8" if kind == BITMAP else "<u2").tobytes())
+
+    @classmethod
+    def _read(cls, data, offset, count):
+        result = cls()
+        for _ in range(count):
+            key, kind, n = CONTAINER_HEADER.unpack_from(data, offset)
+            offset += CONTAINER_HEADER.size
+            if kind == BITMAP:
+                container = np.frombuffer(data, dtype="<u8", count=BITMAP_WORDS, offset=offset).astype(np.uint64)
+            else:
+                container = np.frombuffer(data, dtype="<u2", count=n, offset=offset).astype(np.uint16)
+            offset += container.nbytes
+            result.containers[key] = container
+        return result, offset
+
+class BlockSet:
+    """
+    relfilenode 毎のブロック番号の集合
+    """
+
+    def __init__(self):
+        self.relations = {}
+
+    @classmethod
+    def from_keys(cls, keys):
+        """
+        block_log.encode_block_key のキーの配列から作る
+        """
+        relfilenode, blocknum = block_log.decode_block_key(np.asarray(keys, dtype=np.int64))
+        result = cls()
+        result.add(relfilenode, blocknum)
+        return result
+
+    @classmethod
+    def from_frame(cls, df, relfilenode="RelFileNode", blocknum="BlockNum"):
+        result = cls()
+        result.add(df[relfilenode].to_numpy(), df[blocknum].to_numpy())
+        return result
+
+    def add(self, relfilenode, blocknum):
+        """
+        (relfilenode, ブロック番号) の配列を加える。relfilenode はスカラーでもよい
+        """
+        blocknum = np.asarray(blocknum, dtype=np.int64)
+        if np.ndim(relfilenode) == 0:
+            self.relations.setdefault(int(relfilenode), RoaringBitmap()).add(blocknum)
+            return
+        relfilenode = np.asarray(relfilenode, dtype=np.int64)
+        for rel in np.unique(relfilenode).tolist():
+            self.relations.setdefault(rel, RoaringBitmap()).add(blocknum[relfilenode == rel])
+
+    def add_range(self, relfilenode, low, high):
+        self.relations.setdefault(int(relfilenode), RoaringBitmap()).add_range(low, high)
+
+    def add_ranges(self, relfilenode, low, high):
+        """
+        ブロック範囲 [low[i], high[i]]（bpf_read_block.csv の min_block, max_block）の配列を加える
+        """
+        relfilenode = np.asarray(relfilenode, dtype=np.int64)
+        low = np.asarray(low, dtype=np.int64)
+        high = np.asarray(high, dtype=np.int64)
+        for rel in np.unique(relfilenode).tolist():
+            mask = relfilenode == rel
+            self.relations.setdefault(rel, RoaringBitmap()).add_ranges(low[mask], high[mask])
+
+    def _combine(self, other, op, relfilenodes):
+        result = BlockSet()
+        for rel in relfilenodes:
+            a = self.relations.get(rel, RoaringBitmap())
+            b = other.relations.get(rel, RoaringBitmap())
+            bitmap = op(a, b)
+            if bitmap.containers:
+                result.relations[rel] = bitmap
+        return result
+
+    def __or__(self, other):
+        return self._combine(other, RoaringBitmap.__or__, self.relations.keys() | other.relations.keys())
+
+    def __and__(self, other):
+        return self._combine(other, RoaringBitmap.__and__, self.relations.keys() & other.relations.keys())
+
+    def __sub__(self, other):
+        return self._combine(other, RoaringBitmap.__sub__, self.relations.keys())
+
+    def __len__(self):
+        return sum(len(bitmap) for bitmap in self.relations.values())
+
+    def __eq__(self, other):
+        return isinstance(other, BlockSet) and self.relations == other.relations
+
+    def __getitem__(self, relfilenode):
+        return self.relations.get(relfilenode, RoaringBitmap())
+
+    @staticmethod
+    def union_all(blocksets):
+        grouped = {}
+        for blockset in blocksets:
+            for rel, bitmap in blockset.relations.items():
+                grouped.setdefault(rel, []).append(bitmap)
+        result = BlockSet()
+        result.relations = {rel: RoaringBitmap.union_all(bitmaps) for rel, bitmaps in grouped.items()}
+        return result
+
+    def counts(self):
+        """
+        relfilenode 毎の要素数
+        """
+        return {rel: len(bitmap) for rel, bitmap in self.relations.items()}
+
+    def to_keys(self):
+        """
+        block_log.encode_block_key のキーの昇順の配列で返す
+        """
+        parts = [block_log.encode_block_key(rel, self.relations[rel].to_array()) for rel in sorted(self.relations)]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        return sum(bitmap.nbytes for bitmap in self.relations.values())
+
+    def to_bytes(self):
+        out = [HEADER.pack(MAGIC, VERSION, len(self.relations))]
+        for rel in sorted(self.relations):
+            bitmap = self.relations[rel]
+            out.append(RELATION_HEADER.pack(rel, len(bitmap.containers)))
+            bitmap._write(out)
+        return b"".join(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported blockset format: {magic!r} v{version}")
+        offset = HEADER.size
+        result = cls()
+        for _ in range(count):
+            rel, ncontainers = RELATION_HEADER.unpack_from(data, offset)
+            offset += RELATION_HEADER.size
+            result.relations[rel], offset = RoaringBitmap._read(data, offset, ncontainers)
+        return result
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
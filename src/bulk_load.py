@@ -0,0 +1,131 @@
+"""
+large_table1 / large_table2 の初期データを COPY FROM STDIN で高速に投入する
+
+- random_string(200) と同じく、62 文字（英大文字・小文字・数字）からなる 200 文字の文字列を
+  クライアント側で NumPy によりバッチ単位で生成する（行の大きさは random_string と同じ）
+- id の範囲をワーカープロセスに分け、それぞれの接続から COPY で並列に流し込む
+  - binary: PostgreSQL のバイナリ COPY 形式（構造化配列でまとめて組み立てる）
+  - text: タブ区切りのテキスト形式
+- UNLOGGED テーブルに投入してから SET LOGGED にし、最後に主キーを作成する
+"""
+
+import argparse
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import psycopg2
+
+import workload
+
+ALPHABET = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789", dtype=np.uint8)
+
+# バイナリ COPY のヘッダー（署名, フラグ, ヘッダー拡張の長さ）とトレーラー
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + np.zeros(2, dtype=">i4").tobytes()
+COPY_BINARY_TRAILER = np.array([-1], dtype=">i2").tobytes()
+
+def binary_row_dtype(length):
+    """
+    (id bigint, data text) の 1 行分のバイナリ COPY 形式
+    """
+    return np.dtype([
+        ("nfields", ">i2"),
+        ("id_len", ">i4"),
+        ("id", ">i8"),
+        ("data_len", ">i4"),
+        ("data", f"S{length}"),
+    ])
+
+def random_text(rng, rows, length):
+    """
+    ALPHABET からなる length 文字の文字列 rows 行分を (rows, length) の uint8 配列で返す
+    """
+    return ALPHABET[rng.integers(0, len(ALPHABET), size=(rows, length), dtype=np.uint8)]
+
+def encode_binary(ids, text):
+    """
+    バッチをバイナリ COPY 形式のバイト列にする
+    """
+    rows, length = text.shape
+    out = np.empty(rows, dtype=binary_row_dtype(length))
+    out["nfields"] = 2
+    out["id_len"] = 8
+    out["id"] = ids
+    out["data_len"] = length
+    out["data"] = text.view(f"S{length}").ravel()
+    return COPY_BINARY_HEADER + out.tobytes() + COPY_BINARY_TRAILER
+
+def encode_text(ids, text):
+    """
+    バッチをテキスト COPY 形式（id<TAB>data<LF>）のバイト列にする
+    """
+    length = text.shape[1]
+    data = text.view(f"S{length}").ravel()
+    return b"".join(b"%d\t%s\n" % row for row in zip(ids.tolist(), data.tolist()))
+
+def copy_range(table, start, end, length, batch_rows, fmt, seed, conn_params):
+    """
+    id が [start, end) の行を生成して COPY する（ワーカープロセスで実行）
+    """
+    rng = np.random.default_rng([seed, start])
+    encode = encode_binary if fmt == "binary" else encode_text
+    options = "(FORMAT binary)" if fmt == "binary" else ""
+    conn = psycopg2.connect(**{**workload.CONN_PARAMS, **conn_params})
+    try:
+        with conn.cursor() as cur:
+            for batch_start in range(start, end, batch_rows):
+                batch_end = min(batch_start + batch_rows, end)
+                ids = np.arange(batch_start, batch_end, dtype=np.int64)
+                payload = encode(ids, random_text(rng, len(ids), length))
+                cur.copy_expert(f"COPY {table} (id, data) FROM STDIN {options}", io.BytesIO(payload))
+        conn.commit()
+    finally:
+        conn.close()
+    return end - start
+
+def load_table(table, rows, length=200, workers=4, batch_rows=100_000, fmt="binary", seed=0, **conn_params):
+    """
+    テーブルを作り直し、rows 行を並列に投入する。id は 1 から rows まで
+    """
+    conn = psycopg2.connect(**{**workload.CONN_PARAMS, **conn_params})
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+            cur.execute(f"CREATE UNLOGGED TABLE {table} (id BIGSERIAL, data TEXT)")
+
+        start = time.perf_counter()
+        bounds = np.linspace(1, rows + 1, workers + 1, dtype=np.int64)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(copy_range, table, int(lo), int(hi), length, batch_rows, fmt, seed, conn_params)
+                       for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+            loaded = sum(future.result() for future in futures)
+        copied = time.perf_counter() - start
+
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE {table} SET LOGGED")
+            cur.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+            cur.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", (table, rows))
+            cur.execute(f"ANALYZE {table}")
+    finally:
+        conn.close()
+    print(f"{table}: {loaded} rows, copy {copied:.1f}s, total {time.perf_counter() - start:.1f}s")
+    return loaded
+
+def main():
+    parser = argparse.ArgumentParser(description="large_table の初期データを COPY で並列に投入する")
+    parser.add_argument("tables", nargs="*", default=["large_table1", "large_table2"])
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--length", type=int, default=200, help="data 列の文字数")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-rows", type=int, default=100_000)
+    parser.add_argument("--format", choices=["binary", "text"], default="binary")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for n, table in enumerate(args.tables):
+        load_table(table, args.rows, args.length, args.workers, args.batch_rows, args.format, args.seed + n)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+ブロックトレースを PostgreSQL の clock-sweep バッファ置換のモデルで再生するシミュレータ
+
+- freelist.c / bufmgr.c の動作を模擬する
+  - ヒット時は usage_count を BM_MAX_USAGE_COUNT (5) まで加算する
+    （BufferAccessStrategy 使用時は 0 のときだけ 1 にする）
+  - ミス時は freelist -> nextVictimBuffer からの clock-sweep の順に空きバッファを探す
+    （usage_count が 0 でなければ 1 減らして次へ進む）
+  - BufferAccessStrategy（一括読み込みのリングバッファ）を使うリレーションは、
+    リングの次のバッファが usage_count <= 1 ならそれを再利用する
+- バッファの状態は array / bytearray で保持する
+- ヒット・ミス・追い出し（追い出されたブロックのリレーション）を 1 分毎・リレーション毎に集計する
+"""
+
+import argparse
+import os
+from array import array
+
+import numpy as np
+import pandas as pd
+
+import block_log
+import data_format
+import mrc
+
+# usage_count の上限（buf_internals.h の BM_MAX_USAGE_COUNT）
+BM_MAX_USAGE_COUNT = 5
+
+# BAS_BULKREAD のリングサイズ（256kB）
+BULKREAD_RING_SIZE = 256 * 1024
+
+class BufferAccessStrategy:
+    """
+    リングバッファ（freelist.c の BufferAccessStrategyData に相当）
+    """
+
+    def __init__(self, ring_buffers):
+        self.buffers = array("l", [-1] * ring_buffers)
+        self.current = 0
+
+class ClockSweep:
+    """
+    shared_buffers の clock-sweep 置換のシミュレータ
+    ring_relations には {relfilenode: リングのブロック数} を指定する
+    """
+
+    def __init__(self, nbuffers, ring_relations=None):
+        self.nbuffers = nbuffers
+        self.tags = array("q", [-1] * nbuffers)   # バッファに載っているブロックのキー
+        self.usage = bytearray(nbuffers)          # usage_count
+        self.table = {}                           # キー -> バッファ番号
+        self.first_free = 0                       # 未使用バッファ（freelist）の先頭
+        self.next_victim = 0                      # nextVictimBuffer
+        self.ring_relations = {}
+        self.strategies = {}
+        for rel, ring_buffers in (ring_relations or {}).items():
+            # GetAccessStrategyWithSize と同様に NBuffers / 8 を上限とする
+            self.ring_relations[rel] = max(1, min(ring_buffers, nbuffers // 8))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _clock_sweep(self):
+        """
+        StrategyGetBuffer の clock-sweep 部分。usage_count が 0 のバッファを返す
+        """
+        usage = self.usage
+        nbuffers = self.nbuffers
+        victim = self.next_victim
+        while True:
+            buf = victim
+            victim += 1
+            if victim >= nbuffers:
+                victim = 0
+            if usage[buf] == 0:
+                self.next_victim = victim
+                return buf
+            usage[buf] -= 1
+
+    def _get_buffer(self, strategy):
+        """
+        空きバッファを取得する（リング -> freelist -> clock-sweep の順）
+        """
+        if strategy is not None:
+            # GetBufferFromRing
+            strategy.current += 1
+            if strategy.current >= len(strategy.buffers):
+                strategy.current = 0
+            buf = strategy.buffers[strategy.current]
+            if buf >= 0 and self.usage[buf] <= 1:
+                return buf
+
+        if self.first_free < self.nbuffers:
+            buf = self.first_free
+            self.first_free += 1
+        else:
+            buf = self._clock_sweep()
+
+        if strategy is not None:
+            # AddBufferToRing
+            strategy.buffers[strategy.current] = buf
+        return buf
+
+    def access(self, key, relfilenode=None):
+        """
+        1 ブロックにアクセスし、(ヒットしたか, 追い出したブロックのキー or -1) を返す
+        """
+        strategy = None
+        if relfilenode in self.ring_relations:
+            strategy = self.strategies.get(relfilenode)
+            if strategy is None:
+                strategy = BufferAccessStrategy(self.ring_relations[relfilenode])
+                self.strategies[relfilenode] = strategy
+
+        buf = self.table.get(key)
+        if buf is not None:
+            # PinBuffer
+            self.hits += 1
+            if strategy is None:
+                if self.usage[buf] < BM_MAX_USAGE_COUNT:
+                    self.usage[buf] += 1
+            elif self.usage[buf] == 0:
+                self.usage[buf] = 1
+            return True, -1
+
+        self.misses += 1
+        buf = self._get_buffer(strategy)
+        victim = self.tags[buf]
+        if victim >= 0:
+            self.evictions += 1
+            del self.table[victim]
+        self.tags[buf] = key
+        self.table[key] = buf
+        self.usage[buf] = 1
+        return False, victim
+
+    def replay(self, keys, relfilenode):
+        """
+        アクセス列を再生し、アクセス毎のヒット有無と追い出したキーの配列を返す
+        """
+        hit = np.zeros(len(keys), dtype=bool)
+        victims = np.full(len(keys), -1, dtype=np.int64)
+        access = self.access
+        for n, (key, rel) in enumerate(zip(keys.tolist(), relfilenode.tolist())):
+            hit[n], victims[n] = access(key, rel)
+        return hit, victims
+
+def summarize(minute, relfilenode, hit, victims):
+    """
+    1 分毎・リレーション毎のヒット・ミス・追い出し数を集計する
+    追い出しは追い出されたブロックのリレーションで数える
+    """
+    access = pd.DataFrame({"minute": minute, "relfilenode": relfilenode, "hits": hit, "misses": ~hit})
+    counts = access.groupby(["minute", "relfilenode"])[["hits", "misses"]].sum()
+    evicted = victims >= 0
+    victim_rel, _ = block_log.decode_block_key(victims[evicted])
+    evictions = pd.DataFrame({"minute": np.asarray(minute)[evicted], "relfilenode": victim_rel}) \
+        .value_counts(["minute", "relfilenode"]).rename("evictions")
+    return counts.join(evictions, how="outer").fillna(0).astype(np.int64)
+
+def simulate(chunks, nbuffers, ring_relations=None):
+    """
+    bpf_blockread のチャンク列を再生し、1 分毎・リレーション毎の集計を返す
+    """
+    sim = ClockSweep(nbuffers, ring_relations)
+    result = None
+    for chunk in chunks:
+        keys = block_log.encode_block_key(chunk["relfilenode"], chunk["blocknum"])
+        hit, victims = sim.replay(keys, chunk["relfilenode"])
+        minute = data_format.monotonic_to_datetime(chunk["timestamp"]).tz_localize(None).floor("min")
+        counts = summarize(minute, chunk["relfilenode"], hit, victims)
+        result = counts if result is None else result.add(counts, fill_value=0)
+
+    if result is None:
+        return pd.DataFrame(columns=["minute", "relfilenode", "hits", "misses", "evictions", "hit_ratio"])
+    result = result.astype(np.int64).reset_index()
+    result["hit_ratio"] = result["hits"] / (result["hits"] + result["misses"])
+    return result
+
+def resolve_relations(names, data_dir):
+    """
+    relname または relfilenode の指定を relfilenode に変換する
+    """
+    mapping = {}
+    path = os.path.join(data_dir, "pg_class.csv")
+    if os.path.exists(path):
+        mapping = pd.read_csv(path).set_index("relname")["relfilenode"].to_dict()
+    return [int(name) if name.isdigit() else int(mapping[name]) for name in names]
+
+def main():
+    parser = argparse.ArgumentParser(description="bpf_blockread を clock-sweep で再生する")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--shared-buffers", default="128MB")
+    parser.add_argument("--ring", action="append", default=[],
+                        help="リングバッファを使うリレーション（relname または relfilenode, 複数指定可）")
+    parser.add_argument("--ring-size", default=f"{BULKREAD_RING_SIZE // 1024}kB", help="リングバッファのサイズ")
+    parser.add_argument("--output", default="../data/clock_sweep.csv")
+    args = parser.parse_args()
+
+    nbuffers = mrc.parse_size(args.shared_buffers) // mrc.BLOCK_SIZE
+    ring_buffers = mrc.parse_size(args.ring_size) // mrc.BLOCK_SIZE
+    ring_relations = {rel: ring_buffers for rel in resolve_relations(args.ring, args.data_dir)}
+
+    paths = block_log.blockread_segments(args.data_dir)
+    result = simulate(block_log.iter_blockread(paths), nbuffers, ring_relations)
+    result.to_csv(args.output, index=False)
+
+    total = result.groupby("relfilenode")[["hits", "misses", "evictions"]].sum()
+    total["hit_ratio"] = total["hits"] / (total["hits"] + total["misses"])
+    print(total)
+
+if __name__ == '__main__':
+    main()
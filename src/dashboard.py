@@ -0,0 +1,274 @@
+"""
+トレース中のブロックアクセスの集計をメモリ上に持ち、ローカルの HTTP で JSON として返す（ファイルには書かない）
+
+- LiveStats: 直近 window 秒の 1 秒毎のバケットから、イベント数/秒, アクセス数/秒,
+  リレーション毎のアクセス数と上位のリレーション, ミス率（ヒット・ミスが分かる入力のときのみ。read_block.py のイベントには
+  含まれないため null）を 1 秒毎に計算し直す。ワーキングセットは working_set.py の WorkingSetTracker の最後に閉じたバケットの値
+- 計算し直す毎に version を 1 つ進め、リレーション毎に値が変わった version を記録する
+  - GET /snapshot: 全体
+  - GET /diff?since=<version>: since より後に変わったリレーションと、窓から外れたリレーション（removed）だけ
+- read_block.py --dashboard <port> でトレース中に起動する（bench.py の実行中に curl 等で見る）
+- このスクリプトを直接実行すると、synthetic_trace.py の pgbench のトレース（clock-sweep でのヒット有無付き）を
+  実時間の --speedup 倍で流して同じ API を提供する（root 権限なしで試すため）
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import working_set as ws
+
+DEFAULT_PORT = 8050
+WINDOW_SECONDS = 60
+TOP_RELATIONS = 10
+
+def load_relnames(data_dir="../data"):
+    mapping_csv = os.path.join(data_dir, "pg_class.csv")
+    if not os.path.exists(mapping_csv):
+        return {}
+    return pd.read_csv(mapping_csv).set_index("relfilenode")["relname"].to_dict()
+
+class LiveStats:
+    """
+    ブロックアクセスの直近 window 秒の集計
+    add_* はトレーサーのスレッドから、snapshot / diff は HTTP のスレッドから呼ばれる
+    """
+
+    def __init__(self, working_set=None, window=WINDOW_SECONDS, top=TOP_RELATIONS, relnames=None):
+        self.working_set = working_set
+        self.window = window
+        self.top = top
+        self.relnames = relnames or {}
+        self.lock = threading.Lock()
+        # 1 秒毎のバケット: [秒, イベント数, {relfilenode: アクセス数}, {relfilenode: ヒット数}, {relfilenode: ミス数}]
+        self.buckets = deque()
+        self.started = int(time.monotonic())
+        self.last_refresh = None
+        self.version = 0
+        self.state = {}          # 最後に計算したリレーション毎の値
+        self.changed = {}        # relfilenode → 値が変わった version
+        self.removed = {}        # relfilenode → 窓から外れた version
+        self.summary = self._summary({}, 0, 0, 0, 0, 0.0)
+
+    def _bucket(self, second):
+        if not self.buckets or self.buckets[-1][0] != second:
+            self.buckets.append([second, 0, {}, {}, {}])
+        return self.buckets[-1]
+
+    def add_access(self, relfilenode, accesses, hits=None, events=1, now=None):
+        """
+        1 リレーションへのアクセス数（と分かればヒット数）を記録する
+        """
+        second = int(time.monotonic() if now is None else now)
+        with self.lock:
+            self._refresh(second)
+            bucket = self._bucket(second)
+            bucket[1] += events
+            bucket[2][relfilenode] = bucket[2].get(relfilenode, 0) + accesses
+            if hits is not None:
+                bucket[3][relfilenode] = bucket[3].get(relfilenode, 0) + hits
+                bucket[4][relfilenode] = bucket[4].get(relfilenode, 0) + accesses - hits
+
+    def add_event(self, event, now=None):
+        """
+        read_block.py の Event（クエリ毎のブロック範囲, ヒット・ミスは分からない）を記録する
+        """
+        second = int(time.monotonic() if now is None else now)
+        with self.lock:
+            self._refresh(second)
+            bucket = self._bucket(second)
+            bucket[1] += 1
+            accesses = bucket[2]
+            for i in range(event.num_rel):
+                rel = event.rel_info[i]
+                accesses[rel.relfilenode] = accesses.get(rel.relfilenode, 0) + rel.max_block - rel.min_block + 1
+
+    def _summary(self, relations, events, accesses, hits, misses, span):
+        return {
+            "events_per_sec": events / span if span else 0.0,
+            "accesses_per_sec": accesses / span if span else 0.0,
+            "miss_rate": misses / (hits + misses) if hits + misses else None,
+            "top_relations": [str(rel) for rel in sorted(relations, key=lambda rel: relations[rel]["accesses"],
+                                                         reverse=True)[:self.top]],
+            "working_set": self.working_set.latest.get(0) if self.working_set is not None else None,
+        }
+
+    def _refresh(self, second):
+        """
+        秒が変わっていれば、直前の秒までの window 秒で集計し直す（lock を取った状態で呼ぶ）
+        """
+        if self.last_refresh is not None and second <= self.last_refresh:
+            return
+        self.last_refresh = second
+        while self.buckets and self.buckets[0][0] < second - self.window:
+            self.buckets.popleft()
+
+        accesses, hits, misses = {}, {}, {}
+        events = 0
+        for bucket_second, n, acc, hit, miss in self.buckets:
+            if bucket_second >= second:
+                continue
+            events += n
+            for target, source in ((accesses, acc), (hits, hit), (misses, miss)):
+                for rel, count in source.items():
+                    target[rel] = target.get(rel, 0) + count
+        # 窓が埋まるまでは経過時間で割る
+        span = min(self.window, second - self.started) or 1
+        latest = self.working_set.latest if self.working_set is not None else {}
+        relations = {}
+        for rel, count in accesses.items():
+            known = hits.get(rel, 0) + misses.get(rel, 0)
+            entry = {
+                "relname": self.relnames.get(rel),
+                "accesses": count,
+                "accesses_per_sec": count / span,
+                "miss_rate": misses.get(rel, 0) / known if known else None,
+            }
+            if rel in latest:
+                entry.update({k: v for k, v in latest[rel].items() if k.startswith("ws_")})
+            relations[rel] = entry
+
+        self.version += 1
+        for rel, entry in relations.items():
+            if self.state.get(rel) != entry:
+                self.changed[rel] = self.version
+            self.removed.pop(rel, None)
+        for rel in self.state.keys() - relations.keys():
+            self.removed[rel] = self.version
+            self.changed.pop(rel, None)
+        self.state = relations
+        self.summary = self._summary(relations, events, sum(accesses.values()),
+                                     sum(hits.values()), sum(misses.values()), span)
+
+    def refresh(self, now=None):
+        with self.lock:
+            self._refresh(int(time.monotonic() if now is None else now))
+
+    def _header(self):
+        return {"version": self.version, "timestamp": datetime.now().isoformat(), "window_sec": self.window,
+                **self.summary}
+
+    def snapshot(self):
+        with self.lock:
+            return {**self._header(), "relations": {str(rel): entry for rel, entry in self.state.items()}}
+
+    def diff(self, since):
+        """
+        since より後の version で変わったリレーションと、窓から外れたリレーション
+        """
+        with self.lock:
+            return {
+                **self._header(),
+                "since": since,
+                "relations": {str(rel): self.state[rel] for rel, v in self.changed.items() if v > since},
+                "removed": [str(rel) for rel, v in self.removed.items() if v > since],
+            }
+
+def _json_default(value):
+    # NumPy のスカラーは Python の値に、Timestamp 等は文字列にする
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        stats = self.server.stats
+        stats.refresh()
+        if url.path == "/snapshot":
+            self._send(200, stats.snapshot())
+        elif url.path == "/diff":
+            try:
+                since = int(parse_qs(url.query).get("since", ["0"])[0])
+            except ValueError:
+                self._send(400, {"error": "since must be an integer version"})
+                return
+            self._send(200, stats.diff(since))
+        else:
+            self._send(404, {"error": f"unknown path {url.path}", "paths": ["/snapshot", "/diff?since=<version>"]})
+
+    def log_message(self, format, *args):
+        # アクセスログでトレーサーの出力を埋めない
+        pass
+
+def start_server(stats, host="127.0.0.1", port=DEFAULT_PORT):
+    """
+    デーモンスレッドで HTTP サーバーを起動する（プロセスの終了とともに止まる）
+    """
+    server = ThreadingHTTPServer((host, port), DashboardHandler)
+    server.daemon_threads = True
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, name="dashboard", daemon=True).start()
+    return server
+
+def replay_synthetic(stats, events, speedup, seed=0):
+    """
+    pgbench の合成トレースを実時間の speedup 倍で流す
+    """
+    import synthetic_trace
+    start = time.monotonic()
+    origin = None
+    for chunk in synthetic_trace.pgbench(events, seed, with_hit=True):
+        if origin is None:
+            origin = chunk["timestamp"][0]
+        # 1 秒分（合成トレースの時刻）ずつまとめて記録する
+        second = (chunk["timestamp"] - origin) // 1_000_000_000
+        bounds = np.flatnonzero(np.diff(second)) + 1
+        for part in np.split(np.arange(len(chunk)), bounds):
+            due = start + second[part[0]] / speedup
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            rels = chunk["relfilenode"][part]
+            hits = chunk["hit"][part]
+            blocks = chunk["blocknum"][part]
+            seconds = ws.naive_seconds(datetime.now())
+            # 合成トレースは 1 アクセス 1 イベント
+            for rel in np.unique(rels).tolist():
+                mask = rels == rel
+                count = int(mask.sum())
+                stats.add_access(rel, count, hits=int(hits[mask].sum()), events=count)
+                stats.working_set.add(seconds, rel, blocks[mask])
+
+def main():
+    parser = argparse.ArgumentParser(description="合成トレースを流してダッシュボードの API を提供する")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--speedup", type=float, default=60.0, help="合成トレースの時刻の N 倍速で流す")
+    parser.add_argument("--data-dir", default="../data")
+    args = parser.parse_args()
+
+    import synthetic_trace
+    relnames = {relfilenode: relname for relname, relfilenode in synthetic_trace.PGBENCH_RELFILENODES.items()}
+    relnames.update({relfilenode: relname for relname, (relfilenode, _) in synthetic_trace.RELATIONS.items()})
+    stats = LiveStats(ws.WorkingSetTracker(keep_rows=False), relnames=relnames)
+    start_server(stats, port=args.port)
+    print(f"Serving http://127.0.0.1:{args.port}/snapshot and /diff?since=<version>. Ctrl-C で終了します。")
+    try:
+        replay_synthetic(stats, args.events, args.speedup)
+        stats.working_set.close()
+        print("Replay finished.")
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,84 @@
 import pandas as pd
 import glob
 import re
+import time
 
-# 対象ファイルの一覧を取得
-file_list = glob.glob("../data/pg_statio_user_tables_*.csv")
-
-data_rows = []
 # ファイル名からstart_timeとend_timeを抽出する正規表現パターン
 pattern = r"pg_statio_user_tables_(\d{8}_\d{6})_(\d{8}_\d{6})\.csv"
 
-for file in file_list:
-    # ファイル名から start_time と end_time を抽出
-    match = re.search(pattern, file)
-    if match:
-        start_time, end_time = match.groups()
-    else:
-        start_time, end_time = None, None
-
-    # CSVを読み込む
-    df = pd.read_csv(file)
-    
-    # テーブル名が "pgbench_" または "large" で始まる行のみを抽出
-    filtered = df[df['relname'].str.startswith('pgbench_') | df['relname'].str.startswith('large')]
-    
-    # 1行分のデータを辞書にまとめる
-    row_data = {'start_time': start_time, 'end_time': end_time}
-    for _, row in filtered.iterrows():
-        col_name = f"{row['relname']}_cache_hit_ratio"
-        row_data[col_name] = row['cache_hit_ratio']
-    
-    data_rows.append(row_data)
-
-# 辞書のリストから DataFrame を作成
-result_df = pd.DataFrame(data_rows)
-
-# start_time をキーにしてソート（YYYYMMDD_HHMMSS形式なら文字列のままでもソート可能）
-result_df.sort_values(by='start_time', inplace=True)
-result_df.to_csv("../data/cache_hit_ratio.csv", index=False)
-print(result_df)
\ No newline at end of file
+def monotonic_to_datetime(ns):
+    """
+    ブート後の経過時間 (ナノ秒単位, bpf_ktime_get_ns) を JST の日時に変換する
+    """
+    # 現在時刻 (Unix epoch) から、time.monotonic() を引くことでブート時刻の概算を得る
+    boot_time_epoch = time.time() - time.monotonic()
+
+    # 基準となる時刻をUTCで取得し、各イベントの経過時間を加算
+    base_time_utc = pd.to_datetime(boot_time_epoch, unit='s', utc=True)
+    ts = base_time_utc + pd.to_timedelta(ns, unit='ns')
+
+    # UTCからJST (Asia/Tokyo) に変換
+    if isinstance(ts, pd.Series):
+        return ts.dt.tz_convert('Asia/Tokyo')
+    return ts.tz_convert('Asia/Tokyo')
+
+def data_format(df):
+    """
+    eBPF で取得したブロックアクセスのタイムスタンプを日時に変換し、
+    システムカタログ以外のリレーションのみを残す
+    """
+    df['Timestamp'] = monotonic_to_datetime(df['Timestamp'])
+
+    # RelFileNode が 16000 以下のものを削除
+    df = df[df['RelFileNode'] > 16000]
+
+    df.reset_index(drop=True, inplace=True)
+
+    return df
+
+def cache_hit_ratio(file_list):
+    """
+    pg_statio_user_tables_*.csv を 1 ファイル 1 行に成型し、
+    リレーションごとの cache_hit_ratio を列に持つ DataFrame を返す
+    """
+    data_rows = []
+    for file in file_list:
+        # ファイル名から start_time と end_time を抽出
+        match = re.search(pattern, file)
+        if match:
+            start_time, end_time = match.groups()
+        else:
+            start_time, end_time = None, None
+
+        # CSVを読み込む
+        df = pd.read_csv(file)
+
+        # テーブル名が "pgbench_" または "large" で始まる行のみを抽出
+        filtered = df[df['relname'].str.startswith('pgbench_') | df['relname'].str.startswith('large')]
+
+        # 1行分のデータを辞書にまとめる
+        row_data = {'start_time': start_time, 'end_time': end_time}
+        for _, row in filtered.iterrows():
+            col_name = f"{row['relname']}_cache_hit_ratio"
+            row_data[col_name] = row['cache_hit_ratio']
+
+        data_rows.append(row_data)
+
+    # 辞書のリストから DataFrame を作成
+    result_df = pd.DataFrame(data_rows)
+
+    # start_time をキーにしてソート（YYYYMMDD_HHMMSS形式なら文字列のままでもソート可能）
+    if not result_df.empty:
+        result_df.sort_values(by='start_time', inplace=True)
+    return result_df
+
+def main():
+    # 対象ファイルの一覧を取得
+    file_list = glob.glob("../data/pg_statio_user_tables_*.csv")
+
+    result_df = cache_hit_ratio(file_list)
+    result_df.to_csv("../data/cache_hit_ratio.csv", index=False)
+    print(result_df)
+
+if __name__ == '__main__':
+    main()
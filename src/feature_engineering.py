@@ -1,5 +1,8 @@
 import pandas as pd
 import numpy as np
+from scipy import sparse
+
+import block_log
 
 def feature_engineering(df):
 
@@ -36,6 +39,7 @@ def feature_engineering(df):
     # # ブロックごとにソートしてからラグ特徴量を生成
     # block_long.sort_values(["block_id", "Timestamp"], inplace=True)
 
+    # # ※ 疎行列版は lag_features / rolling_features を使う
     # # ラグ特徴量（例：直前1ステップ＝10分前のアクセス件数）
     # block_long["lag_10min"] = block_long.groupby("block_id")["access_count"].shift(1)
 
@@ -46,4 +50,118 @@ def feature_engineering(df):
 
     return block_features
 
+def time_features(time_index):
+    """
+    時間ビンの先頭時刻から時刻の特徴量を作成する
+    """
+    features = pd.DataFrame(index=time_index)
+    features["hour"] = time_index.hour
+    features["minute"] = time_index.minute
+    features["sin_hour"] = np.sin(2 * np.pi * features["hour"] / 24)
+    features["cos_hour"] = np.cos(2 * np.pi * features["hour"] / 24)
+    return features
+
+def sparse_feature_engineering(df, freq="10min"):
+    """
+    ブロック×時間ビンのアクセス数を scipy.sparse の CSR 行列として作成する
+    ブロックは (RelFileNode, BlockNum) を整数キーに、時刻は freq 単位のビン番号に変換し、
+    密な行列を作らずに集計する
+
+    戻り値は (access, block_keys, time_feats)
+      access     : 行がブロック、列が時間ビンの CSR 行列（アクセス数）
+      block_keys : access の各行に対応するキー（block_log.encode_block_key）
+      time_feats : access の各列に対応する時刻特徴量（hour, minute, sin/cos）
+    """
+    keys = block_log.encode_block_key(df["RelFileNode"].to_numpy(), df["BlockNum"].to_numpy())
+    # キーを 0 始まりの行番号に変換
+    block_keys, rows = np.unique(keys, return_inverse=True)
+
+    if len(df) == 0:
+        access = sparse.csr_matrix((0, 0), dtype=np.int32)
+        return access, block_keys, time_features(pd.DatetimeIndex([]))
+
+    # 時刻を freq 単位のビン番号に変換
+    bins = df["Timestamp"].dt.floor(freq)
+    start = bins.min()
+    cols = ((bins - start) // pd.Timedelta(freq)).to_numpy(dtype=np.int64)
+    n_bins = int(cols.max()) + 1
+
+    # COO から CSR への変換で同じ (ブロック, ビン) のアクセスが合算される
+    access = sparse.coo_matrix(
+        (np.ones(len(keys), dtype=np.int32), (rows.ravel(), cols)),
+        shape=(len(block_keys), n_bins),
+    ).tocsr()
+
+    time_index = pd.date_range(start, periods=n_bins, freq=freq)
+    return access, block_keys, time_features(time_index)
+
+def shift_bins(access, k):
+    """
+    ブロック×時間の疎行列を時間方向に k ビン後ろへずらす（先頭 k ビンは 0）
+    """
+    coo = access.tocoo()
+    keep = coo.col + k < access.shape[1]
+    return sparse.csr_matrix(
+        (coo.data[keep], (coo.row[keep], coo.col[keep] + k)),
+        shape=access.shape,
+    )
+
+def lag_features(access, lags=(1,)):
+    """
+    ラグ特徴量（k ビン前のアクセス数）を {"lag_k": 疎行列} で返す
+    """
+    return {f"lag_{k}": shift_bins(access, k) for k in lags}
+
+def rolling_features(access, window=6):
+    """
+    直近 window ビン（例: 10分 x 6 = 1時間）の移動平均・移動最大を疎行列で返す
+    ずらした行列の和・要素毎の最大で計算するため、ブロック毎のループは不要
+    系列の先頭では範囲外を 0 として扱う
+    """
+    total = access.astype(np.float64)
+    peak = access.copy()
+    for k in range(1, window):
+        shifted = shift_bins(access, k)
+        total = total + shifted
+        peak = peak.maximum(shifted)
+    return {
+        f"rolling_mean_{window}": (total / window).tocsr(),
+        f"rolling_max_{window}": peak.tocsr(),
+    }
+
+def ewma_features(access, span=6, tol=1e-3):
+    """
+    指数加重移動平均（alpha = 2 / (span + 1)）を疎行列で返す
+    重みが tol を下回る過去のビンは打ち切り、疎性を保つ（系列の先頭より前は 0 とみなす）
+    """
+    alpha = 2.0 / (span + 1)
+    horizon = max(1, int(np.ceil(np.log(tol) / np.log(1 - alpha))))
+    ewma = access.astype(np.float64) * alpha
+    for k in range(1, horizon):
+        ewma = ewma + shift_bins(access, k) * (alpha * (1 - alpha) ** k)
+    return {f"ewma_{span}": ewma.tocsr()}
+
+def time_since_last_access(access, at=None):
+    """
+    時間ビン at（省略時は最終ビン）時点で、各ブロックが最後にアクセスされてから
+    経過したビン数をブロック毎の 1 次元配列で返す（at でアクセスされていれば 0, 一度もなければ NaN）
+    ブロック×時間ビンの全要素を持つ配列は作らない。各行の最後のアクセスは CSR の indices を
+    at で二分探索して求めるため、メモリは非ゼロ要素数に比例する（ビン毎の値が要るときは at を変えて呼ぶ）
+    """
+    n_blocks, n_bins = access.shape
+    if at is None:
+        at = n_bins - 1
+    csr = access.tocsr(copy=True)
+    csr.eliminate_zeros()
+    csr.sort_indices()
+
+    # 行番号 × n_bins + 列番号は行優先の CSR の並びで昇順になる
+    rows = np.repeat(np.arange(n_blocks, dtype=np.int64), np.diff(csr.indptr))
+    keys = rows * n_bins + csr.indices
+    # 各行で at 以下の最後の非ゼロ要素の位置
+    last = np.searchsorted(keys, np.arange(n_blocks, dtype=np.int64) * n_bins + at, side="right") - 1
+    has_access = last >= csr.indptr[:-1]
 
+    result = np.full(n_blocks, np.nan)
+    result[has_access] = at - csr.indices[last[has_access]]
+    return result
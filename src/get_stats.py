@@ -1,8 +1,12 @@
 import psycopg2
 import csv
-import time
 from datetime import datetime
 
+import scheduler
+
+# 統計情報を取得する間隔（毎分0秒）
+minute_boundary = scheduler.Cron("* * * * *")
+
 def export_query_to_csv(query, csv_filename, conn):
     """
     指定したSQLクエリの結果をCSVファイルに書き出す
@@ -56,11 +60,10 @@ def main():
         )
 
         while True:
-            print("Waiting for 5 minutes...")
-            time.sleep(60)  # 5分待機
-
-            # 5分経過後の終了時刻を取得
-            end_time = datetime.now()
+            # 次の分の区切りまで待機（bench.py のスケジューラと同じ時間軸に揃える）
+            end_time = minute_boundary.next_after(datetime.now())
+            print(f"Waiting until {end_time}...")
+            scheduler.sleep_until(end_time)
 
             # 開始、終了時刻をファイル名用にフォーマット（例: 20230405_120000）
             start_str = start_time.strftime("%Y%m%d_%H%M%S")
@@ -0,0 +1,269 @@
+"""
+SHARDS（空間サンプリング）によるミス率曲線（MRC）の近似計算
+
+- (relfilenode, ブロック番号) のキーをハッシュし、ハッシュ値がしきい値未満のキーだけを
+  reuse_distance.ReuseDistance で追跡する（サンプリング率 R）
+- サンプルでのスタック距離を 1/R 倍して、全体のスタック距離とみなす
+- max_keys を指定した場合は追跡するキー数を上限までに抑え、超えたらしきい値を下げる（固定サイズ SHARDS）
+  - ヒストグラムには各アクセスを記録時のサンプリング率の逆数 1/R で重み付けして加え、ヒット率は重みの合計で割る
+    （しきい値を下げる前の高い率で記録した初期のアクセスを過大に数えないため）
+- 時間窓毎・リレーション毎（relfilenode = 0 は全体）に shared_buffers のサイズとヒット率の曲線を出力し、
+  pg_statio_user_tables で測定した cache_hit_ratio と比較する
+"""
+
+import argparse
+import glob
+import heapq
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import block_log
+import data_format
+import reuse_distance
+
+# PostgreSQL のブロックサイズ
+BLOCK_SIZE = 8192
+
+# ハッシュ値を比較する空間の大きさ（しきい値の分解能）
+HASH_MODULUS = 1 << 24
+
+# 範囲形式のトレースを展開するときの 1 回あたりの最大ブロック数
+EXPAND_LIMIT = 10_000_000
+
+def parse_size(size):
+    """
+    "128MB" のようなサイズ指定をバイト数に変換する
+    """
+    units = {"": 1, "kB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+    match = re.fullmatch(r"\s*(\d+)\s*([kMGT]?B?)\s*", str(size))
+    if not match or match.group(2) not in units:
+        raise ValueError(f"invalid size: {size}")
+    return int(match.group(1)) * units[match.group(2)]
+
+def default_cache_sizes():
+    """
+    1MB から 64GB までの 2 のべき乗のキャッシュサイズ（ブロック数）
+    """
+    return [1 << n for n in range(7, 24)]
+
+def hash_keys(keys):
+    """
+    splitmix64 によるキーのハッシュ（0 <= h < HASH_MODULUS）
+    """
+    z = np.asarray(keys, dtype=np.int64).view(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return (z & np.uint64(HASH_MODULUS - 1)).astype(np.int64)
+
+class ShardsMRC:
+    """
+    SHARDS によるスタック距離のヒストグラムを時間窓・リレーション毎に蓄積する
+    """
+
+    def __init__(self, rate=0.01, max_keys=None):
+        self.threshold = max(1, int(rate * HASH_MODULUS))
+        self.max_keys = max_keys
+        self.engine = reuse_distance.ReuseDistance(capacity=1 << 16)
+        self.heap = []        # 追跡中のキーの (-ハッシュ値, キー)。固定サイズのときだけ使う
+        self.hist = None
+        self.references = 0   # 入力されたアクセス数（サンプリング前）
+
+    @property
+    def rate(self):
+        return self.threshold / HASH_MODULUS
+
+    def _process_fixed_size(self, keys, hashes):
+        """
+        追跡キー数が max_keys を超えたら、ハッシュ値の大きいキーから捨ててしきい値を下げる
+        しきい値が途中で変わるため、1 件ずつ処理する
+        """
+        distances = np.full(len(keys), reuse_distance.COLD, dtype=np.int64)
+        sampled = np.zeros(len(keys), dtype=bool)
+        scale = np.zeros(len(keys), dtype=np.float64)
+        for n, (key, h) in enumerate(zip(keys.tolist(), hashes.tolist())):
+            if h >= self.threshold:
+                continue
+            if key not in self.engine.last:
+                heapq.heappush(self.heap, (-h, key))
+                while len(self.heap) > self.max_keys:
+                    top = -self.heap[0][0]
+                    self.threshold = top
+                    # 同じハッシュ値のキーはまとめて捨てる
+                    while self.heap and -self.heap[0][0] >= top:
+                        _, dropped = heapq.heappop(self.heap)
+                        self.engine.forget(dropped)
+                if h >= self.threshold:
+                    continue
+            distances[n] = self.engine.access(key)
+            sampled[n] = True
+            scale[n] = 1.0 / self.rate
+        return sampled, distances, scale
+
+    def process(self, relfilenode, blocknum, window):
+        """
+        アクセス列（relfilenode, ブロック番号, 時間窓ラベル）を処理する
+        """
+        relfilenode = np.asarray(relfilenode, dtype=np.int64)
+        window = np.asarray(window, dtype=np.int64)
+        keys = block_log.encode_block_key(relfilenode, blocknum)
+        hashes = hash_keys(keys)
+        self.references += len(keys)
+
+        # しきい値は下がる一方なので、現在のしきい値で先に絞り込んでおく
+        idx = np.flatnonzero(hashes < self.threshold)
+        if self.max_keys is None:
+            distances = self.engine.process(keys[idx])
+            scale = np.full(len(idx), 1.0 / self.rate)
+        else:
+            sampled, distances, scale = self._process_fixed_size(keys[idx], hashes[idx])
+            idx, distances, scale = idx[sampled], distances[sampled], scale[sampled]
+
+        scaled = np.where(distances == reuse_distance.COLD, reuse_distance.COLD,
+                          (distances * scale).astype(np.int64))
+        # 1 件のサンプルは全体の 1/R 件のアクセスを表す（固定サイズでは記録時の R で重み付けする）
+        counts = pd.DataFrame({
+            "window": window[idx],
+            "relfilenode": relfilenode[idx],
+            "distance": scaled,
+            "weight": scale,
+        }).groupby(["window", "relfilenode", "distance"])["weight"].sum()
+        self.hist = counts if self.hist is None else self.hist.add(counts, fill_value=0)
+
+    def process_ranges(self, timestamp, relfilenode, min_block, max_block, freq):
+        """
+        ブロック範囲形式のトレース（bpf_read_block.csv や 1 分毎の集計）を
+        ブロック単位に展開して処理する
+        """
+        window = pd.Series(timestamp).dt.floor(freq).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        relfilenode = np.asarray(relfilenode, dtype=np.int64)
+        min_block = np.asarray(min_block, dtype=np.int64)
+        max_block = np.asarray(max_block, dtype=np.int64)
+
+        # 展開後のブロック数が EXPAND_LIMIT 程度になるように行を分割する
+        lengths = np.maximum(max_block - min_block + 1, 0)
+        bounds = np.searchsorted(np.cumsum(lengths), np.arange(EXPAND_LIMIT, lengths.sum(), EXPAND_LIMIT))
+        for rows in np.split(np.arange(len(lengths)), np.unique(bounds)):
+            if len(rows) == 0:
+                continue
+            pos, blocks = block_log.expand_block_ranges(min_block[rows], max_block[rows])
+            self.process(relfilenode[rows][pos], blocks, window[rows][pos])
+
+    def histogram(self):
+        """
+        (window, relfilenode, distance, count) の DataFrame を返す
+        count はサンプルを 1/R で重み付けした、全体でのアクセス数の推定値
+        """
+        if self.hist is None:
+            return pd.DataFrame(columns=["window", "relfilenode", "distance", "count"])
+        return self.hist.rename("count").reset_index()
+
+    def curves(self, cache_sizes=None):
+        """
+        時間窓・リレーション毎（relfilenode = 0 は全体）のヒット率曲線を返す
+        """
+        if cache_sizes is None:
+            cache_sizes = default_cache_sizes()
+        cache_sizes = np.unique(np.asarray(cache_sizes, dtype=np.int64))
+
+        hist = self.histogram()
+        overall = hist.groupby(["window", "distance"], as_index=False)["count"].sum().assign(relfilenode=0)
+        hist = pd.concat([hist, overall], ignore_index=True)
+
+        rows = []
+        for (window, rel), group in hist.groupby(["window", "relfilenode"]):
+            # 重み付きの合計で割る（サンプリング率が変わっても各アクセスの重みは揃う）
+            total = group["count"].sum()
+            warm = group[group["distance"] != reuse_distance.COLD].sort_values("distance")
+            cumulative = np.concatenate([[0], np.cumsum(warm["count"].to_numpy())])
+            # 距離 d のアクセスはサイズ d + 1 以上の LRU キャッシュでヒットする
+            hits = cumulative[np.searchsorted(warm["distance"].to_numpy(), cache_sizes, side="left")]
+            for size, hit in zip(cache_sizes, hits):
+                rows.append((window, rel, size, hit / total))
+
+        df = pd.DataFrame(rows, columns=["window", "relfilenode", "cache_blocks", "hit_ratio"])
+        df["window"] = pd.to_datetime(df["window"])
+        df["shared_buffers_mb"] = df["cache_blocks"] * BLOCK_SIZE / (1024 ** 2)
+        return df
+
+def measured_hit_ratio(data_dir, freq):
+    """
+    pg_statio_user_tables_*.csv から時間窓毎・リレーション毎のキャッシュヒット率を集計する
+    """
+    rows = []
+    for path in glob.glob(os.path.join(data_dir, "pg_statio_user_tables_*.csv")):
+        match = re.search(data_format.pattern, path)
+        if not match:
+            continue
+        df = pd.read_csv(path)
+        start_time = pd.to_datetime(match.group(1), format="%Y%m%d_%H%M%S")
+        rows.append(df[["relname", "heap_blks_hit", "heap_blks_read"]].assign(window=start_time.floor(freq)))
+    if not rows:
+        return pd.DataFrame(columns=["window", "relname", "measured_hit_ratio"])
+
+    df = pd.concat(rows, ignore_index=True)
+    df = df.groupby(["window", "relname"], as_index=False)[["heap_blks_hit", "heap_blks_read"]].sum()
+    df["measured_hit_ratio"] = df["heap_blks_hit"] / (df["heap_blks_hit"] + df["heap_blks_read"])
+    return df[["window", "relname", "measured_hit_ratio"]]
+
+def compare_with_measured(curves, shared_buffers_blocks, data_dir, freq):
+    """
+    実際の shared_buffers のサイズでの推定ヒット率と、測定した cache_hit_ratio を並べる
+    """
+    predicted = curves[curves["cache_blocks"] == shared_buffers_blocks]
+    mapping_df = pd.read_csv(os.path.join(data_dir, "pg_class.csv"))
+    mapping_dict = mapping_df.set_index("relfilenode")["relname"].to_dict()
+    predicted = predicted.assign(relname=predicted["relfilenode"].map(mapping_dict))
+    predicted = predicted.rename(columns={"hit_ratio": "predicted_hit_ratio"})
+
+    measured = measured_hit_ratio(data_dir, freq)
+    return pd.merge(
+        predicted[["window", "relfilenode", "relname", "predicted_hit_ratio"]],
+        measured, on=["window", "relname"], how="left",
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="SHARDS によるミス率曲線を作成する")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--source", choices=["blockread", "read_block", "aggregate"], default="blockread",
+                        help="blockread: bpf_blockread のセグメント, read_block: bpf_read_block.csv（なければ .bin）, "
+                             "aggregate: pipeline の 1 分毎の集計")
+    parser.add_argument("--rate", type=float, default=0.01, help="サンプリング率")
+    parser.add_argument("--max-keys", type=int, default=None, help="追跡するキー数の上限（固定サイズ SHARDS）")
+    parser.add_argument("--window", default="5min", help="曲線を作成する時間窓")
+    parser.add_argument("--shared-buffers", default="128MB", help="測定時の shared_buffers")
+    parser.add_argument("--output", default="../data/mrc.csv")
+    args = parser.parse_args()
+
+    mrc = ShardsMRC(rate=args.rate, max_keys=args.max_keys)
+    if args.source == "blockread":
+        paths = block_log.blockread_segments(args.data_dir)
+        for chunk in block_log.iter_blockread(paths):
+            ts = data_format.monotonic_to_datetime(chunk["timestamp"]).tz_localize(None)
+            window = ts.floor(args.window).to_numpy(dtype="datetime64[ns]").view(np.int64)
+            mrc.process(chunk["relfilenode"], chunk["blocknum"], window)
+    elif args.source == "read_block":
+        for chunk in block_log.iter_read_block_any(block_log.trace_path(args.data_dir, "bpf_read_block")):
+            mrc.process_ranges(chunk["timestamp"], chunk["relfilenode"],
+                               chunk["min_block"], chunk["max_block"], args.window)
+    else:
+        import pipeline
+        agg = pipeline.load_stage("aggregate", args.data_dir)
+        mrc.process_ranges(agg["timestamp"], agg["RelFileNode"], agg["min_block"], agg["max_block"], args.window)
+
+    shared_buffers_blocks = parse_size(args.shared_buffers) // BLOCK_SIZE
+    curves = mrc.curves(default_cache_sizes() + [shared_buffers_blocks])
+    curves.to_csv(args.output, index=False)
+    print(f"sampling rate: {mrc.rate:.6f}, references: {mrc.references}")
+    print(curves[curves["relfilenode"] == 0])
+
+    if os.path.exists(os.path.join(args.data_dir, "pg_class.csv")):
+        comparison = compare_with_measured(curves, shared_buffers_blocks, args.data_dir, args.window)
+        comparison.to_csv(os.path.splitext(args.output)[0] + "_vs_measured.csv", index=False)
+        print(comparison)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""
+shared_buffers のサイズ × ワークロードの組み合わせ × スケールファクタの実験を無人で順に実行する
+
+- 各実験（run）で以下を行う
+  1. スケールファクタが変わったら pgbench -i で初期化する
+  2. pg_ctl でクラスタを停止し、root なら OS のページキャッシュを破棄して、
+     指定した shared_buffers で起動し直す
+  3. ウォームアップ（pgbench のみ）を実行する
+  4. 計測: get_stats.py（統計の収集）と read_block.py（eBPF のトレース, root のみ）を子プロセスで起動し、
+     pgbench と scheduler.py のジョブを実行する。子プロセスが途中で終了したら再起動する
+- pg_ctl は root では実行できないため、root のときは pg_ctl と pgbench をクラスタの所有者（--pg-user,
+  省略時は PGDATA の所有者）として runuser で実行する（drop_caches と read_block.py は root のまま）
+- scheduler.py のジョブがある組み合わせでは、対象のテーブル（large_table1 / large_table2）がなければ
+  最初に bulk_load.py で投入する
+- run 毎に runs/<開始時刻>_<shared_buffers>_<mix>_s<scale>/ を作り、
+  data/（CSV 等）, log/（各プロセスのログ）, manifest.json（設定・ブート時刻・各フェーズの時刻・終了コード・出力ファイル）を置く
+  get_stats.py / read_block.py は ../data に出力するため、run ディレクトリの work/ をカレントディレクトリにして起動する
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import pwd
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import bulk_load
+import pgbench_progress
+import scheduler
+import workload
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PG_BIN = "/home/seinoyu/pgsql/master/bin"
+
+# ワークロードの組み合わせ: pgbench の追加オプションと scheduler.py のジョブ
+MIXES = {
+    "pgbench": {"pgbench": ["-c", "100", "-R", "1000"], "jobs": []},
+    "pgbench+scan": {"pgbench": ["-c", "100", "-R", "1000"], "jobs": scheduler.DEFAULT_JOBS},
+    "select-only": {"pgbench": ["-S", "-c", "100", "-R", "1000"], "jobs": []},
+}
+
+class Supervisor:
+    """
+    子プロセスを起動し、途中で終了したら max_restarts 回まで起動し直す
+    """
+
+    def __init__(self, name, command, cwd, log_path, max_restarts=3):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.log_path = log_path
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.returncodes = []
+        self.proc = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._watch, name=name, daemon=True)
+
+    def _spawn(self):
+        log = open(self.log_path, "a", encoding="utf-8")
+        env = {**os.environ, "PYTHONPATH": SRC_DIR, "PYTHONUNBUFFERED": "1"}
+        self.proc = subprocess.Popen(self.command, cwd=self.cwd, stdout=log, stderr=subprocess.STDOUT, env=env)
+        log.close()
+
+    def _watch(self):
+        while True:
+            returncode = self.proc.wait()
+            if self.stop_event.is_set():
+                return
+            self.returncodes.append(returncode)
+            if self.restarts >= self.max_restarts:
+                logging.error("%s exited with %d, giving up", self.name, returncode)
+                return
+            self.restarts += 1
+            logging.warning("%s exited with %d, restarting (%d)", self.name, returncode, self.restarts)
+            time.sleep(1)
+            self._spawn()
+
+    def start(self):
+        self._spawn()
+        self.thread.start()
+
+    def stop(self, timeout=30):
+        """
+        SIGINT（KeyboardInterrupt）で止め、終わらなければ kill する
+        """
+        self.stop_event.set()
+        if self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGINT)
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+            self.returncodes.append(self.proc.returncode)
+        self.thread.join()
+        return {"restarts": self.restarts, "returncodes": self.returncodes}
+
+# large_table1 / large_table2 がないときに投入する行数（bench.py の custom_rows と同じ）
+LARGE_TABLE_ROWS = 50_000_000
+
+# pg_ctl と pgbench を実行する OS ユーザー（root のときのみ使う。main で設定する）
+cluster_owner = None
+
+def cluster_owner_of(pgdata):
+    return pwd.getpwuid(os.stat(pgdata).st_uid).pw_name
+
+def as_cluster_owner(command):
+    """
+    root なら command をクラスタの所有者として実行するコマンドにする
+    """
+    if os.geteuid() != 0 or cluster_owner is None:
+        return command
+    return ["runuser", "-u", cluster_owner, "--", *command]
+
+def give_to_cluster_owner(path):
+    """
+    root なら所有者として書き込むファイル・ディレクトリ（サーバーログ, pgbench のログ）をクラスタの所有者のものにする
+    """
+    if os.geteuid() != 0 or cluster_owner is None:
+        return
+    if not os.path.exists(path):
+        open(path, "a").close()
+    entry = pwd.getpwnam(cluster_owner)
+    os.chown(path, entry.pw_uid, entry.pw_gid)
+
+def pg_ctl(pgdata, *args):
+    command = as_cluster_owner([os.path.join(PG_BIN, "pg_ctl"), "-D", pgdata, *args])
+    result = subprocess.run(command, capture_output=True, text=True)
+    logging.info("%s: %s", " ".join(args), (result.stdout + result.stderr).strip())
+    return result.returncode
+
+def drop_caches():
+    """
+    OS のページキャッシュを破棄する（root のときのみ）。破棄したかを返す
+    """
+    if os.geteuid() != 0:
+        return False
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+    return True
+
+def restart_cluster(pgdata, shared_buffers, log_path):
+    pg_ctl(pgdata, "-m", "fast", "stop")
+    give_to_cluster_owner(log_path)
+    dropped = drop_caches()
+    returncode = pg_ctl(pgdata, "-w", "-l", log_path, "-o", f"-c shared_buffers={shared_buffers}", "start")
+    if returncode != 0:
+        raise RuntimeError(f"pg_ctl start failed ({returncode})")
+    return dropped
+
+def pgbench_command(*args):
+    return as_cluster_owner([os.path.join(PG_BIN, "pgbench"), "-U", workload.CONN_PARAMS["user"],
+                             "-d", workload.CONN_PARAMS["dbname"], *args])
+
+def ensure_tables(tables, rows=LARGE_TABLE_ROWS):
+    """
+    ジョブの対象テーブルのうち存在しないものを bulk_load.py で投入する。投入したテーブルを返す
+    """
+    driver = workload.Driver(maxconn=1)
+    try:
+        missing = [table for table in tables if driver.execute("SELECT to_regclass(%s)", (table,))[0][0] is None]
+    finally:
+        driver.close()
+    for n, table in enumerate(missing):
+        logging.info("%s does not exist, loading %d rows", table, rows)
+        bulk_load.load_table(table, rows, seed=n)
+    return missing
+
+def run_dirname(config):
+    start = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{start}_{config['shared_buffers']}_{config['mix']}_s{config['scale']}"
+
+def write_manifest(run_dir, manifest):
+    path = os.path.join(run_dir, "manifest.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(path + ".tmp", path)
+
+def run_one(config, runs_dir, pgdata, warmup, duration, progress_interval=60):
+    """
+    1 つの組み合わせを実行し、run ディレクトリのパスを返す
+    """
+    run_dir = os.path.join(runs_dir, run_dirname(config))
+    data_dir = os.path.join(run_dir, "data")
+    log_dir = os.path.join(run_dir, "log")
+    work_dir = os.path.join(run_dir, "work")
+    for path in (data_dir, log_dir, work_dir):
+        os.makedirs(path, exist_ok=True)
+    # pgbench の集計ログは data/ に書かれる
+    give_to_cluster_owner(data_dir)
+
+    mix = MIXES[config["mix"]]
+    # トレースの時刻（bpf_ktime_get_ns: ブート後の ns）を後で日時に変換するためのブート時刻（Unix 時刻）
+    manifest = {"config": config, "mix": mix, "started": datetime.now(), "phases": {},
+                "boot_time": time.time() - time.monotonic()}
+    write_manifest(run_dir, manifest)
+
+    manifest["dropped_caches"] = restart_cluster(pgdata, config["shared_buffers"],
+                                                 os.path.join(log_dir, "postgresql.log"))
+
+    phase_start = datetime.now()
+    returncode = pgbench_progress.run(
+        pgbench_command("-T", str(warmup), "-P", str(progress_interval), "--progress-timestamp", *mix["pgbench"]),
+        os.path.join(data_dir, "pgbench_warmup.csv"))
+    manifest["phases"]["warmup"] = {"start": phase_start, "end": datetime.now(), "returncode": returncode}
+    write_manifest(run_dir, manifest)
+
+    supervisors = [Supervisor("get_stats", [sys.executable, os.path.join(SRC_DIR, "get_stats.py")],
+                              work_dir, os.path.join(log_dir, "get_stats.log"))]
+    if os.geteuid() == 0:
+        supervisors.append(Supervisor("read_block", [sys.executable, os.path.join(SRC_DIR, "read_block.py")],
+                                      work_dir, os.path.join(log_dir, "read_block.log")))
+    else:
+        manifest["tracer"] = "skipped (not root)"
+    for supervisor in supervisors:
+        supervisor.start()
+
+    driver = None
+    jobs = None
+    if mix["jobs"]:
+        driver = workload.Driver(maxconn=scheduler.connections_needed(mix["jobs"]),
+                                 explain_log=os.path.join(log_dir, "explain.jsonl"))
+        jobs = scheduler.Scheduler(driver, mix["jobs"])
+        jobs.start()
+
+    phase_start = datetime.now()
+    try:
+        returncode = pgbench_progress.run(
+            pgbench_command("-T", str(duration), "-P", str(progress_interval), "--progress-timestamp",
+                            *mix["pgbench"], *pgbench_progress.aggregate_args(progress_interval,
+                                                                              os.path.join(data_dir, "pgbench_log"))),
+            os.path.join(data_dir, "pgbench_progress.csv"))
+    finally:
+        if jobs is not None:
+            jobs.stop()
+            driver.close()
+        manifest["processes"] = {s.name: s.stop() for s in supervisors}
+    manifest["phases"]["measure"] = {"start": phase_start, "end": datetime.now(), "returncode": returncode}
+
+    manifest["finished"] = datetime.now()
+    manifest["artifacts"] = {
+        os.path.relpath(os.path.join(root, name), run_dir): os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(run_dir) for name in names if name != "manifest.json"
+    }
+    write_manifest(run_dir, manifest)
+    return run_dir
+
+def main():
+    parser = argparse.ArgumentParser(description="shared_buffers × ワークロード × スケールの実験を順に実行する")
+    parser.add_argument("--pgdata", default=os.environ.get("PGDATA"), required="PGDATA" not in os.environ)
+    parser.add_argument("--runs-dir", default="../runs")
+    parser.add_argument("--shared-buffers", nargs="+", default=["128MB"])
+    parser.add_argument("--mix", nargs="+", choices=sorted(MIXES), default=["pgbench+scan"])
+    parser.add_argument("--scale", nargs="+", type=int, default=[1000])
+    parser.add_argument("--warmup", type=int, default=600, help="ウォームアップの秒数")
+    parser.add_argument("--duration", type=int, default=3600, help="計測の秒数")
+    parser.add_argument("--skip-init", action="store_true", help="pgbench -i を実行しない")
+    parser.add_argument("--pg-user", default=None,
+                        help="root のときに pg_ctl と pgbench を実行するユーザー（省略時は PGDATA の所有者）")
+    parser.add_argument("--large-table-rows", type=int, default=LARGE_TABLE_ROWS,
+                        help="ジョブの対象テーブルがないときに投入する行数")
+    args = parser.parse_args()
+
+    global cluster_owner
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if os.geteuid() == 0:
+        cluster_owner = args.pg_user or cluster_owner_of(args.pgdata)
+        if cluster_owner == "root":
+            parser.error("PGDATA is owned by root; specify the cluster owner with --pg-user")
+        logging.info("running pg_ctl and pgbench as %s", cluster_owner)
+    # 初期化のためにクラスタを起動しておく（起動済みなら何もしない）
+    os.makedirs(args.runs_dir, exist_ok=True)
+    if pg_ctl(args.pgdata, "status") != 0:
+        log_path = os.path.join(args.runs_dir, "postgresql.log")
+        give_to_cluster_owner(log_path)
+        pg_ctl(args.pgdata, "-w", "-l", log_path, "start")
+    initialized_scale = None
+    for scale, shared_buffers, mix in itertools.product(args.scale, args.shared_buffers, args.mix):
+        if not args.skip_init and scale != initialized_scale:
+            subprocess.run(pgbench_command("-i", "-s", str(scale)), check=True)
+            initialized_scale = scale
+        if MIXES[mix]["jobs"]:
+            # スキャンの対象テーブルがないとジョブが失敗し続けるため、計測の前に投入しておく
+            ensure_tables(sorted({job["table"] for job in MIXES[mix]["jobs"]}), args.large_table_rows)
+        config = {"shared_buffers": shared_buffers, "mix": mix, "scale": scale}
+        logging.info("run %s", config)
+        run_dir = run_one(config, args.runs_dir, args.pgdata, args.warmup, args.duration)
+        logging.info("finished %s", run_dir)
+
+if __name__ == '__main__':
+    main()
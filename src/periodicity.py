@@ -0,0 +1,172 @@
+"""
+リレーション毎の周期的なブロックアクセス（定期的なシーケンシャルスキャン）を検出する
+
+- 1 分毎・リレーション毎のアクセス量の系列について、FFT で自己相関を計算し、
+  最も強い周期（例: large_table1 は 15 分, large_table2 は 60 分）を求める
+- 周期で畳み込んだ系列から位相（毎時何分に始まるか）と継続時間、
+  その位相でアクセスされたブロック範囲を求める
+- 次のスキャンの予定時刻とブロック範囲をスケジュールとして出力する（先読み・プリウォーム用）
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import block_log
+
+# スキャン中とみなす位相のしきい値（背景からピークまでの差に対する割合）
+ACTIVE_FRACTION = 0.1
+
+def minute_aggregate_from_read_block(path):
+    """
+    bpf_read_block.csv（.bin も可）を 1 分毎・リレーション毎に集計する
+    アクセス量はクエリ毎のブロック範囲の長さの合計とする
+    """
+    result = None
+    for chunk in block_log.iter_read_block_any(path):
+        chunk = chunk.assign(
+            timestamp=chunk["timestamp"].dt.floor("min"),
+            accesses=chunk["max_block"] - chunk["min_block"] + 1,
+        )
+        agg = chunk.groupby(["timestamp", "relfilenode"]).agg(
+            accesses=("accesses", "sum"),
+            min_block=("min_block", "min"),
+            max_block=("max_block", "max"),
+        )
+        if result is None:
+            result = agg
+        else:
+            # チャンクの境界をまたいだ同じ分の行をまとめ直す
+            result = pd.concat([result, agg]).groupby(level=[0, 1]).agg(
+                {"accesses": "sum", "min_block": "min", "max_block": "max"})
+    if result is None:
+        return pd.DataFrame(columns=["timestamp", "relfilenode", "accesses", "min_block", "max_block"])
+    return result.reset_index()
+
+def autocorrelation(x):
+    """
+    FFT による自己相関（ラグ 0 で 1 に正規化）
+    """
+    x = np.asarray(x, dtype=np.float64)
+    x = x - x.mean()
+    n = len(x)
+    spectrum = np.fft.rfft(x, 2 * n)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    if acf[0] <= 0:
+        return np.zeros(n)
+    # ラグが大きいほど重なりが減る分を補正する
+    return acf / acf[0] * n / (n - np.arange(n))
+
+def detect_period(x, min_period=5, max_period=24 * 60, min_strength=0.3):
+    """
+    自己相関のピークから周期（分）と強さを返す。周期がなければ (None, 強さ)
+    倍数の周期を拾わないように、最大ピークの 9 割以上ある最短のピークを選ぶ
+    """
+    n = len(x)
+    max_period = min(max_period, n // 2)
+    if max_period <= min_period:
+        return None, 0.0
+    acf = autocorrelation(x)
+    lags = np.arange(min_period, max_period + 1)
+    values = acf[lags]
+    # 局所的な極大だけを候補にする
+    is_peak = (values >= acf[lags - 1]) & (values >= acf[np.minimum(lags + 1, n - 1)])
+    if not is_peak.any():
+        return None, 0.0
+    best = values[is_peak].max()
+    if best < min_strength:
+        return None, float(best)
+    period = lags[is_peak & (values >= 0.9 * best)][0]
+    return int(period), float(acf[period])
+
+def detect_schedule(agg, horizon="1D", min_period=5, max_period=24 * 60, min_strength=0.3):
+    """
+    1 分毎の集計（timestamp, relfilenode, accesses, min_block, max_block）から、
+    周期的にアクセスされるリレーションの次回以降のスキャン予定を返す
+    """
+    agg = agg.copy()
+    agg["timestamp"] = pd.to_datetime(agg["timestamp"])
+    start = agg["timestamp"].min()
+    end = agg["timestamp"].max()
+    if pd.isna(start):
+        return pd.DataFrame()
+    # 分単位の通し番号（位相を壁時計に合わせるため epoch からの分）
+    agg["minute"] = (agg["timestamp"] - pd.Timestamp(0)) // pd.Timedelta("1min")
+    first_minute = int(agg["minute"].min())
+    n = int(agg["minute"].max()) - first_minute + 1
+
+    rows = []
+    for rel, group in agg.groupby("relfilenode"):
+        x = np.zeros(n)
+        x[group["minute"].to_numpy() - first_minute] = group["accesses"].to_numpy()
+        period, strength = detect_period(x, min_period, max_period, min_strength)
+        if period is None:
+            continue
+
+        # 周期で畳み込み、位相毎の平均アクセス量を求める
+        phases = (np.arange(n) + first_minute) % period
+        folded = np.bincount(phases, weights=x, minlength=period) / np.bincount(phases, minlength=period)
+        peak = int(np.argmax(folded))
+        # 背景（中央値）よりピークとの差の ACTIVE_FRACTION 以上多い位相をスキャン中とみなし、
+        # ピークを含む連続した区間を前後に広げて、その先頭を位相、長さを継続時間とする
+        baseline = np.median(folded)
+        active = folded > baseline + (folded[peak] - baseline) * ACTIVE_FRACTION
+        phase = peak
+        back = 0
+        while back < period - 1 and active[(phase - 1) % period]:
+            phase = (phase - 1) % period
+            back += 1
+        duration = back + 1
+        while duration < period and active[(phase + duration) % period]:
+            duration += 1
+
+        group_phase = (group["minute"] - phase) % period
+        in_scan = group[group_phase < duration]
+        min_block = int(in_scan["min_block"].min())
+        max_block = int(in_scan["max_block"].max())
+
+        # end 以降 horizon までの予定時刻
+        next_minute = int((end - pd.Timestamp(0)) // pd.Timedelta("1min")) + 1
+        next_minute += (phase - next_minute) % period
+        last_minute = next_minute + int(pd.Timedelta(horizon) / pd.Timedelta("1min"))
+        for minute in range(next_minute, last_minute, period):
+            rows.append({
+                "relfilenode": rel,
+                "scheduled_time": pd.Timestamp(0) + pd.Timedelta(minutes=minute),
+                "period_min": period,
+                "phase_min": phase,
+                "duration_min": duration,
+                "strength": strength,
+                "min_block": min_block,
+                "max_block": max_block,
+            })
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="周期的なスキャンを検出してスケジュールを出力する")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--source", choices=["read_block", "aggregate"], default="read_block",
+                        help="read_block: bpf_read_block.csv（なければ .bin）, aggregate: pipeline の 1 分毎の集計")
+    parser.add_argument("--horizon", default="1D", help="予定を出力する期間")
+    parser.add_argument("--min-strength", type=float, default=0.3, help="周期とみなす自己相関の下限")
+    parser.add_argument("--output", default="../data/scan_schedule.csv")
+    args = parser.parse_args()
+
+    if args.source == "read_block":
+        agg = minute_aggregate_from_read_block(block_log.trace_path(args.data_dir, "bpf_read_block"))
+    else:
+        import pipeline
+        agg = pipeline.load_stage("aggregate", args.data_dir).rename(columns={"RelFileNode": "relfilenode"})
+
+    schedule = detect_schedule(agg, args.horizon, min_strength=args.min_strength)
+    mapping_csv = os.path.join(args.data_dir, "pg_class.csv")
+    if os.path.exists(mapping_csv) and not schedule.empty:
+        mapping_dict = pd.read_csv(mapping_csv).set_index("relfilenode")["relname"].to_dict()
+        schedule.insert(1, "relname", schedule["relfilenode"].map(mapping_dict))
+    schedule.to_csv(args.output, index=False)
+    print(schedule.drop_duplicates("relfilenode") if not schedule.empty else "no periodic access")
+
+if __name__ == '__main__':
+    main()
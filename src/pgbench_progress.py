@@ -0,0 +1,156 @@
+"""
+pgbench を実行しながら進捗行（-P）を 1 行ずつ読み取り、スループットとレイテンシの時系列を CSV に書き出す
+
+- 進捗行（例: progress: 1700000000.123 s, 999.8 tps, lat 5.123 ms stddev 2.345, 0 failed, lag 0.123 ms）は
+  標準エラーに出力されるため、標準出力とまとめて読み、届いた順に CSV に追記する
+  - --progress-timestamp 付きなら Unix 時刻、なければ開始からの経過秒を JST の日時に変換する
+  - 進捗行以外はログに出力する
+- --aggregate-interval を指定すると --log --aggregate-interval のログ（区間毎の件数・合計・2乗和・最小・最大）も出力し、
+  read_aggregate_logs でスレッド毎のファイルをまとめて区間毎の平均・標準偏差を求める
+- 時刻は分単位に丸めて、pipeline の aggregate（1 分毎のバッファの統計）と結合できる
+"""
+
+import argparse
+import csv
+import glob
+import logging
+import re
+import subprocess
+import time
+
+import numpy as np
+import pandas as pd
+
+PROGRESS_PATTERN = re.compile(
+    r"progress: (?P<time>[\d.]+) s, (?P<tps>[\d.]+) tps, "
+    r"lat (?P<latency_avg_ms>[\d.]+|nan) ms stddev (?P<latency_stddev_ms>[\d.]+|nan)"
+    r"(?:, (?P<failed>\d+) failed)?"
+    r"(?:, (?P<retried>\d+) retried, (?P<retries>\d+) retries)?"
+    r"(?:, lag (?P<lag_ms>[\d.]+) ms)?"
+    r"(?:, (?P<skipped>\d+) skipped)?",
+    re.IGNORECASE,
+)
+
+PROGRESS_COLUMNS = ["timestamp", "tps", "latency_avg_ms", "latency_stddev_ms", "lag_ms",
+                    "failed", "retried", "skipped"]
+
+# --aggregate-interval のログの先頭の列（バージョンによらず共通）
+AGGREGATE_COLUMNS = ["interval_start", "num_transactions", "sum_latency", "sum_latency_2",
+                     "min_latency", "max_latency"]
+
+def parse_progress(line, start_time=None):
+    """
+    進捗行を dict にする。進捗行でなければ None
+    start_time は --progress-timestamp なしのときの開始時刻（Unix 時刻）
+    """
+    match = PROGRESS_PATTERN.search(line)
+    if match is None:
+        return None
+    seconds = float(match["time"])
+    if start_time is not None and seconds < 1e9:
+        seconds += start_time
+    timestamp = pd.to_datetime(round(seconds * 1000), unit="ms", utc=True).tz_convert("Asia/Tokyo").tz_localize(None)
+    return {
+        "timestamp": timestamp.isoformat(),
+        "tps": float(match["tps"]),
+        "latency_avg_ms": float(match["latency_avg_ms"]),
+        "latency_stddev_ms": float(match["latency_stddev_ms"]),
+        "lag_ms": float(match["lag_ms"]) if match["lag_ms"] else None,
+        "failed": int(match["failed"]) if match["failed"] else None,
+        "retried": int(match["retried"]) if match["retried"] else None,
+        "skipped": int(match["skipped"]) if match["skipped"] else None,
+    }
+
+def aggregate_args(interval, log_prefix):
+    """
+    区間毎の集計ログを出力するための pgbench のオプション
+    """
+    return ["--log", f"--aggregate-interval={interval}", f"--log-prefix={log_prefix}"]
+
+def run(command, output):
+    """
+    pgbench を実行し、進捗行を届いた順に output の CSV に書き出す。終了コードを返す
+    """
+    start_time = time.time()
+    with open(output, "w", newline="", encoding="utf-8") as f, \
+            subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             text=True, bufsize=1) as proc:
+        writer = csv.DictWriter(f, fieldnames=PROGRESS_COLUMNS)
+        writer.writeheader()
+        for line in proc.stdout:
+            record = parse_progress(line, start_time)
+            if record is None:
+                logging.info("%s", line.rstrip())
+                continue
+            writer.writerow(record)
+            f.flush()
+    if proc.returncode != 0:
+        logging.error("pgbench exited with %d", proc.returncode)
+    return proc.returncode
+
+def read_progress(path):
+    return pd.read_csv(path, parse_dates=["timestamp"])
+
+def read_aggregate_logs(log_prefix):
+    """
+    --aggregate-interval のログ（スレッド毎のファイル）をまとめ、区間毎のレイテンシ（ms）を返す
+    """
+    frames = []
+    for path in sorted(glob.glob(f"{log_prefix}.*")):
+        df = pd.read_csv(path, sep=" ", header=None)
+        df = df.iloc[:, :len(AGGREGATE_COLUMNS)]
+        df.columns = AGGREGATE_COLUMNS
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["timestamp", "transactions", "latency_avg_ms", "latency_stddev_ms",
+                                     "latency_min_ms", "latency_max_ms"])
+
+    df = pd.concat(frames, ignore_index=True)
+    agg = df.groupby("interval_start").agg(
+        transactions=("num_transactions", "sum"),
+        sum_latency=("sum_latency", "sum"),
+        sum_latency_2=("sum_latency_2", "sum"),
+        latency_min_ms=("min_latency", "min"),
+        latency_max_ms=("max_latency", "max"),
+    ).reset_index()
+
+    # レイテンシはマイクロ秒
+    n = agg["transactions"].where(agg["transactions"] > 0)
+    mean = agg["sum_latency"] / n
+    agg["latency_avg_ms"] = mean / 1000
+    agg["latency_stddev_ms"] = np.sqrt(np.maximum(agg["sum_latency_2"] / n - mean ** 2, 0)) / 1000
+    agg["latency_min_ms"] /= 1000
+    agg["latency_max_ms"] /= 1000
+    agg["timestamp"] = pd.to_datetime(agg["interval_start"], unit="s", utc=True) \
+        .dt.tz_convert("Asia/Tokyo").dt.tz_localize(None)
+    return agg[["timestamp", "transactions", "latency_avg_ms", "latency_stddev_ms",
+                "latency_min_ms", "latency_max_ms"]]
+
+def per_minute(progress):
+    """
+    進捗の時系列を 1 分毎に平均する（pipeline の aggregate の timestamp と結合できる）
+    """
+    progress = progress.assign(timestamp=progress["timestamp"].dt.floor("min"))
+    return progress.groupby("timestamp").mean(numeric_only=True).reset_index()
+
+def main():
+    parser = argparse.ArgumentParser(description="pgbench の進捗を CSV の時系列として記録する")
+    parser.add_argument("--output", default="../data/pgbench_progress.csv")
+    parser.add_argument("--aggregate-interval", type=int, default=None,
+                        help="指定すると --log --aggregate-interval のログも出力する（秒）")
+    parser.add_argument("--log-prefix", default="../data/pgbench_log")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="pgbench のコマンドライン（-P を含める）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    command = [arg for arg in args.command if arg != "--"]
+    if args.aggregate_interval:
+        command += aggregate_args(args.aggregate_interval, args.log_prefix)
+    run(command, args.output)
+
+    print(per_minute(read_progress(args.output)).describe())
+    if args.aggregate_interval:
+        print(read_aggregate_logs(args.log_prefix).describe())
+
+if __name__ == '__main__':
+    main()
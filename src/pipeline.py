@@ -0,0 +1,250 @@
+"""
+../data 配下の解析パイプラインを差分実行する
+
+- parse -> catalog -> aggregate -> features の各ステージの結果を
+  ../data/.pipeline にキャッシュ（pickle 形式）する
+- 入力ファイルのパス・サイズ・mtime・内容ハッシュと、各ステージの出力を
+  manifest.json に記録し、入力が変化したステージ（とその下流）だけを再計算する
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import block_log
+import data_format
+import feature_engineering
+
+DATA_DIR = "../data"
+CACHE_DIRNAME = ".pipeline"
+MANIFEST_FILENAME = "manifest.json"
+
+# ハッシュ計算時の読み込み単位
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# ステージの実装を変更した場合はここを上げてキャッシュを無効化する
+PIPELINE_VERSION = 3
+
+def file_fingerprint(path, previous=None):
+    """
+    入力ファイルのパス・サイズ・mtime・内容ハッシュを返す
+    サイズと mtime が前回と同じ場合はハッシュの再計算を省略する
+    """
+    st = os.stat(path)
+    if previous and previous["size"] == st.st_size and previous["mtime"] == st.st_mtime_ns:
+        return previous
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return {"path": path, "size": st.st_size, "mtime": st.st_mtime_ns, "sha256": h.hexdigest()}
+
+def load_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {"version": PIPELINE_VERSION, "inputs": {}, "stages": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != PIPELINE_VERSION:
+        return {"version": PIPELINE_VERSION, "inputs": {}, "stages": {}}
+    return manifest
+
+def save_manifest(cache_dir, manifest):
+    # 書き込み途中で落ちても manifest が壊れないように rename で置き換える
+    path = os.path.join(cache_dir, MANIFEST_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+# ---------------------------------------------------------------------------
+# ステージの実装
+# ---------------------------------------------------------------------------
+
+def stage_parse(paths, upstream):
+    """
+    data.txt（Timestamp: PID: RelFileNode: BlockNum: 形式）を読み込み、
+    タイムスタンプを日時に変換する
+    """
+    chunks = [chunk for path in paths for chunk in block_log.iter_block_log(path)]
+    if chunks:
+        arr = np.concatenate(chunks)
+    else:
+        arr = np.empty(0, dtype=block_log.BLOCK_LOG_DTYPE)
+    df = pd.DataFrame(arr)
+    return data_format.data_format(df)
+
+def stage_catalog(paths, upstream):
+    """
+    pg_class.csv を使って RelFileNode に relname を付与する
+    """
+    df = upstream["parse"].copy()
+    if paths:
+        mapping_df = pd.read_csv(paths[0])
+        mapping_dict = mapping_df.set_index("relfilenode")["relname"].to_dict()
+        df["relname"] = df["RelFileNode"].map(mapping_dict)
+    else:
+        df["relname"] = None
+    return df
+
+def stage_aggregate(paths, upstream):
+    """
+    1分毎・リレーション毎にアクセス数とブロック範囲を集計し、
+    同じ期間の pg_statio_user_tables のキャッシュヒット率と結合する
+    """
+    df = upstream["catalog"]
+    minute = df["Timestamp"].dt.tz_localize(None).dt.floor("min")
+    result = df.assign(timestamp=minute).groupby(["timestamp", "RelFileNode"]).agg(
+        relname=("relname", "first"),
+        accesses=("BlockNum", "size"),
+        distinct_blocks=("BlockNum", "nunique"),
+        min_block=("BlockNum", "min"),
+        max_block=("BlockNum", "max"),
+    ).reset_index()
+
+    cache_list = []
+    for path in paths:
+        match = re.search(data_format.pattern, path)
+        if not match:
+            continue
+        cache_df = pd.read_csv(path)
+        # 取得期間の開始時刻を分単位に丸めて結合キーにする
+        start_time = pd.to_datetime(match.group(1), format="%Y%m%d_%H%M%S").floor("min")
+        cache_df = cache_df[["relname", "heap_blks_hit", "heap_blks_read", "cache_hit_ratio"]]
+        cache_list.append(cache_df.assign(timestamp=start_time))
+
+    if cache_list:
+        cache_all = pd.concat(cache_list, ignore_index=True)
+        result = pd.merge(result, cache_all, on=["timestamp", "relname"], how="left")
+    return result.sort_values(["timestamp", "RelFileNode"]).reset_index(drop=True)
+
+def stage_features(paths, upstream):
+    """
+    ブロック×時間の特徴量を作成する（疎行列, ブロックキー, 時刻特徴量）
+    """
+    return feature_engineering.sparse_feature_engineering(upstream["catalog"])
+
+# 各ステージ: 入力ファイル（DATA_DIR からの glob パターン）と上流ステージ
+STAGES = [
+    {"name": "parse",     "inputs": ["data.txt"],                      "depends": [],          "func": stage_parse},
+    {"name": "catalog",   "inputs": ["pg_class.csv"],                  "depends": ["parse"],   "func": stage_catalog},
+    {"name": "aggregate", "inputs": ["pg_statio_user_tables_*.csv"],   "depends": ["catalog"], "func": stage_aggregate},
+    {"name": "features",  "inputs": [],                                "depends": ["catalog"], "func": stage_features},
+]
+
+# ---------------------------------------------------------------------------
+# 実行
+# ---------------------------------------------------------------------------
+
+def stage_key(stage, fingerprints, upstream_keys):
+    """
+    ステージの入力（ファイルの内容ハッシュと上流ステージのキー）から
+    キャッシュの識別子を計算する
+    """
+    h = hashlib.sha256()
+    h.update(f"{PIPELINE_VERSION}:{stage['name']}".encode())
+    for fp in fingerprints:
+        h.update(f"{fp['path']}:{fp['sha256']}".encode())
+    for key in upstream_keys:
+        h.update(key.encode())
+    return h.hexdigest()
+
+def run(data_dir=DATA_DIR, force=False, stages=None):
+    """
+    入力が変化したステージだけを再計算し、各ステージの出力パスを返す
+    stages を指定した場合は、そのステージ（と必要な上流）までを実行する
+    """
+    cache_dir = os.path.join(data_dir, CACHE_DIRNAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = load_manifest(cache_dir)
+
+    if stages is not None:
+        # 指定されたステージが依存する上流ステージも含める
+        wanted = set()
+        todo = list(stages)
+        by_name = {s["name"]: s for s in STAGES}
+        while todo:
+            name = todo.pop()
+            if name not in wanted:
+                wanted.add(name)
+                todo.extend(by_name[name]["depends"])
+    else:
+        wanted = {s["name"] for s in STAGES}
+
+    keys = {}
+    loaded = {}
+
+    def load(name):
+        if name not in loaded:
+            loaded[name] = pd.read_pickle(manifest["stages"][name]["output"])
+        return loaded[name]
+
+    for stage in STAGES:
+        name = stage["name"]
+        if name not in wanted:
+            continue
+
+        paths = sorted(p for pattern in stage["inputs"] for p in glob.glob(os.path.join(data_dir, pattern)))
+        fingerprints = []
+        for path in paths:
+            fp = file_fingerprint(path, manifest["inputs"].get(path))
+            manifest["inputs"][path] = fp
+            fingerprints.append(fp)
+
+        key = stage_key(stage, fingerprints, [keys[d] for d in stage["depends"]])
+        keys[name] = key
+
+        entry = manifest["stages"].get(name)
+        if not force and entry and entry["key"] == key and os.path.exists(entry["output"]):
+            print(f"[{name}] up to date")
+            continue
+
+        print(f"[{name}] running ({len(paths)} input files)")
+        result = stage["func"](paths, {d: load(d) for d in stage["depends"]})
+        output = os.path.join(cache_dir, f"{name}.pkl")
+        pd.to_pickle(result, output)
+        loaded[name] = result
+
+        manifest["stages"][name] = {
+            "key": key,
+            "inputs": paths,
+            "depends": stage["depends"],
+            "output": output,
+        }
+        save_manifest(cache_dir, manifest)
+
+    # 入力から消えたファイルは manifest からも削除する
+    for path in list(manifest["inputs"]):
+        if not os.path.exists(path):
+            del manifest["inputs"][path]
+    save_manifest(cache_dir, manifest)
+
+    return {name: manifest["stages"][name]["output"] for name in keys}
+
+def load_stage(name, data_dir=DATA_DIR):
+    """
+    キャッシュ済みのステージ出力を読み込む（必要なら再計算する）
+    """
+    outputs = run(data_dir, stages=[name])
+    return pd.read_pickle(outputs[name])
+
+def main():
+    parser = argparse.ArgumentParser(description="解析パイプラインを差分実行する")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--force", action="store_true", help="キャッシュを無視して全ステージを再計算する")
+    parser.add_argument("--stage", action="append", help="実行するステージ（複数指定可）")
+    args = parser.parse_args()
+
+    outputs = run(args.data_dir, force=args.force, stages=args.stage)
+    for name, output in outputs.items():
+        print(f"{name}: {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,482 @@
+"""
+置換ポリシーを差し替えてブロックトレースを再生するシミュレーションフレームワーク
+
+- Policy を継承したクラスで access(key, relfilenode) -> ヒットしたか を実装する
+- LRU, 2Q, ARC, LIRS, LRU-2 と、上限としての Belady の OPT を用意する
+  （LRU-2 と OPT はヒープを使うため 1 アクセス O(log n)、その他は O(1)）
+- clock-sweep (clock_sweep.ClockSweep) もポリシーとして並べて比較できる
+- replay() は 1 回のトレース走査で全ポリシーを同時に再生し、リレーション毎の結果を表にする
+"""
+
+import argparse
+import heapq
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import block_log
+import clock_sweep
+import mrc
+
+# replay() で一度に Python のリストへ変換するアクセス数
+REPLAY_CHUNK = 1_000_000
+
+class Policy:
+    """
+    置換ポリシーの基底クラス。size はキャッシュのブロック数
+    """
+
+    name = None
+
+    def __init__(self, size):
+        self.size = size
+
+    def prepare(self, keys):
+        """
+        再生前にトレース全体を受け取る（将来のアクセスを使う OPT 用）
+        """
+
+    def access(self, key, relfilenode=None):
+        """
+        1 ブロックにアクセスし、ヒットしたかを返す
+        """
+        raise NotImplementedError
+
+class LRUPolicy(Policy):
+    name = "lru"
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.cache = OrderedDict()
+
+    def access(self, key, relfilenode=None):
+        cache = self.cache
+        if key in cache:
+            cache.move_to_end(key)
+            return True
+        cache[key] = None
+        if len(cache) > self.size:
+            cache.popitem(last=False)
+        return False
+
+class TwoQPolicy(Policy):
+    """
+    2Q (Johnson & Shasha)。A1in (FIFO), A1out (追い出し履歴), Am (LRU) の 3 つのキューを持つ
+    """
+
+    name = "2q"
+
+    def __init__(self, size, kin=0.25, kout=0.5):
+        super().__init__(size)
+        self.kin = max(1, int(size * kin))
+        self.kout = max(1, int(size * kout))
+        self.a1in = OrderedDict()
+        self.a1out = OrderedDict()
+        self.am = OrderedDict()
+
+    def access(self, key, relfilenode=None):
+        if key in self.am:
+            self.am.move_to_end(key)
+            return True
+        if key in self.a1in:
+            return True
+
+        if len(self.a1in) + len(self.am) >= self.size:
+            if len(self.a1in) > self.kin or not self.am:
+                old, _ = self.a1in.popitem(last=False)
+                self.a1out[old] = None
+                if len(self.a1out) > self.kout:
+                    self.a1out.popitem(last=False)
+            else:
+                self.am.popitem(last=False)
+
+        if key in self.a1out:
+            del self.a1out[key]
+            self.am[key] = None
+        else:
+            self.a1in[key] = None
+        return False
+
+class ARCPolicy(Policy):
+    """
+    ARC (Megiddo & Modha)。T1/T2 に実データ、B1/B2 に追い出し履歴を持ち、T1 の目標サイズ p を適応させる
+    """
+
+    name = "arc"
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.p = 0
+        self.t1 = OrderedDict()
+        self.t2 = OrderedDict()
+        self.b1 = OrderedDict()
+        self.b2 = OrderedDict()
+
+    def _replace(self, in_b2):
+        if self.t1 and (len(self.t1) > self.p or (in_b2 and len(self.t1) == self.p) or not self.t2):
+            old, _ = self.t1.popitem(last=False)
+            self.b1[old] = None
+        else:
+            old, _ = self.t2.popitem(last=False)
+            self.b2[old] = None
+
+    def access(self, key, relfilenode=None):
+        c = self.size
+        if key in self.t1:
+            del self.t1[key]
+            self.t2[key] = None
+            return True
+        if key in self.t2:
+            self.t2.move_to_end(key)
+            return True
+
+        if key in self.b1:
+            self.p = min(c, self.p + max(len(self.b2) // len(self.b1), 1))
+            self._replace(False)
+            del self.b1[key]
+            self.t2[key] = None
+            return False
+        if key in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) // len(self.b2), 1))
+            self._replace(True)
+            del self.b2[key]
+            self.t2[key] = None
+            return False
+
+        l1 = len(self.t1) + len(self.b1)
+        if l1 == c:
+            if len(self.t1) < c:
+                self.b1.popitem(last=False)
+                self._replace(False)
+            else:
+                self.t1.popitem(last=False)
+        elif l1 < c:
+            total = l1 + len(self.t2) + len(self.b2)
+            if total >= c:
+                if total == 2 * c:
+                    self.b2.popitem(last=False)
+                self._replace(False)
+        self.t1[key] = None
+        return False
+
+class LIRSPolicy(Policy):
+    """
+    LIRS (Jiang & Zhang)。再参照間隔の短いブロック (LIR) を優先して残す
+    スタック S と、常駐している HIR ブロックのキュー Q を持つ
+    非常駐の HIR ブロックの履歴は size 件までに制限する
+    """
+
+    name = "lirs"
+
+    LIR = 0
+    HIR = 1
+    NONRES = 2
+
+    def __init__(self, size, hir_ratio=0.01):
+        if size < 2:
+            raise ValueError(f"LIRS needs at least 2 buffers (1 LIR + 1 HIR), got {size}")
+        super().__init__(size)
+        # LIR と常駐 HIR を合わせてちょうど size 個にする
+        self.hir_size = min(size - 1, max(1, int(size * hir_ratio)))
+        self.lir_size = size - self.hir_size
+        self.stack = OrderedDict()   # S（末尾が最新）
+        self.queue = OrderedDict()   # Q（先頭から追い出す）
+        self.status = {}
+        self.nonres = OrderedDict()  # 非常駐の HIR ブロック（古い順）
+        self.lir_count = 0
+
+    def _prune(self):
+        """
+        S の底が LIR になるまで HIR ブロックを取り除く
+        """
+        stack = self.stack
+        while stack:
+            bottom = next(iter(stack))
+            state = self.status[bottom]
+            if state == self.LIR:
+                break
+            del stack[bottom]
+            if state == self.NONRES:
+                del self.status[bottom]
+                del self.nonres[bottom]
+
+    def _demote_bottom(self):
+        """
+        S の底の LIR ブロックを常駐 HIR にして Q の末尾へ移す
+        """
+        bottom, _ = self.stack.popitem(last=False)
+        self.status[bottom] = self.HIR
+        self.queue[bottom] = None
+        self.lir_count -= 1
+        self._prune()
+
+    def access(self, key, relfilenode=None):
+        state = self.status.get(key)
+        stack = self.stack
+
+        if state == self.LIR:
+            was_bottom = next(iter(stack)) == key
+            stack.move_to_end(key)
+            if was_bottom:
+                self._prune()
+            return True
+
+        if state == self.HIR:
+            if key in stack:
+                stack.move_to_end(key)
+                del self.queue[key]
+                self.status[key] = self.LIR
+                self.lir_count += 1
+                self._demote_bottom()
+            else:
+                stack[key] = None
+                self.queue.move_to_end(key)
+            return True
+
+        # ミス: 常駐ブロックが満杯なら Q の先頭（常駐 HIR）を追い出す
+        if self.lir_count + len(self.queue) >= self.size and self.queue:
+            old, _ = self.queue.popitem(last=False)
+            if old in stack:
+                self.status[old] = self.NONRES
+                self.nonres[old] = None
+                if len(self.nonres) > self.size:
+                    oldest, _ = self.nonres.popitem(last=False)
+                    del stack[oldest]
+                    del self.status[oldest]
+            else:
+                del self.status[old]
+            # 履歴の上限で key 自身が S から消えている場合がある
+            state = self.status.get(key)
+
+        if self.lir_count < self.lir_size:
+            # 起動直後は LIR が埋まるまで LIR として受け入れる
+            if state == self.NONRES:
+                del self.nonres[key]
+            stack[key] = None
+            stack.move_to_end(key)
+            self.status[key] = self.LIR
+            self.lir_count += 1
+        elif state == self.NONRES:
+            del self.nonres[key]
+            stack.move_to_end(key)
+            self.status[key] = self.LIR
+            self.lir_count += 1
+            self._demote_bottom()
+        else:
+            stack[key] = None
+            self.queue[key] = None
+            self.status[key] = self.HIR
+        return False
+
+class LRU2Policy(Policy):
+    """
+    LRU-K (K = 2)。最後から 2 番目のアクセスが最も古いブロックを追い出す
+    1 回しかアクセスされていないブロックは（-inf とみなして）LRU 順に先に追い出す
+    追い出したブロックの最終アクセス時刻は size 件まで保持する
+    """
+
+    name = "lru2"
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.clock = 0
+        self.once = OrderedDict()   # 1 回だけアクセスされた常駐ブロック
+        self.heap = []              # (最後から 2 番目のアクセス時刻, キー)
+        self.penultimate = {}       # 2 回以上アクセスされた常駐ブロック -> 最後から 2 番目のアクセス時刻
+        self.last = {}              # 常駐ブロック -> 最後のアクセス時刻
+        self.history = OrderedDict()
+
+    def _evict(self):
+        if self.once:
+            old, _ = self.once.popitem(last=False)
+        else:
+            while True:
+                t, old = heapq.heappop(self.heap)
+                if self.penultimate.get(old) == t:
+                    break
+            del self.penultimate[old]
+        self.history[old] = self.last.pop(old)
+        if len(self.history) > self.size:
+            self.history.popitem(last=False)
+
+    def _push(self, key, penultimate):
+        self.penultimate[key] = penultimate
+        heapq.heappush(self.heap, (penultimate, key))
+        # 無効なエントリが溜まりすぎたらヒープを作り直す
+        if len(self.heap) > 4 * self.size:
+            self.heap = [(t, k) for k, t in self.penultimate.items()]
+            heapq.heapify(self.heap)
+
+    def access(self, key, relfilenode=None):
+        self.clock += 1
+        now = self.clock
+        prev = self.last.get(key)
+        if prev is not None:
+            self.once.pop(key, None)
+            self._push(key, prev)
+            self.last[key] = now
+            return True
+
+        if len(self.last) >= self.size:
+            self._evict()
+        prev = self.history.pop(key, None)
+        if prev is None:
+            self.once[key] = None
+        else:
+            self._push(key, prev)
+        self.last[key] = now
+        return False
+
+def next_use(keys):
+    """
+    各アクセスについて、同じキーが次にアクセスされる位置を返す（なければ len(keys)）
+    """
+    keys = np.asarray(keys)
+    n = len(keys)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    result = np.full(n, n, dtype=np.int64)
+    same = sorted_keys[1:] == sorted_keys[:-1]
+    result[order[:-1][same]] = order[1:][same]
+    return result
+
+class OptPolicy(Policy):
+    """
+    Belady の OPT。次のアクセスが最も遠いブロックを追い出す（ヒット率の上限）
+    """
+
+    name = "opt"
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.next = None
+        self.pos = 0
+        self.cache = {}   # キー -> 次のアクセス位置
+        self.heap = []    # (-次のアクセス位置, キー)
+
+    def prepare(self, keys):
+        self.next = next_use(keys)
+        self.pos = 0
+
+    def access(self, key, relfilenode=None):
+        nxt = int(self.next[self.pos])
+        self.pos += 1
+        hit = key in self.cache
+        if not hit and len(self.cache) >= self.size:
+            while True:
+                neg, old = heapq.heappop(self.heap)
+                if self.cache.get(old) == -neg:
+                    break
+            del self.cache[old]
+        self.cache[key] = nxt
+        heapq.heappush(self.heap, (-nxt, key))
+        if len(self.heap) > 4 * self.size:
+            self.heap = [(-t, k) for k, t in self.cache.items()]
+            heapq.heapify(self.heap)
+        return hit
+
+class ClockSweepPolicy(Policy):
+    """
+    clock_sweep.ClockSweep をポリシーとして使うためのラッパー（比較の基準）
+    """
+
+    name = "clock"
+
+    def __init__(self, size, ring_relations=None):
+        super().__init__(size)
+        self.sim = clock_sweep.ClockSweep(size, ring_relations)
+
+    def access(self, key, relfilenode=None):
+        return self.sim.access(key, relfilenode)[0]
+
+POLICIES = {
+    policy.name: policy
+    for policy in [ClockSweepPolicy, LRUPolicy, TwoQPolicy, ARCPolicy, LIRSPolicy, LRU2Policy, OptPolicy]
+}
+
+def replay(keys, relfilenode, policies, chunk_size=REPLAY_CHUNK):
+    """
+    1 回のトレース走査で全ポリシーを再生し、
+    ポリシー毎・リレーション毎（relfilenode = 0 は全体）のヒット数を返す
+    keys, relfilenode は np.memmap でもよい（chunk_size 毎に読み込んで集計する）
+    """
+    for policy in policies:
+        policy.prepare(keys)
+
+    counts = [None] * len(policies)
+    accessors = [policy.access for policy in policies]
+    for start in range(0, len(keys), chunk_size):
+        chunk_keys = np.asarray(keys[start:start + chunk_size], dtype=np.int64)
+        chunk_rel = np.asarray(relfilenode[start:start + chunk_size], dtype=np.int64)
+        hits = [np.zeros(len(chunk_keys), dtype=bool) for _ in policies]
+        for n, (key, rel) in enumerate(zip(chunk_keys.tolist(), chunk_rel.tolist())):
+            for hit, access in zip(hits, accessors):
+                hit[n] = access(key, rel)
+
+        for i, hit in enumerate(hits):
+            df = pd.DataFrame({"relfilenode": chunk_rel, "hits": hit, "accesses": 1})
+            per_rel = df.groupby("relfilenode")[["hits", "accesses"]].sum()
+            counts[i] = per_rel if counts[i] is None else counts[i].add(per_rel, fill_value=0)
+
+    rows = []
+    for policy, per_rel in zip(policies, counts):
+        if per_rel is None:
+            per_rel = pd.DataFrame(columns=["hits", "accesses"], index=pd.Index([], name="relfilenode"))
+        per_rel = per_rel.astype(np.int64).reset_index()
+        overall = pd.DataFrame({"relfilenode": [0], "hits": [per_rel["hits"].sum()],
+                                "accesses": [per_rel["accesses"].sum()]})
+        result = pd.concat([overall, per_rel], ignore_index=True)
+        result.insert(0, "cache_blocks", policy.size)
+        result.insert(0, "policy", policy.name)
+        rows.append(result)
+
+    result = pd.concat(rows, ignore_index=True)
+    result["misses"] = result["accesses"] - result["hits"]
+    result["hit_ratio"] = result["hits"] / result["accesses"]
+    return result
+
+def load_trace(data_dir):
+    """
+    bpf_blockread のセグメントをすべて読み込み、(キー, relfilenode) を返す
+    """
+    chunks = list(block_log.iter_blockread(block_log.blockread_segments(data_dir)))
+    if chunks:
+        trace = np.concatenate(chunks)
+    else:
+        trace = np.empty(0, dtype=block_log.BLOCKREAD_DTYPE)
+    return block_log.encode_block_key(trace["relfilenode"], trace["blocknum"]), trace["relfilenode"]
+
+def main():
+    parser = argparse.ArgumentParser(description="置換ポリシー毎に bpf_blockread を再生して比較する")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--shared-buffers", action="append", default=[], help="キャッシュサイズ（複数指定可）")
+    parser.add_argument("--policy", action="append", choices=sorted(POLICIES), default=[],
+                        help="比較するポリシー（省略時はすべて）")
+    parser.add_argument("--ring", action="append", default=[],
+                        help="clock でリングバッファを使うリレーション（relname または relfilenode）")
+    parser.add_argument("--output", default="../data/policies.csv")
+    args = parser.parse_args()
+
+    sizes = [mrc.parse_size(size) // mrc.BLOCK_SIZE for size in (args.shared_buffers or ["128MB"])]
+    names = args.policy or list(POLICIES)
+    ring_buffers = clock_sweep.BULKREAD_RING_SIZE // mrc.BLOCK_SIZE
+    ring_relations = {rel: ring_buffers for rel in clock_sweep.resolve_relations(args.ring, args.data_dir)}
+
+    policies = []
+    for size in sizes:
+        for name in names:
+            if name == "clock":
+                policies.append(ClockSweepPolicy(size, ring_relations))
+            else:
+                policies.append(POLICIES[name](size))
+
+    keys, relfilenode = load_trace(args.data_dir)
+    result = replay(keys, relfilenode, policies)
+    result.to_csv(args.output, index=False)
+
+    overall = result[result["relfilenode"] == 0]
+    print(overall.pivot(index="policy", columns="cache_blocks", values="hit_ratio"))
+
+if __name__ == '__main__':
+    main()
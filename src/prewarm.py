@@ -0,0 +1,302 @@
+"""
+periodicity.py のスキャン予定（scan_schedule.csv）に従って、スキャンの少し前にブロックを読み込んでおく
+
+- 予定時刻の lead 秒前に、ブロック範囲を chunk ブロックずつに分けて読み込む
+  - buffer: pg_prewarm(regclass, 'buffer', 'main', first, last) で shared_buffers に読み込む
+  - fadvise: リレーションのファイルに posix_fadvise(WILLNEED) を発行して OS のページキャッシュに読み込む
+    （DB サーバー上で実行する必要がある）
+- 読み込み量はトークンバケットで I/O 予算（バイト/秒）に制限する
+- 読み込みは ThreadedConnectionPool の接続を使い、スレッドプールでワークロードと並行に実行する
+- 実行中は pg_statio_user_tables と pg_stat_statements を定期的に記録し、
+  リレーション毎のヒット率とクエリの平均実行時間の変化を確認できるようにする
+  （効果は --mode none で記録だけした場合と比較する）
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+import mrc
+import workload
+
+# 1 セグメントファイルあたりのブロック数（RELSEG_SIZE: 1GB / 8kB）
+RELSEG_SIZE = 131072
+
+PREWARM_QUERY = (
+    "SELECT pg_prewarm(c.oid, 'buffer', 'main', %(first)s, "
+    "LEAST(%(last)s, pg_relation_size(c.oid) / current_setting('block_size')::int - 1)) "
+    "FROM pg_class c "
+    "WHERE c.relfilenode = %(relfilenode)s "
+    "AND %(first)s < pg_relation_size(c.oid) / current_setting('block_size')::int;"
+)
+
+FILEPATH_QUERY = (
+    "SELECT current_setting('data_directory') || '/' || pg_relation_filepath(c.oid) "
+    "FROM pg_class c WHERE c.relfilenode = %s;"
+)
+
+STATIO_QUERY = "SELECT relname, heap_blks_hit, heap_blks_read FROM pg_statio_user_tables;"
+
+STATEMENTS_QUERY = (
+    "SELECT queryid, calls, total_exec_time, shared_blks_hit, shared_blks_read "
+    "FROM pg_stat_statements;"
+)
+
+class TokenBucket:
+    """
+    バイト/秒の I/O 予算を守るトークンバケット（スレッドセーフ）
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount):
+        """
+        amount バイト分のトークンが溜まるまで待って消費する
+        容量より大きい要求は、容量分溜まった時点で借りとして通す
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+def load_schedule(path, lead):
+    """
+    スキャン予定を読み込み、読み込み開始時刻（予定時刻の lead 秒前）の順に並べる
+    """
+    schedule = pd.read_csv(path, parse_dates=["scheduled_time"])
+    schedule["fire_time"] = schedule["scheduled_time"] - pd.Timedelta(seconds=lead)
+    return schedule.sort_values("fire_time").reset_index(drop=True)
+
+def split_range(min_block, max_block, chunk_blocks):
+    """
+    ブロック範囲を chunk_blocks ずつの (first, last) に分割する
+    """
+    return [(first, min(first + chunk_blocks - 1, max_block))
+            for first in range(min_block, max_block + 1, chunk_blocks)]
+
+class Prewarmer:
+    """
+    スキャン予定の 1 件分の読み込みを、プールの接続を使って実行する
+    """
+
+    def __init__(self, pool, bucket, mode="buffer", chunk_blocks=1024):
+        self.pool = pool
+        self.bucket = bucket
+        self.mode = mode
+        self.chunk_blocks = chunk_blocks
+        self.filepaths = {}
+        self.log = []
+        self.log_lock = threading.Lock()
+
+    def _query(self, query, params):
+        conn = self.pool.getconn()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                row = cur.fetchone()
+            return row[0] if row else None
+        finally:
+            self.pool.putconn(conn)
+
+    def _fadvise(self, relfilenode, first, last):
+        """
+        ブロック範囲を含むセグメントファイルに POSIX_FADV_WILLNEED を発行する
+        """
+        path = self.filepaths.get(relfilenode)
+        if path is None:
+            path = self._query(FILEPATH_QUERY, (relfilenode,))
+            self.filepaths[relfilenode] = path
+        if path is None:
+            return 0
+        advised = 0
+        block = first
+        while block <= last:
+            segno, offset = divmod(block, RELSEG_SIZE)
+            count = min(last - block + 1, RELSEG_SIZE - offset)
+            seg_path = path if segno == 0 else f"{path}.{segno}"
+            try:
+                fd = os.open(seg_path, os.O_RDONLY)
+            except FileNotFoundError:
+                break
+            try:
+                os.posix_fadvise(fd, offset * mrc.BLOCK_SIZE, count * mrc.BLOCK_SIZE, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+            advised += count
+            block += count
+        return advised
+
+    def run(self, entry):
+        """
+        1 件分のブロック範囲をチャンク毎に I/O 予算を守りながら読み込む
+        """
+        relfilenode = int(entry["relfilenode"])
+        for first, last in split_range(int(entry["min_block"]), int(entry["max_block"]), self.chunk_blocks):
+            self.bucket.acquire((last - first + 1) * mrc.BLOCK_SIZE)
+            start = time.perf_counter()
+            try:
+                if self.mode == "buffer":
+                    blocks = self._query(PREWARM_QUERY, {"relfilenode": relfilenode, "first": first, "last": last})
+                else:
+                    blocks = self._fadvise(relfilenode, first, last)
+                error = None
+            except (psycopg2.Error, OSError) as e:
+                blocks, error = 0, str(e)
+            with self.log_lock:
+                self.log.append({
+                    "timestamp": datetime.now(),
+                    "scheduled_time": entry["scheduled_time"],
+                    "relfilenode": relfilenode,
+                    "first_block": first,
+                    "last_block": last,
+                    "blocks": blocks or 0,
+                    "elapsed": time.perf_counter() - start,
+                    "error": error,
+                })
+            if error is not None:
+                print("Error:", error)
+                return
+
+class StatsRecorder(threading.Thread):
+    """
+    pg_statio_user_tables と pg_stat_statements の累積値を interval 秒毎に記録するスレッド
+    """
+
+    def __init__(self, pool, interval=60):
+        super().__init__(daemon=True)
+        self.pool = pool
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.statio = []
+        self.statements = []
+
+    def snapshot(self):
+        conn = self.pool.getconn()
+        try:
+            # トランザクション内では統計ビューの値が固定されるため autocommit にする
+            conn.autocommit = True
+            now = datetime.now()
+            with conn.cursor() as cur:
+                cur.execute(STATIO_QUERY)
+                self.statio += [(now, *row) for row in cur.fetchall()]
+                cur.execute(STATEMENTS_QUERY)
+                self.statements += [(now, *row) for row in cur.fetchall()]
+        finally:
+            self.pool.putconn(conn)
+
+    def run(self):
+        # 分の境界に合わせて記録する
+        while not self.stop_event.wait(self.interval - time.time() % self.interval):
+            try:
+                self.snapshot()
+            except psycopg2.Error as e:
+                print("Error:", e)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.snapshot()
+
+    def deltas(self):
+        """
+        記録した累積値の区間毎の差分（リレーション毎のヒット率, クエリの平均実行時間）
+        """
+        statio = pd.DataFrame(self.statio, columns=["timestamp", "relname", "heap_blks_hit", "heap_blks_read"])
+        statio = statio.sort_values(["relname", "timestamp"])
+        counters = ["heap_blks_hit", "heap_blks_read"]
+        statio[counters] = statio.groupby("relname")[counters].diff()
+        statio = statio.dropna()
+        total = statio["heap_blks_hit"] + statio["heap_blks_read"]
+        statio["cache_hit_ratio"] = (statio["heap_blks_hit"] / total.where(total > 0)).round(4)
+
+        statements = pd.DataFrame(self.statements, columns=[
+            "timestamp", "queryid", "calls", "total_exec_time", "shared_blks_hit", "shared_blks_read"])
+        statements = statements.sort_values(["queryid", "timestamp"])
+        counters = ["calls", "total_exec_time", "shared_blks_hit", "shared_blks_read"]
+        statements[counters] = statements.groupby("queryid")[counters].diff()
+        statements = statements.dropna()
+        statements = statements[statements["calls"] > 0]
+        statements["mean_exec_time"] = statements["total_exec_time"] / statements["calls"]
+        return statio, statements
+
+def run(schedule, pool, bucket, mode="buffer", chunk_blocks=1024, workers=4, grace=60):
+    """
+    スキャン予定に従って読み込みを発行する。過去の予定（grace 秒以上前）は飛ばす
+    """
+    prewarmer = Prewarmer(pool, bucket, mode, chunk_blocks)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for entry in schedule.to_dict("records"):
+            fire_time = entry["fire_time"].to_pydatetime()
+            now = datetime.now()
+            if fire_time < now - timedelta(seconds=grace):
+                continue
+            if fire_time > now:
+                time.sleep((fire_time - now).total_seconds())
+            print(f"Prewarm {entry['relfilenode']} blocks {entry['min_block']}-{entry['max_block']} "
+                  f"for {entry['scheduled_time']}")
+            if mode != "none":
+                executor.submit(prewarmer.run, entry)
+    return pd.DataFrame(prewarmer.log)
+
+def main():
+    parser = argparse.ArgumentParser(description="スキャン予定に従って pg_prewarm / posix_fadvise で先読みする")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--schedule", default="../data/scan_schedule.csv")
+    parser.add_argument("--mode", choices=["buffer", "fadvise", "none"], default="buffer",
+                        help="none: 先読みせず統計だけ記録する（比較用）")
+    parser.add_argument("--lead", type=float, default=60, help="予定時刻の何秒前に読み込むか")
+    parser.add_argument("--io-budget", default="64MB", help="1 秒あたりの読み込み量の上限")
+    parser.add_argument("--chunk", default="8MB", help="1 回の pg_prewarm / fadvise で読み込む量")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--stats-interval", type=int, default=60)
+    args = parser.parse_args()
+
+    schedule = load_schedule(args.schedule, args.lead)
+    bucket = TokenBucket(mrc.parse_size(args.io_budget))
+    chunk_blocks = max(1, mrc.parse_size(args.chunk) // mrc.BLOCK_SIZE)
+
+    pool = ThreadedConnectionPool(1, args.workers + 1, **workload.CONN_PARAMS)
+    recorder = StatsRecorder(pool, args.stats_interval)
+    try:
+        recorder.snapshot()
+        recorder.start()
+        log = run(schedule, pool, bucket, args.mode, chunk_blocks, args.workers)
+    except KeyboardInterrupt:
+        log = pd.DataFrame()
+    finally:
+        recorder.stop()
+        pool.closeall()
+
+    log.to_csv(os.path.join(args.data_dir, f"prewarm_log_{args.mode}.csv"), index=False)
+    statio, statements = recorder.deltas()
+    statio.to_csv(os.path.join(args.data_dir, f"prewarm_statio_{args.mode}.csv"), index=False)
+    statements.to_csv(os.path.join(args.data_dir, f"prewarm_statements_{args.mode}.csv"), index=False)
+
+    if not log.empty:
+        print(f"prewarmed {log['blocks'].sum()} blocks in {log['elapsed'].sum():.1f}s")
+    total = statio.groupby("relname")[["heap_blks_hit", "heap_blks_read"]].sum()
+    total["cache_hit_ratio"] = total["heap_blks_hit"] / (total["heap_blks_hit"] + total["heap_blks_read"])
+    print(total)
+
+if __name__ == '__main__':
+    main()
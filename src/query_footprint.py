@@ -0,0 +1,195 @@
+"""
+queryid 毎のブロックの使い方（フットプリント）を集計し、pg_stat_statements の期間毎の値と結び付ける
+
+- bpf_read_block.csv / .bin（クエリの実行毎・リレーション毎のブロック範囲）を期間・queryid・リレーション毎に集計する
+  - executions: 実行回数, accessed_blocks: ブロック範囲の長さの合計（延べ）,
+    footprint_blocks: ブロック範囲の和集合のブロック数（重複を除いた実数）, min_block / max_block
+- 期間は get_stats.py が出力した pg_stat_statements_<開始>_<終了>.csv のファイル名から取る
+  （get_stats.py は期間毎に統計をリセットするため、各ファイルの値がそのまま期間中の差分になる）
+  ファイルがなければ --interval 毎に区切る
+- queryid の shared_blks_hit / shared_blks_read はリレーション別に分かれていないため、
+  accessed_blocks の比で按分した推定値（est_shared_blks_hit / est_shared_blks_read）を付ける
+- 結果を query_footprint.csv に保存し、リレーション毎に shared_blks_read の多いクエリを表示する
+  （例: pgbench_accounts のミスを起こしているクエリ）
+"""
+
+import argparse
+import glob
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import block_log
+
+# ファイル名から期間の開始・終了時刻を抽出する正規表現パターン
+STATEMENTS_PATTERN = r"pg_stat_statements_(\d{8}_\d{6})_(\d{8}_\d{6})\.csv"
+
+KEYS = ["interval_start", "queryid", "relfilenode"]
+
+def load_statements(data_dir="../data"):
+    """
+    pg_stat_statements_*.csv を期間・queryid 毎の 1 行にまとめる
+    （同じ queryid でもユーザー・データベースが違うと複数行になるため合計する）
+    """
+    frames = []
+    for path in glob.glob(os.path.join(data_dir, "pg_stat_statements_*.csv")):
+        match = re.search(STATEMENTS_PATTERN, path)
+        if not match:
+            continue
+        df = pd.read_csv(path, usecols=["queryid", "calls", "shared_blks_hit", "shared_blks_read"])
+        df = df.dropna(subset=["queryid"]).astype({"queryid": np.int64})
+        df = df.groupby("queryid", as_index=False).sum()
+        df.insert(0, "interval_start", datetime.strptime(match.group(1), "%Y%m%d_%H%M%S"))
+        df.insert(1, "interval_end", datetime.strptime(match.group(2), "%Y%m%d_%H%M%S"))
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["interval_start", "interval_end", "queryid",
+                                     "calls", "shared_blks_hit", "shared_blks_read"])
+    return pd.concat(frames).sort_values(["interval_start", "queryid"]).reset_index(drop=True)
+
+def assign_intervals(timestamp, intervals, freq="1min"):
+    """
+    各時刻が属する期間の開始時刻を返す（どの期間にも入らなければ NaT）
+    intervals が空なら freq 毎に区切る
+    """
+    if intervals.empty:
+        return timestamp.dt.floor(freq)
+    starts = intervals["interval_start"].to_numpy(dtype="datetime64[ns]")
+    ends = intervals["interval_end"].to_numpy(dtype="datetime64[ns]")
+    values = timestamp.to_numpy(dtype="datetime64[ns]")
+    pos = np.searchsorted(starts, values, side="right") - 1
+    inside = (pos >= 0) & (values < ends[np.maximum(pos, 0)])
+    result = np.where(inside, starts[np.maximum(pos, 0)], np.datetime64("NaT"))
+    return pd.Series(result, index=timestamp.index)
+
+def merge_ranges(df, keys):
+    """
+    keys 毎にブロック範囲 [min_block, max_block] を重ならない範囲にまとめる
+    """
+    df = df.sort_values(keys + ["min_block"], kind="stable").reset_index(drop=True)
+    # 同じグループ内でそれまでの範囲の終わり（max_block の累積最大）を 1 行ずらして比べる
+    group = df.groupby(keys, sort=False).ngroup()
+    reach = df.groupby(group, sort=False)["max_block"].cummax().shift()
+    new_group = group != group.shift()
+    new_segment = new_group | (df["min_block"] > reach + 1)
+    segment = new_segment.cumsum()
+    return df.groupby(segment, sort=False).agg(
+        {**{key: "first" for key in keys}, "min_block": "min", "max_block": "max"}).reset_index(drop=True)
+
+def build_footprint(read_block_path, intervals, freq="1min"):
+    """
+    bpf_read_block.csv を期間・queryid・リレーション毎に集計する
+    """
+    counts = []
+    executions = []
+    segments = None
+    dropped = 0
+    for chunk in block_log.iter_read_block_any(read_block_path):
+        chunk["interval_start"] = assign_intervals(chunk["timestamp"], intervals, freq)
+        dropped += chunk["interval_start"].isna().sum()
+        chunk = chunk.dropna(subset=["interval_start"])
+        chunk = chunk.assign(accessed_blocks=chunk["max_block"] - chunk["min_block"] + 1)
+
+        counts.append(chunk.groupby(KEYS).agg(executions=("pid", "size"),
+                                              accessed_blocks=("accessed_blocks", "sum")))
+        # 1 回の実行につき rel_index = 0 の行が 1 つある
+        executions.append(chunk[chunk["rel_index"] == 0].groupby(["interval_start", "queryid"]).size())
+        ranges = chunk[KEYS + ["min_block", "max_block"]]
+        segments = merge_ranges(ranges if segments is None else pd.concat([segments, ranges]), KEYS)
+    if dropped:
+        print(f"{dropped} rows outside of the pg_stat_statements intervals were skipped")
+    if segments is None:
+        return pd.DataFrame(columns=KEYS + ["executions", "accessed_blocks", "footprint_blocks",
+                                            "min_block", "max_block", "query_executions"])
+
+    footprint = pd.concat(counts).groupby(level=[0, 1, 2]).sum()
+    segments["footprint_blocks"] = segments["max_block"] - segments["min_block"] + 1
+    footprint = footprint.join(segments.groupby(KEYS).agg(
+        footprint_blocks=("footprint_blocks", "sum"), min_block=("min_block", "min"),
+        max_block=("max_block", "max")))
+    query_executions = pd.concat(executions).groupby(level=[0, 1]).sum().rename("query_executions")
+    footprint = footprint.reset_index().merge(query_executions.reset_index(),
+                                              on=["interval_start", "queryid"], how="left")
+    footprint["query_executions"] = footprint["query_executions"].fillna(0).astype(np.int64)
+    return footprint
+
+def join_statements(footprint, statements):
+    """
+    期間・queryid で pg_stat_statements の値を結び付け、リレーション毎の推定値を付ける
+    """
+    index = footprint.merge(statements, on=["interval_start", "queryid"], how="left")
+    share = index["accessed_blocks"] / index.groupby(["interval_start", "queryid"])["accessed_blocks"].transform("sum")
+    index["est_shared_blks_hit"] = index["shared_blks_hit"] * share
+    index["est_shared_blks_read"] = index["shared_blks_read"] * share
+    return index
+
+def load_query_texts(path, chunk_lines=block_log.CHUNK_LINES):
+    """
+    bpf_query_log.csv（.bin も可）から queryid 毎に最初に記録されたクエリ文字列を返す
+    """
+    texts = {}
+    for chunk in block_log.iter_query_log_any(path, chunk_lines):
+        chunk = chunk[["queryid", "query"]]
+        for queryid, query in chunk.drop_duplicates("queryid").itertuples(index=False):
+            texts.setdefault(queryid, query)
+    return texts
+
+def top_queries(index, relfilenode, n=10, by="est_shared_blks_read"):
+    """
+    リレーションについて、全期間の by の合計が多い順に queryid を返す
+    peak_footprint_blocks は期間毎の footprint_blocks の最大値
+    """
+    rel = index[index["relfilenode"] == relfilenode]
+    top = rel.groupby("queryid").agg(
+        executions=("executions", "sum"),
+        accessed_blocks=("accessed_blocks", "sum"),
+        peak_footprint_blocks=("footprint_blocks", "max"),
+        est_shared_blks_hit=("est_shared_blks_hit", "sum"),
+        est_shared_blks_read=("est_shared_blks_read", "sum"),
+    )
+    return top.sort_values(by, ascending=False).head(n).reset_index()
+
+def main():
+    parser = argparse.ArgumentParser(description="queryid 毎のブロックのフットプリントを pg_stat_statements と結び付ける")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--interval", default="1min",
+                        help="pg_stat_statements_*.csv がないときに区切る間隔")
+    parser.add_argument("--relname", action="append", default=[],
+                        help="上位のクエリを表示するリレーション（複数指定可, 省略時は全リレーション）")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", default="../data/query_footprint.csv")
+    args = parser.parse_args()
+
+    statements = load_statements(args.data_dir)
+    intervals = statements[["interval_start", "interval_end"]].drop_duplicates()
+    footprint = build_footprint(block_log.trace_path(args.data_dir, "bpf_read_block"), intervals, args.interval)
+    index = join_statements(footprint, statements)
+
+    mapping_dict = {}
+    mapping_csv = os.path.join(args.data_dir, "pg_class.csv")
+    if os.path.exists(mapping_csv):
+        mapping_dict = pd.read_csv(mapping_csv).set_index("relfilenode")["relname"].to_dict()
+        index.insert(3, "relname", index["relfilenode"].map(mapping_dict))
+    index.to_csv(args.output, index=False)
+
+    texts = {}
+    query_log = block_log.trace_path(args.data_dir, "bpf_query_log")
+    if os.path.exists(query_log):
+        texts = load_query_texts(query_log)
+
+    relname_to_relfilenode = {relname: relfilenode for relfilenode, relname in mapping_dict.items()}
+    if args.relname:
+        relfilenodes = [relname_to_relfilenode[relname] for relname in args.relname]
+    else:
+        relfilenodes = index["relfilenode"].unique()
+    for relfilenode in relfilenodes:
+        top = top_queries(index, relfilenode, args.top)
+        top["query"] = top["queryid"].map(texts).fillna("").str.slice(0, 60)
+        print(f"== {mapping_dict.get(relfilenode, relfilenode)}")
+        print(top.to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -7,12 +7,24 @@
 - ブロック IO 操作（例: ReadBuffer_common）の際に、各 relfilenode 毎にアクセスしたブロック番号の最大／最小を記録
 - exec_simple_query のリターン時に、保持していた複数の relfilenode 情報をまとめて出力し、
   CSV 形式で保存する（各行にタイムスタンプを付与）
+- replay.py で再実行できるように、クエリの開始時刻（マイクロ秒）, pid, queryid, クエリ文字列を
+  bpf_query_log.csv に保存する（クエリ文字列は QUERY_LEN バイトまで）
+- イベントの変換と書き出しは EventWriter にまとめ、bcc は main でだけ読み込む
+  （tracer_bench.py が root 権限やカーネルのプローブなしで同じ経路を計測できるように）
+  - 出力形式: csv または binary（BLOCK_RECORD / QUERY_RECORD の固定長レコード）
+  - 書き出し: イベント毎に flush するか、バッファリングするか
+- --working-set を指定すると、イベント毎に working_set.py の WorkingSetTracker にも渡し、
+  リレーション毎のワーキングセット（1, 5, 15 分）を working_set.csv に書き出す
+- --dashboard <port> を指定すると、dashboard.py の LiveStats にもイベントを渡し、
+  http://127.0.0.1:<port>/snapshot, /diff?since=<version> で直近の集計を返す
 """
 
+import argparse
 import csv
+import struct
+import time
 from datetime import datetime
-from bcc import BPF
-from ctypes import Structure, c_uint, c_char, c_longlong, string_at
+from ctypes import Structure, c_uint, c_char, c_longlong, c_ulonglong, string_at
 
 # 定数（BPF 側と合わせる）
 QUERY_LEN = 256
@@ -33,8 +45,18 @@ class Event(Structure):
         ("query_id", c_longlong),
         ("rel_info", RelInfo * MAX_REL),
         ("num_rel", c_uint),
+        ("start_ns", c_ulonglong),
     ]
 
+# binary 形式のレコード（リトルエンディアン）
+# bpf_read_block.bin: timestamp（Unix 時刻, マイクロ秒）, pid, queryid, rel_index, relfilenode, max_block, min_block
+BLOCK_RECORD = struct.Struct("<qIqHIII")
+# bpf_query_log.bin: 開始時刻（Unix 時刻, マイクロ秒）, pid, queryid, クエリ文字列の長さ, の後にクエリ文字列
+QUERY_RECORD = struct.Struct("<qIqH")
+
+# バッファリングするときのバッファサイズ
+WRITE_BUFFER_SIZE = 1 << 20
+
 # BPF プログラム（C 言語）
 bpf_text = r"""
 #include <uapi/linux/ptrace.h>
@@ -56,6 +78,7 @@ struct query_info_t {
     long query_id;
     struct rel_info_t rel_info[MAX_REL];
     u32 num_rel;       // 記録している rel_info の件数
+    u64 start_ns;      // クエリ開始時刻（bpf_ktime_get_ns）
 };
 
 // ユーザ空間へ送出するイベント（クエリ終了時）
@@ -65,6 +88,7 @@ struct event_t {
     long query_id;
     struct rel_info_t rel_info[MAX_REL];
     u32 num_rel;
+    u64 start_ns;
 };
 
 BPF_HASH(query_map, u32, struct query_info_t);
@@ -86,6 +110,7 @@ int probe_query(struct pt_regs *ctx) {
     // リレーション情報はまだないので、件数 0 で初期化
     info.num_rel = 0;
     info.query_id = 0;
+    info.start_ns = bpf_ktime_get_ns();
 
     query_map.update(&tgid, &info);
     return 0;
@@ -173,6 +198,7 @@ int probe_query_end(struct pt_regs *ctx) {
     __builtin_memcpy(&event.query, info->query, sizeof(event.query));
     __builtin_memcpy(&event.query_id, &info->query_id, sizeof(event.query_id));
     event.num_rel = info->num_rel;
+    event.start_ns = info->start_ns;
 
     #pragma unroll
     for (int i = 0; i < MAX_REL; i++) {
@@ -211,7 +237,101 @@ int probe_exec(struct pt_regs *ctx) {
 }
 """
 
+def decode_event(data, size):
+    """
+    perf バッファのデータ（アドレスとサイズ）を Event にする
+    """
+    return Event.from_buffer_copy(string_at(data, size))
+
+class EventWriter:
+    """
+    イベントを bpf_read_block（ブロック範囲）と bpf_query_log（クエリ）に書き出す
+    """
+
+    def __init__(self, block_path, query_path, fmt="csv", flush_each=True, boot_time=None, working_set=None,
+                 dashboard=None):
+        self.fmt = fmt
+        self.flush_each = flush_each
+        self.working_set = working_set
+        self.dashboard = dashboard
+        # bpf_ktime_get_ns（ブート後の経過時間）を Unix 時刻に変換するための基準
+        self.boot_time = boot_time if boot_time is not None else time.time() - time.monotonic()
+        buffering = -1 if flush_each else WRITE_BUFFER_SIZE
+        if fmt == "csv":
+            self.block_file = open(block_path, "w", newline="", encoding="utf-8", buffering=buffering)
+            self.query_file = open(query_path, "w", newline="", encoding="utf-8", buffering=buffering)
+            self.block_writer = csv.writer(self.block_file)
+            # CSV ヘッダーの書き出し（タイムスタンプ列を追加）
+            self.block_writer.writerow(["timestamp", "pid", "queryid", "rel_index", "relfilenode", "max_block", "min_block"])
+            self.query_writer = csv.writer(self.query_file)
+            self.query_writer.writerow(["timestamp", "pid", "queryid", "query"])
+        else:
+            self.block_file = open(block_path, "wb", buffering=buffering)
+            self.query_file = open(query_path, "wb", buffering=buffering)
+
+    def handle_event(self, cpu, data, size):
+        """
+        open_perf_buffer に渡すイベント受信用のコールバック関数
+        """
+        self.write(decode_event(data, size))
+
+    def write(self, event):
+        if self.fmt == "csv":
+            self._write_csv(event)
+        else:
+            self._write_binary(event)
+        if self.working_set is not None:
+            self.working_set.add_event(event)
+        if self.dashboard is not None:
+            self.dashboard.add_event(event)
+        if self.flush_each:
+            self.flush()
+
+    def _write_csv(self, event):
+        query_str = event.query.split(b'\0', 1)[0].decode('utf-8', errors='replace')
+        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for i in range(event.num_rel):
+            rel = event.rel_info[i]
+            self.block_writer.writerow([ts, event.pid, event.query_id, i,
+                                        rel.relfilenode, rel.max_block, rel.min_block])
+
+        start = datetime.fromtimestamp(self.boot_time + event.start_ns / 1e9)
+        self.query_writer.writerow([start.strftime("%Y-%m-%d %H:%M:%S.%f"), event.pid, event.query_id, query_str])
+
+    def _write_binary(self, event):
+        ts = int(time.time() * 1_000_000)
+        self.block_file.write(b"".join(
+            BLOCK_RECORD.pack(ts, event.pid, event.query_id, i,
+                              event.rel_info[i].relfilenode, event.rel_info[i].max_block, event.rel_info[i].min_block)
+            for i in range(event.num_rel)))
+
+        query = event.query.split(b'\0', 1)[0]
+        start = int((self.boot_time + event.start_ns / 1e9) * 1_000_000)
+        self.query_file.write(QUERY_RECORD.pack(start, event.pid, event.query_id, len(query)) + query)
+
+    def flush(self):
+        self.block_file.flush()
+        self.query_file.flush()
+
+    def close(self):
+        self.block_file.close()
+        self.query_file.close()
+        if self.working_set is not None:
+            self.working_set.close()
+
 def main():
+    parser = argparse.ArgumentParser(description="eBPF でクエリ毎のブロック範囲を記録する")
+    parser.add_argument("--format", choices=["csv", "binary"], default="csv")
+    parser.add_argument("--buffered", action="store_true", help="イベント毎に flush しない")
+    parser.add_argument("--working-set", action="store_true",
+                        help="ワーキングセットを ../data/working_set.csv に書き出す")
+    parser.add_argument("--dashboard", type=int, default=None, metavar="PORT",
+                        help="直近の集計を http://127.0.0.1:PORT/snapshot で返す")
+    args = parser.parse_args()
+
+    # bcc は root 権限のある環境にのみ入っているため、ここで読み込む
+    from bcc import BPF
+
     # BPF オブジェクトの生成
     b = BPF(text=bpf_text)
 
@@ -227,32 +347,32 @@ def main():
 
     print("Tracing queries... Ctrl-C で終了します。")
 
-    # CSV ファイルのオープン
-    with open("../data/bpf_read_block.csv", "w", newline="", encoding="utf-8") as csvfile:
-        csv_writer = csv.writer(csvfile)
-        # CSV ヘッダーの書き出し（タイムスタンプ列を追加）
-        csv_writer.writerow(["timestamp", "pid", "queryid", "rel_index", "relfilenode", "max_block", "min_block"])
-
-        # イベント受信用のコールバック関数
-        def handle_event(cpu, data, size):
-            event = Event.from_buffer_copy(string_at(data, size))
-            query_str = event.query.split(b'\0', 1)[0].decode('utf-8', errors='replace')
-            ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            if event.num_rel != 0:
-                for i in range(event.num_rel):
-                    rel = event.rel_info[i]
-                    csv_writer.writerow([ts, event.pid, event.query_id, i,
-                                         rel.relfilenode, rel.max_block, rel.min_block])
-            csvfile.flush()
-
-        # イベントバッファのオープン
-        b["events"].open_perf_buffer(handle_event, page_cnt=128)
-
-        try:
-            while True:
-                b.perf_buffer_poll()
-        except KeyboardInterrupt:
-            print("Tracing stopped.")
+    ext = "csv" if args.format == "csv" else "bin"
+    working_set = None
+    if args.working_set or args.dashboard is not None:
+        import working_set as ws
+        output = "../data/working_set.csv" if args.working_set else None
+        working_set = ws.WorkingSetTracker(output=output, keep_rows=False)
+    live_stats = None
+    if args.dashboard is not None:
+        import dashboard
+        live_stats = dashboard.LiveStats(working_set, relnames=dashboard.load_relnames())
+        dashboard.start_server(live_stats, port=args.dashboard)
+        print(f"Dashboard: http://127.0.0.1:{args.dashboard}/snapshot")
+    writer = EventWriter(f"../data/bpf_read_block.{ext}", f"../data/bpf_query_log.{ext}",
+                         args.format, flush_each=not args.buffered, working_set=working_set,
+                         dashboard=live_stats)
+
+    # イベントバッファのオープン
+    b["events"].open_perf_buffer(writer.handle_event, page_cnt=128)
+
+    try:
+        while True:
+            b.perf_buffer_poll()
+    except KeyboardInterrupt:
+        print("Tracing stopped.")
+    finally:
+        writer.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,174 @@
+"""
+read_block.py が記録したクエリログ（bpf_query_log.csv / .bin: timestamp, pid, queryid, query）を
+テスト用のクラスタで再実行する
+
+- 元のセッション毎に asyncio のタスクを 1 つ作り、元の実行開始時刻の間隔を保って
+  （--speedup で N 倍速にして）クエリを順に実行する
+  ログにセッションの開始は記録されないため、同じ pid でもクエリの間隔が --session-gap 秒を超えたら
+  別のセッション（pid を再利用した別のバックエンド）とみなす
+- 接続はクエリ毎にプールから借り、実行後にトランザクションの外（IDLE）であればすぐ返す
+  （BEGIN ... END の間は同じ接続を使い続ける）。同時に借りる接続は --max-connections までで、
+  空きを待った分は遅れ（lateness）に現れる
+- psycopg2 は同期 API なので、実行は asyncio.to_thread でスレッドに渡す
+- 元の時刻からの遅れ（スケジュール通りに投げられたか）と実行時間を replay_result.csv に出力する
+- 記録されるのは単純問い合わせプロトコル（exec_simple_query）のクエリのみで、
+  クエリ文字列は QUERY_LEN バイトで切り詰められるため、途中で切れたクエリはエラーとして記録する
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import psycopg2
+import psycopg2.extensions
+
+import block_log
+import workload
+
+# 同時に使う接続数の既定値（max_connections の既定値 100 より少なくする）
+MAX_CONNECTIONS = 50
+# 同じ pid のクエリの間隔がこれ（秒）を超えたら別のセッションとみなす
+SESSION_GAP = 60.0
+
+def load_query_log(path, start=None, end=None):
+    """
+    クエリログ（.csv / .bin）を読み込み、期間で絞り込んで時刻順に並べる
+    """
+    chunks = list(block_log.iter_query_log_any(path))
+    if not chunks:
+        return pd.DataFrame(columns=["timestamp", "pid", "queryid", "query"])
+    log = pd.concat(chunks, ignore_index=True)
+    if start is not None:
+        log = log[log["timestamp"] >= pd.Timestamp(start)]
+    if end is not None:
+        log = log[log["timestamp"] < pd.Timestamp(end)]
+    log = log[log["query"].str.strip() != ""]
+    return log.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+def execute(conn, query):
+    """
+    1 クエリを実行し、(実行時間, エラー) を返す（スレッドで実行）
+    """
+    start = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query)
+            if cur.description:
+                cur.fetchall()
+        error = None
+    except psycopg2.Error as e:
+        error = str(e).strip()
+        # トランザクションがエラー状態のままだと以降のクエリも失敗するため戻す
+        if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            conn.rollback()
+    return time.perf_counter() - start, error
+
+def split_sessions(log, gap=SESSION_GAP):
+    """
+    クエリログを pid と、同じ pid 内でクエリの間隔が gap 秒を超えたところで区切り、セッション毎の行のリストにする
+    """
+    log = log.sort_values(["pid", "timestamp"], kind="stable")
+    new_pid = log["pid"] != log["pid"].shift()
+    new_session = new_pid | (log["timestamp"].diff() > pd.Timedelta(seconds=gap))
+    return [group.to_dict("records") for _, group in log.groupby(new_session.cumsum().to_numpy(), sort=False)]
+
+async def replay_session(pool, slots, rows, origin, start, speedup, results):
+    """
+    1 つの元のセッションのクエリを、元の間隔（の 1/speedup）で順に実行する
+    接続はクエリ毎に slots の空きを待って借り、トランザクションの外に戻ったら返す
+    """
+    loop = asyncio.get_running_loop()
+    conn = None
+    try:
+        for row in rows:
+            offset = (row["timestamp"] - origin).total_seconds() / speedup
+            delay = start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if conn is None:
+                await slots.acquire()
+                try:
+                    conn = await asyncio.to_thread(pool.getconn)
+                except BaseException:
+                    slots.release()
+                    raise
+                conn.autocommit = True
+            lateness = loop.time() - (start + offset)
+            elapsed, error = await asyncio.to_thread(execute, conn, row["query"])
+            results.append({
+                "timestamp": row["timestamp"],
+                "pid": row["pid"],
+                "queryid": row["queryid"],
+                "offset": offset,
+                "lateness": lateness,
+                "elapsed": elapsed,
+                "error": error,
+            })
+            if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                pool.putconn(conn)
+                slots.release()
+                conn = None
+    finally:
+        if conn is not None:
+            # BEGIN のまま終わったセッションのトランザクションは戻してから返す
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            pool.putconn(conn)
+            slots.release()
+
+async def replay(log, speedup=1.0, max_connections=MAX_CONNECTIONS, session_gap=SESSION_GAP, **conn_params):
+    """
+    クエリログを再実行し、クエリ毎の結果を返す
+    同時に使う接続は max_connections まで
+    """
+    sessions = split_sessions(log, session_gap)
+    if not sessions:
+        return pd.DataFrame()
+    max_connections = min(max_connections, len(sessions))
+    driver = workload.Driver(maxconn=max_connections, **conn_params)
+    slots = asyncio.Semaphore(max_connections)
+    loop = asyncio.get_running_loop()
+    # 同時に使う接続と同じ数だけスレッドを用意する
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_connections))
+
+    origin = log["timestamp"].min()
+    # 接続の確立を待つ分だけ開始を遅らせる
+    start = loop.time() + 1.0
+    results = []
+    try:
+        await asyncio.gather(*(replay_session(driver.pool, slots, rows, origin, start, speedup, results)
+                               for rows in sessions))
+    finally:
+        driver.close()
+    return pd.DataFrame(results).sort_values("offset").reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="クエリログをバックエンド毎の順序・間隔を保って再実行する")
+    parser.add_argument("--query-log", default=block_log.trace_path("../data", "bpf_query_log"),
+                        help="bpf_query_log.csv または read_block.py --format binary の bpf_query_log.bin")
+    parser.add_argument("--speedup", type=float, default=1.0, help="N 倍速で再実行する")
+    parser.add_argument("--start", default=None, help="再実行する期間の開始時刻")
+    parser.add_argument("--end", default=None, help="再実行する期間の終了時刻")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                        help="同時に使う接続数の上限（超えたバックエンドは空きを待つ）")
+    parser.add_argument("--session-gap", type=float, default=SESSION_GAP,
+                        help="同じ pid のクエリの間隔がこの秒数を超えたら別のセッションとして再実行する")
+    parser.add_argument("--output", default="../data/replay_result.csv")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    log = load_query_log(args.query_log, args.start, args.end)
+    print(f"{len(log)} queries, {log['pid'].nunique()} backends, speedup {args.speedup}x")
+
+    result = asyncio.run(replay(log, args.speedup, args.max_connections, args.session_gap))
+    result.to_csv(args.output, index=False)
+
+    if not result.empty:
+        print(f"errors: {result['error'].notna().sum()}")
+        print(result[["lateness", "elapsed"]].describe(percentiles=[0.5, 0.99]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+ブロックトレースの LRU スタック距離（再利用距離）を計算する
+
+- 各ブロック (relfilenode, ブロック番号) の直前のアクセス位置を Fenwick 木に記録し、
+  その位置以降にアクセスされた異なるブロック数を O(log M) で求める
+  （N: アクセス数, M: 異なるブロック数。全体で O(N log M)）
+- スタック距離 d のアクセスは、d より大きい LRU キャッシュ（shared_buffers）でヒットする
+- bpf_blockread のセグメントをチャンク毎に処理し、リレーション毎の距離のヒストグラムを出力する
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import block_log
+
+# 初回アクセス（コールドミス）の距離
+COLD = -1
+
+class ReuseDistance:
+    """
+    LRU スタック距離をストリーミングで計算する
+
+    アクセス位置を Fenwick 木の添字として使い、各キーの最後のアクセス位置だけに 1 を立てる。
+    位置が capacity に達したら、生きているキーを詰め直して（compaction）木を作り直す。
+    """
+
+    def __init__(self, capacity=1 << 20):
+        self.capacity = capacity
+        self.tree = [0] * (capacity + 1)
+        self.last = {}   # キー -> 最後にアクセスした位置
+        self.pos = 0     # 次のアクセスの位置
+
+    def __len__(self):
+        return len(self.last)
+
+    def _compact(self):
+        """
+        最後のアクセス位置の順にキーを 0, 1, 2, ... と振り直し、Fenwick 木を作り直す
+        """
+        live = sorted(self.last.items(), key=lambda item: item[1])
+        if len(live) * 2 > self.capacity:
+            self.capacity *= 2
+        tree = [0] * (self.capacity + 1)
+        for i, (key, _) in enumerate(live):
+            self.last[key] = i
+            tree[i + 1] = 1
+        # 全要素が 1 の配列から O(n) で Fenwick 木を構築する
+        for i in range(1, self.capacity + 1):
+            j = i + (i & -i)
+            if j <= self.capacity:
+                tree[j] += tree[i]
+        self.tree = tree
+        self.pos = len(live)
+
+    def access(self, key):
+        """
+        1 件アクセスし、スタック距離を返す（初回アクセスは COLD）
+        """
+        return int(self.process(np.array([key], dtype=np.int64))[0])
+
+    def process(self, keys):
+        """
+        キーの配列を順にアクセスし、各アクセスのスタック距離を返す（初回アクセスは COLD）
+        """
+        out = np.empty(len(keys), dtype=np.int64)
+        last = self.last
+        for n, key in enumerate(keys.tolist()):
+            if self.pos >= self.capacity:
+                self._compact()
+            tree = self.tree
+            size = self.capacity
+            p = last.get(key)
+            if p is None:
+                out[n] = COLD
+            else:
+                # p より後に最後のアクセスがあるキーの数 = 全キー数 - [0, p] の和
+                i = p + 1
+                s = 0
+                while i > 0:
+                    s += tree[i]
+                    i -= i & -i
+                out[n] = len(last) - s
+                i = p + 1
+                while i <= size:
+                    tree[i] -= 1
+                    i += i & -i
+            i = self.pos + 1
+            while i <= size:
+                tree[i] += 1
+                i += i & -i
+            last[key] = self.pos
+            self.pos += 1
+        return out
+
+    def forget(self, key):
+        """
+        キーを追跡対象から外す（サンプリングから外れたキーの削除用）
+        """
+        p = self.last.pop(key, None)
+        if p is None:
+            return
+        i = p + 1
+        while i <= self.capacity:
+            self.tree[i] -= 1
+            i += i & -i
+
+def accumulate_histogram(hist, relfilenode, distances):
+    """
+    (relfilenode, 距離) 毎のアクセス数を hist（Series）に加算して返す
+    """
+    counts = pd.DataFrame({"relfilenode": relfilenode, "distance": distances}) \
+        .value_counts(["relfilenode", "distance"])
+    if hist is None:
+        return counts
+    return hist.add(counts, fill_value=0)
+
+def reuse_distance_histogram(chunks):
+    """
+    (relfilenode, blocknum) を持つ構造化配列のチャンク列から、
+    リレーション毎のスタック距離のヒストグラムを作成する
+    距離は全リレーション共通のバッファプールでの値（COLD は初回アクセス）
+    """
+    engine = ReuseDistance()
+    hist = None
+    for chunk in chunks:
+        keys = block_log.encode_block_key(chunk["relfilenode"], chunk["blocknum"])
+        distances = engine.process(keys)
+        hist = accumulate_histogram(hist, chunk["relfilenode"], distances)
+
+    if hist is None:
+        return pd.DataFrame(columns=["relfilenode", "distance", "count"])
+    df = hist.astype(np.int64).rename("count").reset_index()
+    return df.sort_values(["relfilenode", "distance"]).reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="bpf_blockread のスタック距離ヒストグラムを作成する")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--output", default="../data/reuse_distance.csv")
+    args = parser.parse_args()
+
+    paths = block_log.blockread_segments(args.data_dir)
+    print(f"{len(paths)} segments")
+    hist = reuse_distance_histogram(block_log.iter_blockread(paths))
+    hist.to_csv(args.output, index=False)
+    print(hist)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+ワークロードの SQL を壁時計の区切り（毎時 0 分, 15 分毎など）に合わせて実行するスケジューラ
+
+- ジョブは dict（または JSON ファイルのリスト）で指定する
+  - name: ジョブ名
+  - statement: 実行する SQL（{table} は table に置き換える）
+  - schedule: cron 形式の周期（分 時 日 月 曜日。*, */n, a-b, a,b が使える）
+  - concurrency: 同時に実行するセッション数（既定 1）
+  - table: 対象テーブル
+  - explain: EXPLAIN (ANALYZE, BUFFERS) で実行して記録するか（既定 true）
+- 次の実行時刻は壁時計から計算し、待機は単調時計で行う
+  長い待機は区切って壁時計との差を計算し直すため、sleep の誤差や時計の調整で実行時刻がずれない
+- get_stats.py の取得間隔も sleep_until で同じ分の区切りに合わせる
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import workload
+
+# 1 回の待機の上限（秒）。これごとに壁時計との差を計算し直す
+MAX_SLEEP = 30
+
+DEFAULT_JOBS = [
+    {"name": "large_table1", "statement": "SELECT * FROM {table}", "schedule": "*/15 * * * *",
+     "table": "large_table1"},
+    {"name": "large_table2", "statement": "SELECT * FROM {table}", "schedule": "0 * * * *",
+     "table": "large_table2"},
+]
+
+def parse_field(expr, lo, hi):
+    """
+    cron の 1 フィールドを値の集合にする
+    """
+    values = set()
+    for part in expr.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/")
+            step = int(step)
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            start, end = map(int, part.split("-"))
+        else:
+            start = int(part)
+            end = hi if step > 1 else start
+        if start < lo or end > hi or start > end:
+            raise ValueError(f"範囲外の値です: {expr}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class Cron:
+    """
+    cron 形式（分 時 日 月 曜日）の周期。曜日は 0 が日曜日
+    """
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 形式ではありません: {expr}")
+        self.expr = expr
+        self.minutes = parse_field(fields[0], 0, 59)
+        self.hours = parse_field(fields[1], 0, 23)
+        self.days = parse_field(fields[2], 1, 31)
+        self.months = parse_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in parse_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt):
+        day = dt.day in self.days
+        weekday = (dt.weekday() + 1) % 7 in self.weekdays
+        # 日と曜日の両方が指定されたときはどちらかに一致すればよい（cron と同じ）
+        if not self.any_day and not self.any_weekday:
+            return day or weekday
+        return day and weekday
+
+    def next_after(self, dt):
+        """
+        dt より後で最初に一致する時刻（秒以下は 0）
+        """
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"一致する時刻がありません: {self.expr}")
+
+def sleep_until(target, stop_event=None):
+    """
+    壁時計の時刻 target まで待つ。stop_event がセットされたら False を返す
+    """
+    while True:
+        remaining = (target - datetime.now()).total_seconds()
+        if remaining <= 0:
+            return True
+        timeout = min(remaining, MAX_SLEEP)
+        if stop_event is None:
+            time.sleep(timeout)
+        elif stop_event.wait(timeout):
+            return False
+
+class Scheduler:
+    """
+    ジョブ毎にスレッドを作り、周期の区切りで statement を concurrency 本並行に実行する
+    """
+
+    def __init__(self, driver, jobs):
+        self.driver = driver
+        self.jobs = jobs
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def _execute(self, job):
+        statement = job["statement"].format(table=job.get("table", ""))
+        try:
+            if job.get("explain", True):
+                self.driver.explain(statement)
+            else:
+                self.driver.execute(statement)
+        except Exception as e:
+            logging.error("%s: %s", job["name"], e)
+
+    def _loop(self, job):
+        cron = Cron(job["schedule"])
+        concurrency = job.get("concurrency", 1)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                fire_time = cron.next_after(datetime.now())
+                logging.info("%s: next run at %s", job["name"], fire_time)
+                if not sleep_until(fire_time, self.stop_event):
+                    return
+                lateness = (datetime.now() - fire_time).total_seconds()
+                logging.info("%s: started (%.3f s late)", job["name"], lateness)
+                futures = [executor.submit(self._execute, job) for _ in range(concurrency)]
+                for future in futures:
+                    future.result()
+
+    def start(self):
+        for job in self.jobs:
+            thread = threading.Thread(target=self._loop, args=(job,), name=job["name"], daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """
+        待機中のジョブを止める（実行中の SQL は終わるまで待つ）
+        """
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+
+def connections_needed(jobs):
+    """
+    全ジョブが同時に実行されたときに必要な接続数
+    """
+    return sum(job.get("concurrency", 1) for job in jobs)
+
+def load_jobs(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="ワークロードの SQL を壁時計の区切りに合わせて実行する")
+    parser.add_argument("--spec", help="ジョブのリストの JSON ファイル（省略時は large_table1 / large_table2）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s %(message)s")
+    jobs = load_jobs(args.spec) if args.spec else DEFAULT_JOBS
+    driver = workload.Driver(maxconn=connections_needed(jobs))
+    scheduler = Scheduler(driver, jobs)
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(MAX_SLEEP)
+    except KeyboardInterrupt:
+        scheduler.stop()
+        driver.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+shared_buffers のサイズ × 置換ポリシー × リングサイズの組み合わせを並列にシミュレーションする
+
+- bpf_blockread のセグメントを一度だけ固定長レコードのバイナリ（trace.bin）に変換し、
+  各ワーカープロセスは np.memmap で読み取り専用に開く（トレースはコピーされず、ページキャッシュを共有する）
+- 各組み合わせを ProcessPoolExecutor に投げ、結果を 1 つの表にまとめる
+"""
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import block_log
+import clock_sweep
+import mrc
+import policies
+
+# trace.bin のレコード形式
+TRACE_DTYPE = np.dtype([
+    ("key", np.int64),
+    ("relfilenode", np.int64),
+    ("timestamp", np.int64),
+])
+
+TRACE_FILENAME = "trace.bin"
+
+def build_trace(data_dir, path):
+    """
+    bpf_blockread のセグメントを TRACE_DTYPE のバイナリに追記形式で変換する
+    セグメントが trace.bin より新しくなければ何もしない
+    """
+    segments = block_log.blockread_segments(data_dir)
+    if os.path.exists(path) and all(os.path.getmtime(s) <= os.path.getmtime(path) for s in segments):
+        return
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in block_log.iter_blockread(segments):
+            out = np.empty(len(chunk), dtype=TRACE_DTYPE)
+            out["key"] = block_log.encode_block_key(chunk["relfilenode"], chunk["blocknum"])
+            out["relfilenode"] = chunk["relfilenode"]
+            out["timestamp"] = chunk["timestamp"]
+            out.tofile(f)
+    os.replace(tmp_path, path)
+
+def open_trace(path):
+    """
+    trace.bin を読み取り専用で memmap する
+    """
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    return np.memmap(path, dtype=TRACE_DTYPE, mode="r")
+
+# ワーカープロセス内で共有するトレース
+_trace = None
+
+def _init_worker(path):
+    global _trace
+    _trace = open_trace(path)
+
+def _run_config(config):
+    """
+    1 つの組み合わせを再生する（ワーカープロセスで実行）
+    """
+    start = time.process_time()
+    size = config["cache_blocks"]
+    if config["policy"] == "clock":
+        ring_relations = {rel: config["ring_blocks"] for rel in config["ring_relations"]}
+        policy = policies.ClockSweepPolicy(size, ring_relations)
+    else:
+        policy = policies.POLICIES[config["policy"]](size)
+
+    result = policies.replay(_trace["key"], _trace["relfilenode"], [policy])
+    result["ring_blocks"] = config["ring_blocks"]
+    result["cpu_time"] = time.process_time() - start
+    return result
+
+def make_configs(sizes, names, ring_sizes, ring_relations):
+    """
+    組み合わせの一覧を作る。リングサイズは clock のときだけ変える
+    """
+    configs = []
+    for size, name in itertools.product(sizes, names):
+        for ring_blocks in (ring_sizes if name == "clock" and ring_relations else [0]):
+            configs.append({
+                "policy": name,
+                "cache_blocks": size,
+                "ring_blocks": ring_blocks,
+                "ring_relations": ring_relations,
+            })
+    return configs
+
+def sweep(path, configs, workers=None):
+    """
+    組み合わせを並列に実行し、結果を 1 つの DataFrame にまとめる
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as executor:
+        results = list(executor.map(_run_config, configs))
+    return pd.concat(results, ignore_index=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="キャッシュシミュレーションの組み合わせを並列に実行する")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--shared-buffers", action="append", default=[], help="キャッシュサイズ（複数指定可）")
+    parser.add_argument("--policy", action="append", choices=sorted(policies.POLICIES), default=[],
+                        help="ポリシー（省略時はすべて）")
+    parser.add_argument("--ring", action="append", default=[],
+                        help="clock でリングバッファを使うリレーション（relname または relfilenode）")
+    parser.add_argument("--ring-size", action="append", default=[], help="リングバッファのサイズ（複数指定可）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="../data/sweep.csv")
+    args = parser.parse_args()
+
+    sizes = [mrc.parse_size(size) // mrc.BLOCK_SIZE for size in (args.shared_buffers or ["128MB", "256MB"])]
+    names = args.policy or list(policies.POLICIES)
+    ring_sizes = [mrc.parse_size(size) // mrc.BLOCK_SIZE
+                  for size in (args.ring_size or [f"{clock_sweep.BULKREAD_RING_SIZE // 1024}kB"])]
+    ring_relations = clock_sweep.resolve_relations(args.ring, args.data_dir)
+
+    path = os.path.join(args.data_dir, TRACE_FILENAME)
+    build_trace(args.data_dir, path)
+    configs = make_configs(sizes, names, ring_sizes, ring_relations)
+    print(f"{len(configs)} configurations, {len(open_trace(path))} accesses, {args.workers} workers")
+
+    start = time.perf_counter()
+    result = sweep(path, configs, args.workers)
+    elapsed = time.perf_counter() - start
+    result.to_csv(args.output, index=False)
+
+    overall = result[result["relfilenode"] == 0]
+    print(overall.pivot_table(index=["policy", "ring_blocks"], columns="cache_blocks", values="hit_ratio"))
+    # 並列化の効率（各組み合わせの実行時間の合計 / 経過時間）
+    busy = overall["cpu_time"].sum()
+    print(f"elapsed {elapsed:.1f}s, cpu time {busy:.1f}s, speedup {busy / elapsed:.1f}x")
+
+if __name__ == '__main__':
+    main()
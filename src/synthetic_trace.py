@@ -0,0 +1,394 @@
+"""
+ベンチマーク用の合成ブロックアクセストレース
+
+- 生成器はいずれも約 n 件のアクセスを duration 秒に散らばらせ、時刻順の
+  BLOCK_LOG_DTYPE（Timestamp はブート後の ns）の構造化配列をチャンク毎に yield する
+  - zipf: 1 つのテーブルのブロックに Zipf 分布でアクセスする（ホットブロック）
+  - sequential: 1 つのテーブルを先頭から順に繰り返しスキャンする
+  - periodic: zipf を背景に、bench.py と同じく large_table1 を 15 分毎、large_table2 を毎時スキャンする
+- pgbench: pgbench の TPC-B 風のトランザクション（accounts / tellers / branches の主キー索引を
+  ルートから葉まで辿ってからヒープを読む, history への追記）と、large_table1 / large_table2 の
+  周期的なシーケンシャルスキャンのモデル。トレーサーと同じ項目（timestamp, pid, queryid,
+  relfilenode, blocknum, 任意で clock-sweep でのヒット有無）の TRACE_EVENT_DTYPE を yield する
+  トランザクション単位で (トランザクション数, 1 トランザクションのアクセス数) の配列をまとめて作るため、
+  数億件でも Python のループは時間窓の数だけで済む
+- write_data_txt で read_block 系の data.txt 形式、write_blockread で bpf_blockread.csv 形式、
+  write_trace で全項目の CSV、write_pg_class で pg_class.csv を書き出す（コマンドラインからも実行できる）
+- 乱数は seed で固定できる
+"""
+
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+import block_log
+import clock_sweep
+
+# 合成トレースのリレーション（relname: (relfilenode, ブロック数)）
+RELATIONS = {
+    "pgbench_accounts": (16397, 100_000),
+    "large_table1": (16410, 200_000),
+    "large_table2": (16420, 200_000),
+}
+
+DEFAULT_DURATION = 24 * 60 * 60
+
+# Timestamp の起点（ブート後の ns）
+START_NS = 10 ** 12
+
+# 周期的なスキャン（relname, 周期（秒））
+PERIODIC_SCANS = [("large_table1", 15 * 60), ("large_table2", 60 * 60)]
+
+def zipf_sampler(nblocks, s=1.1, seed=0):
+    """
+    [0, nblocks) のブロック番号を Zipf 分布（順位 k の確率が 1/k^s）で返す関数
+    順位とブロック番号の対応はランダムに入れ替える
+    """
+    rng = np.random.default_rng([seed, 1])
+    cdf = np.cumsum(1.0 / np.arange(1, nblocks + 1) ** s)
+    cdf /= cdf[-1]
+    rank_to_block = rng.permutation(nblocks)
+
+    def sample(rng, size):
+        return rank_to_block[np.searchsorted(cdf, rng.random(size))]
+    return sample
+
+def _windows(duration, n, chunk_lines):
+    """
+    duration 秒をチャンク数で割った時間窓 (開始, 終了) を返す
+    """
+    count = max(1, -(-n // chunk_lines))
+    edges = np.linspace(0, duration, count + 1)
+    return zip(edges[:-1], edges[1:])
+
+def _chunk(timestamp, relfilenode, blocknum, pid):
+    order = np.argsort(timestamp, kind="stable")
+    out = np.empty(len(timestamp), dtype=block_log.BLOCK_LOG_DTYPE)
+    out["Timestamp"] = START_NS + (timestamp[order] * 1e9).astype(np.int64)
+    out["PID"] = pid[order]
+    out["RelFileNode"] = relfilenode[order]
+    out["BlockNum"] = blocknum[order]
+    return out
+
+def _background(rng, sample, relfilenode, t0, t1, count):
+    """
+    [t0, t1) に一様に散らばる Zipf のアクセス count 件
+    """
+    timestamp = rng.uniform(t0, t1, count)
+    blocks = sample(rng, count)
+    return timestamp, np.full(count, relfilenode), blocks, rng.integers(1000, 1100, count)
+
+def zipf(n, seed=0, duration=DEFAULT_DURATION, chunk_lines=block_log.CHUNK_LINES, s=1.1):
+    rng = np.random.default_rng(seed)
+    relfilenode, nblocks = RELATIONS["pgbench_accounts"]
+    sample = zipf_sampler(nblocks, s, seed)
+    rate = n / duration
+    emitted = 0
+    for t0, t1 in _windows(duration, n, chunk_lines):
+        count = int(round(t1 * rate)) - emitted
+        emitted += count
+        yield _chunk(*_background(rng, sample, relfilenode, t0, t1, count))
+
+def sequential(n, seed=0, duration=DEFAULT_DURATION, chunk_lines=block_log.CHUNK_LINES):
+    rng = np.random.default_rng(seed)
+    relfilenode, nblocks = RELATIONS["large_table1"]
+    rate = n / duration
+    emitted = 0
+    for t0, t1 in _windows(duration, n, chunk_lines):
+        count = int(round(t1 * rate)) - emitted
+        position = np.arange(emitted, emitted + count)
+        emitted += count
+        timestamp = position / rate
+        yield _chunk(timestamp, np.full(count, relfilenode), position % nblocks,
+                     np.full(count, int(rng.integers(1000, 1100))))
+
+def periodic(n, seed=0, duration=DEFAULT_DURATION, chunk_lines=block_log.CHUNK_LINES,
+             scan_share=0.3, scan_rate=20_000, s=1.1):
+    """
+    アクセスの scan_share を周期的なスキャン（scan_rate ブロック/秒）に、残りを Zipf の背景に割り当てる
+    """
+    rng = np.random.default_rng(seed)
+    background_rel, background_blocks = RELATIONS["pgbench_accounts"]
+    sample = zipf_sampler(background_blocks, s, seed)
+
+    # スキャンの開始時刻・リレーション・長さ
+    scans = [(start, relname) for relname, period in PERIODIC_SCANS
+             for start in np.arange(0, duration, period)]
+    per_scan = int(n * scan_share / max(1, len(scans)))
+    scans = [(start, RELATIONS[relname][0], min(per_scan, RELATIONS[relname][1])) for start, relname in scans]
+    rate = (n - sum(length for _, _, length in scans)) / duration
+
+    emitted = 0
+    for t0, t1 in _windows(duration, n, chunk_lines):
+        count = int(round(t1 * rate)) - emitted
+        emitted += count
+        parts = [_background(rng, sample, background_rel, t0, t1, count)]
+        for start, relfilenode, length in scans:
+            # このスキャンのうち [t0, t1) に入るブロック
+            first = max(0, int(np.ceil((t0 - start) * scan_rate)))
+            last = min(length, int(np.ceil((t1 - start) * scan_rate)))
+            if first >= last:
+                continue
+            blocks = np.arange(first, last)
+            parts.append((start + blocks / scan_rate, np.full(len(blocks), relfilenode), blocks,
+                          np.full(len(blocks), 2000 + int(relfilenode % 100))))
+        yield _chunk(*(np.concatenate(columns) for columns in zip(*parts)))
+
+# トレーサーの出力と同じ項目（timestamp はブート後の ns）
+TRACE_EVENT_DTYPE = np.dtype([
+    ("timestamp", np.int64),
+    ("pid", np.int64),
+    ("queryid", np.int64),
+    ("relfilenode", np.int64),
+    ("blocknum", np.int64),
+    ("hit", np.bool_),
+])
+
+# pgbench のリレーション（索引を含む）の relfilenode
+PGBENCH_RELFILENODES = {
+    "pgbench_accounts": 16397,
+    "pgbench_branches": 16398,
+    "pgbench_history": 16399,
+    "pgbench_tellers": 16400,
+    "pgbench_accounts_pkey": 16401,
+    "pgbench_branches_pkey": 16402,
+    "pgbench_tellers_pkey": 16403,
+}
+
+# 1 ページあたりの行数（fillfactor 100, 既定の filler 列の長さでの概算）
+PGBENCH_ROWS_PER_PAGE = 61
+HISTORY_ROWS_PER_PAGE = 100
+# B-tree の葉 1 ページあたりのキー数（int4, fillfactor 90）と内部ページの分岐数
+BTREE_LEAF_KEYS = 367
+BTREE_FANOUT = 286
+
+# pgbench の既定のスクリプト（tpcb-like）の文
+PGBENCH_STATEMENTS = {
+    "update_accounts": "UPDATE pgbench_accounts SET abalance = abalance + $1 WHERE aid = $2",
+    "select_accounts": "SELECT abalance FROM pgbench_accounts WHERE aid = $1",
+    "update_tellers": "UPDATE pgbench_tellers SET tbalance = tbalance + $1 WHERE tid = $2",
+    "update_branches": "UPDATE pgbench_branches SET bbalance = bbalance + $1 WHERE bid = $2",
+    "insert_history": "INSERT INTO pgbench_history (tid, bid, aid, delta, mtime) VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)",
+    "scan": "SELECT * FROM {table}",
+}
+
+def statement_queryid(statement):
+    """
+    文から決まる int64 の queryid（pg_stat_statements の値とは異なる）
+    """
+    return int.from_bytes(hashlib.blake2b(statement.encode(), digest_size=8).digest(), "little", signed=True)
+
+class BTree:
+    """
+    主キー索引のページ配置のモデル（0 がメタページ, 葉, 内部ページ, ルートの順）
+    """
+
+    def __init__(self, nkeys):
+        self.levels = []     # 葉から順に (先頭ブロック, ページ数)
+        pages = -(-nkeys // BTREE_LEAF_KEYS)
+        start = 1
+        while True:
+            self.levels.append((start, pages))
+            start += pages
+            if pages == 1:
+                break
+            pages = -(-pages // BTREE_FANOUT)
+        self.nblocks = start
+
+    def lookup(self, keys):
+        """
+        キー（1 始まり）毎にルートから葉まで辿るブロック番号を (キー数, 段数) で返す
+        """
+        page = (np.asarray(keys, dtype=np.int64) - 1) // BTREE_LEAF_KEYS
+        path = []
+        for start, _ in self.levels:
+            path.append(start + page)
+            page = page // BTREE_FANOUT
+        return np.stack(path[::-1], axis=1)
+
+def pgbench(n, seed=0, duration=DEFAULT_DURATION, chunk_lines=block_log.CHUNK_LINES, scale=100,
+            clients=100, aid_skew=None, scan_share=0.3, scan_rate=20_000, with_hit=False, cache_blocks=16384):
+    """
+    pgbench（tpcb-like）と周期的なスキャンのトレースを TRACE_EVENT_DTYPE のチャンクで yield する
+    aid_skew を指定すると aid を Zipf 分布（指数 aid_skew）で選ぶ（省略時は pgbench と同じ一様分布）
+    with_hit を指定すると cache_blocks の clock-sweep で再生したヒット有無を付ける（Python のループになる）
+    """
+    rng = np.random.default_rng(seed)
+    naccounts, ntellers, nbranches = 100_000 * scale, 10 * scale, scale
+    accounts_pkey, tellers_pkey, branches_pkey = BTree(naccounts), BTree(ntellers), BTree(nbranches)
+    rel = PGBENCH_RELFILENODES
+    aid_sampler = zipf_sampler(naccounts, aid_skew, seed) if aid_skew else None
+
+    # 1 トランザクションのアクセス（文, リレーション）の並び。索引はルートから葉まで
+    depth_a, depth_t, depth_b = (len(tree.levels) for tree in (accounts_pkey, tellers_pkey, branches_pkey))
+    layout = ([("update_accounts", rel["pgbench_accounts_pkey"])] * depth_a
+              + [("update_accounts", rel["pgbench_accounts"])]
+              + [("select_accounts", rel["pgbench_accounts_pkey"])] * depth_a
+              + [("select_accounts", rel["pgbench_accounts"])]
+              + [("update_tellers", rel["pgbench_tellers_pkey"])] * depth_t
+              + [("update_tellers", rel["pgbench_tellers"])]
+              + [("update_branches", rel["pgbench_branches_pkey"])] * depth_b
+              + [("update_branches", rel["pgbench_branches"])]
+              + [("insert_history", rel["pgbench_history"])])
+    per_txn = len(layout)
+    txn_queryid = np.array([statement_queryid(PGBENCH_STATEMENTS[name]) for name, _ in layout])
+    txn_rel = np.array([relfilenode for _, relfilenode in layout])
+
+    # 周期的なスキャン（開始時刻, relfilenode, 長さ, queryid）
+    scans = [(start, relname) for relname, period in PERIODIC_SCANS for start in np.arange(0, duration, period)]
+    per_scan = int(n * scan_share / max(1, len(scans)))
+    scans = [(start, RELATIONS[relname][0], min(per_scan, RELATIONS[relname][1]),
+              statement_queryid(PGBENCH_STATEMENTS["scan"].format(table=relname)))
+             for start, relname in scans]
+    tps = (n - sum(scan[2] for scan in scans)) / per_txn / duration
+
+    sim = clock_sweep.ClockSweep(cache_blocks) if with_hit else None
+    history_rows = 0
+    emitted = 0
+    for t0, t1 in _windows(duration, n, chunk_lines):
+        count = int(round(t1 * tps)) - emitted
+        emitted += count
+
+        # トランザクション毎の開始時刻・クライアント・キー
+        start = np.sort(rng.uniform(t0, t1, count))
+        pid = 1000 + rng.integers(0, clients, count)
+        aid = aid_sampler(rng, count) + 1 if aid_sampler else rng.integers(1, naccounts + 1, count)
+        tid = rng.integers(1, ntellers + 1, count)
+        bid = rng.integers(1, nbranches + 1, count)
+        history = (history_rows + np.arange(count)) // HISTORY_ROWS_PER_PAGE
+        history_rows += count
+
+        accounts_path = accounts_pkey.lookup(aid)
+        accounts_heap = ((aid - 1) // PGBENCH_ROWS_PER_PAGE)[:, None]
+        blocks = np.hstack([
+            accounts_path, accounts_heap,
+            accounts_path, accounts_heap,
+            tellers_pkey.lookup(tid), ((tid - 1) // PGBENCH_ROWS_PER_PAGE)[:, None],
+            branches_pkey.lookup(bid), ((bid - 1) // PGBENCH_ROWS_PER_PAGE)[:, None],
+            history[:, None],
+        ])
+        # トランザクション内のアクセスは 10us 間隔とする
+        timestamp = start[:, None] + np.arange(per_txn) * 1e-5
+        parts = [(timestamp.ravel(), np.repeat(pid, per_txn), np.tile(txn_queryid, count),
+                  np.tile(txn_rel, count), blocks.ravel())]
+
+        for scan_start, relfilenode, length, queryid in scans:
+            first = max(0, int(np.ceil((t0 - scan_start) * scan_rate)))
+            last = min(length, int(np.ceil((t1 - scan_start) * scan_rate)))
+            if first >= last:
+                continue
+            scan_blocks = np.arange(first, last)
+            parts.append((scan_start + scan_blocks / scan_rate, np.full(len(scan_blocks), 2000 + relfilenode % 100),
+                          np.full(len(scan_blocks), queryid), np.full(len(scan_blocks), relfilenode), scan_blocks))
+
+        timestamp, pid, queryid, relfilenode, blocknum = (np.concatenate(columns) for columns in zip(*parts))
+        order = np.argsort(timestamp, kind="stable")
+        out = np.zeros(len(order), dtype=TRACE_EVENT_DTYPE)
+        out["timestamp"] = START_NS + (timestamp[order] * 1e9).astype(np.int64)
+        out["pid"] = pid[order]
+        out["queryid"] = queryid[order]
+        out["relfilenode"] = relfilenode[order]
+        out["blocknum"] = blocknum[order]
+        if sim is not None:
+            keys = block_log.encode_block_key(out["relfilenode"], out["blocknum"])
+            out["hit"], _ = sim.replay(keys, out["relfilenode"])
+        yield out
+
+GENERATORS = {
+    "zipf": zipf,
+    "sequential": sequential,
+    "periodic": periodic,
+    "pgbench": pgbench,
+}
+
+def to_block_log(chunk):
+    """
+    TRACE_EVENT_DTYPE のチャンクを BLOCK_LOG_DTYPE に変換する（BLOCK_LOG_DTYPE ならそのまま）
+    """
+    if chunk.dtype == block_log.BLOCK_LOG_DTYPE:
+        return chunk
+    out = np.empty(len(chunk), dtype=block_log.BLOCK_LOG_DTYPE)
+    out["Timestamp"] = chunk["timestamp"]
+    out["PID"] = chunk["pid"]
+    out["RelFileNode"] = chunk["relfilenode"]
+    out["BlockNum"] = chunk["blocknum"]
+    return out
+
+def write_trace(path, chunks, with_hit=False):
+    """
+    TRACE_EVENT_DTYPE のチャンクを CSV（timestamp, pid, queryid, relfilenode, blocknum[, hit]）で書き出す
+    """
+    columns = list(TRACE_EVENT_DTYPE.names) if with_hit else list(TRACE_EVENT_DTYPE.names)[:-1]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(columns) + "\n")
+        for chunk in chunks:
+            df = pd.DataFrame({name: chunk[name] for name in columns})
+            if with_hit:
+                df["hit"] = df["hit"].astype(np.int8)
+            df.to_csv(f, header=False, index=False)
+
+def write_blockread(path, chunks):
+    """
+    bpf_blockread.csv 形式（timestamp, relfilenode, blocknum）で書き出す
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(block_log.BLOCKREAD_DTYPE.names) + "\n")
+        for chunk in chunks:
+            chunk = to_block_log(chunk)
+            pd.DataFrame({"timestamp": chunk["Timestamp"], "relfilenode": chunk["RelFileNode"],
+                          "blocknum": chunk["BlockNum"]}).to_csv(f, header=False, index=False)
+
+def write_data_txt(path, chunks):
+    """
+    チャンクを data.txt 形式（Timestamp: <ns> PID: <pid> RelFileNode: <relfilenode> BlockNum: <block>）で書き出す
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            chunk = to_block_log(chunk)
+            df = pd.DataFrame({
+                "ts_label": "Timestamp:", "Timestamp": chunk["Timestamp"],
+                "pid_label": "PID:", "PID": chunk["PID"],
+                "rel_label": "RelFileNode:", "RelFileNode": chunk["RelFileNode"],
+                "block_label": "BlockNum:", "BlockNum": chunk["BlockNum"],
+            })
+            df.to_csv(f, sep=" ", header=False, index=False)
+
+def write_pg_class(path):
+    mapping = {relname: relfilenode for relname, (relfilenode, _) in RELATIONS.items()}
+    mapping.update(PGBENCH_RELFILENODES)
+    pd.DataFrame([{"relname": relname, "relfilenode": relfilenode}
+                  for relname, relfilenode in mapping.items()]).to_csv(path, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="合成ブロックアクセストレースを書き出す")
+    parser.add_argument("--generator", choices=sorted(GENERATORS), default="pgbench")
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=int, default=DEFAULT_DURATION, help="トレースの秒数")
+    parser.add_argument("--scale", type=int, default=100, help="pgbench のスケールファクタ")
+    parser.add_argument("--aid-skew", type=float, default=None, help="aid を Zipf 分布で選ぶときの指数")
+    parser.add_argument("--with-hit", action="store_true", help="clock-sweep でのヒット有無を付ける")
+    parser.add_argument("--format", choices=["trace", "blockread", "data"], default="trace")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--data-dir", default="../data")
+    args = parser.parse_args()
+
+    kwargs = {"seed": args.seed, "duration": args.duration}
+    if args.generator == "pgbench":
+        kwargs.update(scale=args.scale, aid_skew=args.aid_skew, with_hit=args.with_hit)
+    chunks = GENERATORS[args.generator](args.events, **kwargs)
+    if args.format == "trace":
+        if args.generator != "pgbench":
+            parser.error("--format trace requires --generator pgbench")
+        write_trace(args.output or os.path.join(args.data_dir, "synthetic_trace.csv"), chunks, args.with_hit)
+    elif args.format == "blockread":
+        write_blockread(args.output or os.path.join(args.data_dir, "bpf_blockread.csv"), chunks)
+    else:
+        write_data_txt(args.output or os.path.join(args.data_dir, "data.txt"), chunks)
+    write_pg_class(os.path.join(args.data_dir, "pg_class.csv"))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+read_block.py のユーザー空間側（イベントの変換と書き出し）が 1 秒あたり何イベント処理できるかを計測する
+
+- 合成した Event 構造体のバイト列を、bcc と同じく (cpu, アドレス, サイズ) で EventWriter.handle_event に渡す
+  （カーネルのプローブを使わないので root 権限は不要）
+- 出力形式（csv / binary）× 書き出し（イベント毎に flush / バッファリング）× 投入レートの組み合わせ毎に、
+  実際に処理できたイベント数/秒, コールバックのレイテンシ（p50, p99）, 1 イベントあたりの出力バイト数を求める
+- 結果は JSON に保存し、--baseline で以前の結果と比較できる
+"""
+
+import argparse
+import ctypes
+import itertools
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import read_block
+
+QUERIES = [
+    b"UPDATE pgbench_accounts SET abalance = abalance + -1234 WHERE aid = 5678901;",
+    b"SELECT abalance FROM pgbench_accounts WHERE aid = 5678901;",
+    b"UPDATE pgbench_tellers SET tbalance = tbalance + -1234 WHERE tid = 321;",
+    b"UPDATE pgbench_branches SET bbalance = bbalance + -1234 WHERE bid = 12;",
+    b"INSERT INTO pgbench_history (tid, bid, aid, delta, mtime) VALUES (321, 12, 5678901, -1234, CURRENT_TIMESTAMP);",
+    b"SELECT * FROM large_table1",
+]
+
+def make_events(n, seed=0):
+    """
+    合成した Event を n 個作り、ctypes のバッファのリストで返す
+    """
+    rng = np.random.default_rng(seed)
+    buffers = []
+    start_ns = time.monotonic_ns()
+    for k in range(n):
+        event = read_block.Event()
+        event.pid = int(rng.integers(1000, 1100))
+        event.query = QUERIES[int(rng.integers(len(QUERIES)))]
+        event.query_id = int(rng.integers(-2**62, 2**62))
+        event.num_rel = int(rng.integers(1, 4))
+        for i in range(event.num_rel):
+            low = int(rng.integers(0, 800000))
+            event.rel_info[i].relfilenode = int(rng.integers(16384, 16400))
+            event.rel_info[i].min_block = low
+            event.rel_info[i].max_block = low + int(rng.integers(0, 16))
+        event.start_ns = start_ns + k * 1000
+        buffers.append(ctypes.create_string_buffer(bytes(event), ctypes.sizeof(event)))
+    return buffers
+
+def run_case(buffers, fmt, flush_each, rate, workdir):
+    """
+    イベントを rate 個/秒（None なら待たずに）コールバックに渡し、計測結果を返す
+    """
+    ext = "csv" if fmt == "csv" else "bin"
+    block_path = os.path.join(workdir, f"block.{ext}")
+    query_path = os.path.join(workdir, f"query.{ext}")
+    writer = read_block.EventWriter(block_path, query_path, fmt, flush_each)
+    handle_event = writer.handle_event
+
+    latencies = np.empty(len(buffers))
+    interval = 1.0 / rate if rate else 0.0
+    start = time.perf_counter()
+    for k, buf in enumerate(buffers):
+        if interval:
+            # 投入時刻まで待つ（処理が遅れているときは待たずに次を渡す）
+            due = start + k * interval
+            while time.perf_counter() < due:
+                pass
+        t0 = time.perf_counter()
+        handle_event(0, ctypes.addressof(buf), len(buf))
+        latencies[k] = time.perf_counter() - t0
+    writer.close()
+    elapsed = time.perf_counter() - start
+
+    # ヘッダー行の分を除く
+    header_bytes = 0
+    if fmt == "csv":
+        with open(block_path, "rb") as f:
+            header_bytes += len(f.readline())
+        with open(query_path, "rb") as f:
+            header_bytes += len(f.readline())
+    written = os.path.getsize(block_path) + os.path.getsize(query_path) - header_bytes
+    return {
+        "format": fmt,
+        "writer": "flush" if flush_each else "buffered",
+        "target_rate": rate,
+        "events": len(buffers),
+        "events_per_sec": len(buffers) / elapsed,
+        "p50_latency_us": float(np.percentile(latencies, 50) * 1e6),
+        "p99_latency_us": float(np.percentile(latencies, 99) * 1e6),
+        "bytes_per_event": written / len(buffers),
+    }
+
+def compare(results, baseline):
+    """
+    同じ組み合わせの以前の結果に対する events_per_sec と p99 の比
+    """
+    key = lambda r: (r["format"], r["writer"], r["target_rate"])
+    previous = {key(r): r for r in baseline["results"]}
+    for r in results:
+        old = previous.get(key(r))
+        if old is None:
+            continue
+        print(f"{r['format']:6} {r['writer']:8} rate={r['target_rate']}: "
+              f"events/s {r['events_per_sec'] / old['events_per_sec']:.2f}x, "
+              f"p99 {r['p99_latency_us'] / old['p99_latency_us']:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="read_block.py のイベント処理の性能を計測する")
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--rate", type=int, action="append", default=[],
+                        help="1 秒あたりの投入イベント数（複数指定可, 省略時は待たずに投入）")
+    parser.add_argument("--format", action="append", choices=["csv", "binary"], default=[])
+    parser.add_argument("--writer", action="append", choices=["flush", "buffered"], default=[])
+    parser.add_argument("--baseline", default=None, help="比較する以前の結果の JSON")
+    parser.add_argument("--output", default="../data/tracer_bench.json")
+    args = parser.parse_args()
+
+    buffers = make_events(args.events)
+    rates = args.rate or [None]
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for fmt, writer, rate in itertools.product(args.format or ["csv", "binary"],
+                                                   args.writer or ["flush", "buffered"], rates):
+            result = run_case(buffers, fmt, writer == "flush", rate, workdir)
+            results.append(result)
+            print(f"{fmt:6} {writer:8} rate={rate}: {result['events_per_sec']:,.0f} events/s, "
+                  f"p99 {result['p99_latency_us']:.1f} us, {result['bytes_per_event']:.1f} bytes/event")
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "event_size": ctypes.sizeof(read_block.Event),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
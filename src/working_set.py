@@ -0,0 +1,298 @@
+"""
+リレーション毎のワーキングセット（1, 5, 15 分のスライディングウィンドウでアクセスされた異なるブロックの数）を求める
+
+- 1 分毎のバケットにアクセスされたブロックの集合（blockset.BlockSet: relfilenode 毎の圧縮ビットマップ）を持ち、
+  直近 W 個のバケットの和集合の要素数を W 分のワーキングセットとする（厳密な値）
+- 全リレーションを合わせたワーキングセットは HyperLogLog（バケット毎のレジスタの最大値で和集合）で推定する
+- バケットが閉じる毎に 1 行（timestamp, relfilenode, ws_1min, ws_5min, ws_15min）を出力する
+  timestamp はバケットの終了時刻、relfilenode = 0 の行は全リレーションの HyperLogLog の推定値
+- read_block.py の --working-set でトレース中に（live）, このスクリプトで保存済みのトレースから（offline）求める
+  - offline の入力: bpf_read_block.csv / .bin（ブロック範囲）, bpf_blockread.csv, data.txt（1 アクセス 1 行）
+  - bpf_blockread.csv と data.txt の時刻はブート後の ns のため、記録時のブート時刻（--boot-time,
+    省略時は run ディレクトリの manifest.json の boot_time）で日時に変換する。解析時のブート時刻は使わない
+- 時刻はおおむね昇順に来るものとし、閉じたバケットより前の時刻のアクセスは現在のバケットに数える
+"""
+
+import argparse
+import json
+import os
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import block_log
+import blockset
+
+# スライディングウィンドウの長さ（バケット数）
+WINDOWS = [1, 5, 15]
+BUCKET_SECONDS = 60
+
+# HyperLogLog のレジスタ数は 2^HLL_PRECISION（標準誤差は約 1.04 / sqrt(2^14) = 0.8%）
+HLL_PRECISION = 14
+
+# add_range の範囲をこの数だけ溜めてから BlockSet と HyperLogLog にまとめて加える（1 範囲毎の NumPy の呼び出しを避ける）
+BATCH_RANGES = 4096
+
+EPOCH = datetime(1970, 1, 1)
+
+def naive_seconds(dt):
+    """
+    タイムゾーンなしの日時を、同じ表記の UTC とみなした Unix 秒に変換する（出力で元の表記に戻すため）
+    """
+    return (dt - EPOCH).total_seconds()
+
+def _hash64(keys):
+    """
+    splitmix64 の最終段（uint64 の配列を一様に散らす）
+    """
+    x = np.asarray(keys, dtype=np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+class HyperLogLog:
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, keys):
+        if len(keys) == 0:
+            return
+        h = _hash64(keys)
+        index = (h >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = h << np.uint64(self.precision)
+        # rest の先頭の 0 の数 + 1（rest = 0 なら 64 - precision + 1）
+        bit_length = np.floor(np.log2(np.maximum(rest, np.uint64(1)).astype(np.float64))).astype(np.int64) + 1
+        rank = np.where(rest == 0, 64 - self.precision + 1, 64 - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    @staticmethod
+    def union_count(sketches):
+        sketches = list(sketches)
+        if not sketches:
+            return 0
+        registers = np.maximum.reduce([s.registers for s in sketches])
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -registers.astype(np.float64))
+        zeros = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # 小さい値は linear counting で補正する
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+class WorkingSetTracker:
+    """
+    アクセスをバケット毎に記録し、バケットが閉じる毎にウィンドウ毎のワーキングセットを出力する
+    output を指定するとその CSV に追記し（live 用）、keep_rows なら rows にも残す（offline 用）
+    """
+
+    def __init__(self, windows=WINDOWS, bucket_seconds=BUCKET_SECONDS, output=None, keep_rows=True):
+        self.windows = sorted(windows)
+        self.bucket_seconds = bucket_seconds
+        self.keep_rows = keep_rows
+        self.rows = []
+        # 最後に閉じたバケットの行（relfilenode → {列名: 値}）。dashboard.py が別スレッドから参照する
+        self.latest = {}
+        # (バケット番号, BlockSet, HyperLogLog)
+        self.buckets = deque(maxlen=self.windows[-1])
+        self.pending = []    # 未反映の現在のバケットの範囲 (relfilenode, low, high)
+        self.current = None
+        self.columns = ["timestamp", "relfilenode"] + [f"ws_{w * bucket_seconds // 60}min" for w in self.windows]
+        self.output = None
+        if output is not None:
+            self.output = open(output, "w", encoding="utf-8")
+            self.output.write(",".join(self.columns) + "\n")
+            self.output.flush()
+
+    def _bucket(self, seconds):
+        bucket = int(seconds // self.bucket_seconds)
+        if self.current is None:
+            self._open(bucket)
+        elif bucket > self.current[0]:
+            # 間の空のバケットも閉じる（ウィンドウから外れるまで）
+            for closing in range(self.current[0], min(bucket, self.current[0] + self.windows[-1])):
+                self._close(closing)
+                self._open(closing + 1)
+            if self.current[0] != bucket:
+                self._open(bucket)
+        return self.current
+
+    def _flush_pending(self):
+        if not self.pending:
+            return
+        relfilenode, low, high = (np.array(column, dtype=np.int64) for column in zip(*self.pending))
+        self.current[1].add_ranges(relfilenode, low, high)
+        rows, blocks = block_log.expand_block_ranges(low, high)
+        self.current[2].add(block_log.encode_block_key(relfilenode[rows], blocks))
+        self.pending = []
+
+    def _open(self, bucket):
+        self._flush_pending()
+        self.current = (bucket, blockset.BlockSet(), HyperLogLog())
+        self.buckets.append(self.current)
+
+    def _close(self, bucket):
+        self._flush_pending()
+        recent = [b for b in self.buckets if b[0] <= bucket]
+        timestamp = pd.Timestamp((bucket + 1) * self.bucket_seconds, unit="s")
+        counts = [blockset.BlockSet.union_all(blocks for b, blocks, _ in recent if b > bucket - w).counts()
+                  for w in self.windows]
+        rows = [[timestamp, rel] + [c.get(rel, 0) for c in counts] for rel in sorted(counts[-1])]
+        rows.append([timestamp, 0] + [
+            HyperLogLog.union_count(hll for b, _, hll in recent if b > bucket - w) for w in self.windows])
+        self.latest = {row[1]: dict(zip(self.columns, row)) for row in rows}
+        if self.keep_rows:
+            self.rows += rows
+        if self.output is not None:
+            for row in rows:
+                self.output.write(",".join(str(v) for v in row) + "\n")
+            self.output.flush()
+
+    def add(self, seconds, relfilenode, blocks):
+        """
+        1 つのリレーションのブロック番号の配列を記録する
+        """
+        _, blocks_seen, hll = self._bucket(seconds)
+        blocks = np.asarray(blocks, dtype=np.int64)
+        blocks_seen.add(relfilenode, blocks)
+        hll.add(block_log.encode_block_key(relfilenode, blocks))
+
+    def add_range(self, seconds, relfilenode, low, high):
+        """
+        1 つのリレーションのブロック範囲 [low, high] を記録する
+        """
+        self._bucket(seconds)
+        self.pending.append((relfilenode, low, high))
+        if len(self.pending) >= BATCH_RANGES:
+            self._flush_pending()
+
+    def add_event(self, event, seconds=None):
+        """
+        read_block.py の Event（クエリ毎のブロック範囲）を記録する
+        seconds を省略すると現在時刻（bpf_read_block.csv の timestamp と同じ）
+        """
+        if seconds is None:
+            seconds = naive_seconds(datetime.now())
+        for i in range(event.num_rel):
+            rel = event.rel_info[i]
+            self.add_range(seconds, rel.relfilenode, rel.min_block, rel.max_block)
+
+    def close(self):
+        if self.current is not None:
+            self._close(self.current[0])
+            self.current = None
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+    def to_frame(self):
+        return pd.DataFrame(self.rows, columns=self.columns)
+
+def from_read_block(path, tracker):
+    """
+    bpf_read_block.csv（.bin も可）のブロック範囲を記録する
+    """
+    for chunk in block_log.iter_read_block_any(path):
+        seconds = chunk["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9
+        for t, rel, low, high in zip(seconds, chunk["relfilenode"].to_numpy(),
+                                     chunk["min_block"].to_numpy(), chunk["max_block"].to_numpy()):
+            tracker.add_range(t, int(rel), int(low), int(high))
+
+def _add_sorted_accesses(tracker, seconds, relfilenode, blocknum):
+    """
+    時刻順の 1 アクセス 1 行の配列を、バケット・リレーション毎にまとめて記録する
+    """
+    bucket = (seconds // tracker.bucket_seconds).astype(np.int64)
+    # バケットの境界で区切り、各区間内はリレーション毎にまとめる
+    bounds = np.flatnonzero(np.diff(bucket)) + 1
+    for part in np.split(np.arange(len(bucket)), bounds):
+        if len(part) == 0:
+            continue
+        rels = relfilenode[part]
+        for rel in np.unique(rels):
+            tracker.add(seconds[part[0]], int(rel), blocknum[part][rels == rel])
+
+def boot_seconds(boot_time):
+    """
+    ブート時刻（Unix 時刻）を naive_seconds と同じローカル時刻の秒にする
+    """
+    return naive_seconds(datetime.fromtimestamp(boot_time))
+
+def parse_boot_time(value):
+    """
+    --boot-time（Unix 時刻か "2025-01-01 09:00:00" のようなローカル時刻）を Unix 時刻にする
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def boot_time_from_manifest(data_dir):
+    """
+    orchestrator.py の run ディレクトリ（data_dir の親）の manifest.json に記録したブート時刻。なければ None
+    """
+    path = os.path.join(data_dir, os.pardir, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("boot_time")
+
+def from_blockread(paths, tracker, boot_time):
+    """
+    bpf_blockread.csv（timestamp はブート後の ns）を記録する
+    boot_time は記録したときのブート時刻（Unix 時刻）
+    """
+    base = boot_seconds(boot_time)
+    for chunk in block_log.iter_blockread(paths):
+        _add_sorted_accesses(tracker, base + chunk["timestamp"] / 1e9, chunk["relfilenode"], chunk["blocknum"])
+
+def from_data_txt(path, tracker, boot_time):
+    """
+    data.txt（Timestamp はブート後の ns）を記録する
+    boot_time は記録したときのブート時刻（Unix 時刻）
+    """
+    base = boot_seconds(boot_time)
+    for chunk in block_log.iter_block_log(path):
+        _add_sorted_accesses(tracker, base + chunk["Timestamp"] / 1e9, chunk["RelFileNode"], chunk["BlockNum"])
+
+def main():
+    parser = argparse.ArgumentParser(description="リレーション毎のワーキングセットを 1, 5, 15 分のウィンドウで求める")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--source", choices=["read_block", "blockread", "data"], default="read_block",
+                        help="read_block: bpf_read_block.csv（なければ .bin）, blockread: bpf_blockread.csv, data: data.txt")
+    parser.add_argument("--boot-time", type=parse_boot_time, default=None,
+                        help="blockread / data を記録したときのブート時刻（Unix 時刻かローカル時刻。"
+                             "省略時は ../manifest.json の boot_time）")
+    parser.add_argument("--output", default="../data/working_set.csv")
+    args = parser.parse_args()
+
+    boot_time = args.boot_time
+    if args.source != "read_block" and boot_time is None:
+        boot_time = boot_time_from_manifest(args.data_dir)
+        if boot_time is None:
+            parser.error("--boot-time is required for --source blockread/data (no boot_time in manifest.json)")
+
+    tracker = WorkingSetTracker()
+    if args.source == "read_block":
+        from_read_block(block_log.trace_path(args.data_dir, "bpf_read_block"), tracker)
+    elif args.source == "blockread":
+        from_blockread(block_log.blockread_segments(args.data_dir), tracker, boot_time)
+    else:
+        from_data_txt(os.path.join(args.data_dir, "data.txt"), tracker, boot_time)
+    tracker.close()
+
+    result = tracker.to_frame()
+    mapping_csv = os.path.join(args.data_dir, "pg_class.csv")
+    if os.path.exists(mapping_csv) and not result.empty:
+        mapping_dict = pd.read_csv(mapping_csv).set_index("relfilenode")["relname"].to_dict()
+        mapping_dict[0] = "(all)"
+        result.insert(2, "relname", result["relfilenode"].map(mapping_dict))
+    result.to_csv(args.output, index=False)
+    if not result.empty:
+        print(result.groupby("relfilenode")[tracker.columns[2:]].max())
+
+if __name__ == '__main__':
+    main()
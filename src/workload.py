@@ -0,0 +1,89 @@
+"""
+永続的な接続のプールでワークロードの SQL を実行するドライバー
+
+- psql をサブプロセスで起動すると、実行の度にプロセスとバックエンドの接続が作られ、
+  計測しているバッファの統計に接続処理のアクセスが混ざるため、接続を使い回す
+- ThreadedConnectionPool を使い、複数のスレッド（セッション）から並行に実行できる
+- EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) の結果を JSON Lines で記録する
+"""
+
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from psycopg2.pool import ThreadedConnectionPool
+
+# データベース接続パラメータ（get_stats.py と同じ）
+CONN_PARAMS = {
+    'host': 'localhost',
+    'port': 5432,
+    'dbname': 'postgres',
+    'user': 'seinoyu',
+    'password': 'seinoyu'
+}
+
+EXPLAIN_LOG = "../log/explain.jsonl"
+
+class Driver:
+    """
+    接続プールを持ち、SQL の実行と EXPLAIN の記録を行う
+    """
+
+    def __init__(self, maxconn=4, explain_log=EXPLAIN_LOG, **conn_params):
+        self.pool = ThreadedConnectionPool(1, maxconn, **{**CONN_PARAMS, **conn_params})
+        self.explain_log = explain_log
+        self.log_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """
+        プールから接続を借りる（autocommit）
+        """
+        conn = self.pool.getconn()
+        try:
+            conn.autocommit = True
+            yield conn
+        finally:
+            self.pool.putconn(conn)
+
+    def execute(self, sql, params=None):
+        """
+        SQL を実行し、結果の行（結果がなければ None）を返す
+        """
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall() if cur.description else None
+        logging.info("%s (%s)", sql.strip().splitlines()[0], cur.statusmessage)
+        return rows
+
+    def explain(self, sql, params=None):
+        """
+        EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) で実行し、要約を JSON Lines に追記して返す
+        """
+        start = time.perf_counter()
+        rows = self.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+        elapsed = time.perf_counter() - start
+        # json 型の列は psycopg2 が Python のオブジェクトに変換する
+        result = rows[0][0][0]
+        plan = result["Plan"]
+        record = {
+            "timestamp": datetime.now().isoformat(),
+            "statement": sql,
+            "elapsed": elapsed,
+            "planning_time": result.get("Planning Time"),
+            "execution_time": result.get("Execution Time"),
+            "shared_hit_blocks": plan.get("Shared Hit Blocks"),
+            "shared_read_blocks": plan.get("Shared Read Blocks"),
+            "plan": result,
+        }
+        with self.log_lock, open(self.explain_log, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        logging.info("%s: %.1f ms, shared hit %s, read %s", sql, record["execution_time"],
+                     record["shared_hit_blocks"], record["shared_read_blocks"])
+        return record
+
+    def close(self):
+        self.pool.closeall()